@@ -1,7 +1,14 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import Profile
+from django.http import HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from .models import Profile, EmailOutbox
+from .services.staff_import import credentials_csv, import_staff, read_staff_file, validate_staff_rows
 
 
 class ProfileInline(admin.StackedInline):
@@ -15,6 +22,57 @@ class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff')
     list_filter = ('is_staff', 'is_superuser', 'is_active')
     search_fields = ('username', 'email', 'first_name', 'last_name')
+    change_list_template = 'admin/auth/user/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import-staff/', self.admin_site.admin_view(self.import_staff_view), name='auth_user_import_staff'),
+        ] + super().get_urls()
+
+    def import_staff_view(self, request):
+        """
+        Загрузка списка сотрудников (CSV/XLSX). Если в файле есть ошибки,
+        никто не создается; иначе в ответ отдается CSV с логинами и паролями.
+        Импорт идет внутри запроса, поэтому размер файла ограничен
+        STAFF_IMPORT_ADMIN_MAX_ROWS, а пароли хэшируются в текущем процессе
+        без пула; большие выгрузки загружаются командой import_staff.
+        """
+        if not self.has_add_permission(request):
+            return HttpResponse(status=403)
+
+        errors = []
+        upload = request.FILES.get('staff_file') if request.method == 'POST' else None
+        if upload:
+            try:
+                rows = read_staff_file(upload, upload.name)
+            except Exception as e:
+                errors = [(None, f'Не удалось прочитать файл: {e}')]
+            else:
+                max_rows = settings.STAFF_IMPORT_ADMIN_MAX_ROWS
+                if len(rows) > max_rows:
+                    errors = [(None, (
+                        f'В файле {len(rows)} строк, через админку можно загрузить не больше {max_rows}. '
+                        f'Большие списки загружаются командой python manage.py import_staff'
+                    ))]
+                else:
+                    valid, errors = validate_staff_rows(rows)
+                    if not errors and valid:
+                        credentials = import_staff(valid, workers=1)
+                        response = HttpResponse(credentials_csv(credentials), content_type='text/csv; charset=utf-8')
+                        response['Content-Disposition'] = content_disposition_header(
+                            True, f'staff_credentials_{timezone.localdate():%Y%m%d}.csv'
+                        )
+                        return response
+                    if not valid and not errors:
+                        errors = [(None, 'В файле нет сотрудников')]
+
+        return TemplateResponse(request, 'admin/auth/user/import_staff.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Импорт сотрудников',
+            'errors': errors,
+            'max_rows': settings.STAFF_IMPORT_ADMIN_MAX_ROWS,
+        })
 
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
@@ -25,4 +83,11 @@ class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'role', 'position', 'department', 'branch', 'registration_date')
     list_filter = ('role', 'department')
     search_fields = ('user__username', 'user__email', 'position')
-    raw_id_fields = ('user',)
\ No newline at end of file
+    raw_id_fields = ('user',)
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'payload', 'created_at', 'sent_at', 'attempts')
+    list_filter = ('sent_at',)
+    readonly_fields = ('created_at',)
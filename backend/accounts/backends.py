@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from cyber_edu.versioning import new_version
+
+VERSION_KEY = 'auth_user_version:{user_id}'
+DATA_KEY = 'auth_user:{user_id}:{version}'
+
+
+def _cache_timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_user_version(user_id):
+    """Текущая версия закэшированного пользователя (общая для всех процессов)"""
+    version_key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, new_version(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def invalidate_user(user_id):
+    """Помечает закэшированного пользователя с профилем устаревшим"""
+    cache.set(VERSION_KEY.format(user_id=user_id), new_version(), None)
+
+
+def schedule_user_invalidation(user_id):
+    """
+    Сбрасывает кэш сразу и повторно после фиксации транзакции,
+    чтобы параллельный запрос не закэшировал незафиксированное состояние
+    """
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend, который загружает пользователя вместе с профилем одним
+    запросом, а для уже вошедших пользователей берет их из кэша.
+    Кэш сбрасывается по версии при сохранении или удалении User и Profile
+    (сигналы в accounts/models.py), в том числе при смене пароля и is_active.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.select_related('profile').get(**{User.USERNAME_FIELD: username})
+        except User.DoesNotExist:
+            # Хэшируем пароль и для несуществующего пользователя, чтобы время
+            # ответа не выдавало, существует ли логин (как в ModelBackend)
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        data_key = DATA_KEY.format(user_id=user_id, version=get_user_version(user_id))
+        user = cache.get(data_key)
+        if user is None:
+            user = User._default_manager.select_related('profile').filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(data_key, user, _cache_timeout())
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,58 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+from courses.models import Course
+from accounts.services.email_rendering import (
+    COURSE_SUBSCRIPTION_TEMPLATE, render_course_subscription_email
+)
+
+
+class Command(BaseCommand):
+    """
+    Команда для замера стоимости формирования писем о подписке.
+    Сравнивает сборку из заготовки курса с полным рендерингом шаблона.
+    Пользователи и курс создаются в памяти, база данных не используется.
+    """
+    help = 'Benchmark subscription email rendering (per-email cost)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Emails rendered from the skeleton')
+        parser.add_argument('--reference-count', type=int, default=1000, help='Emails rendered from the full template')
+
+    def handle(self, *args, **options):
+        course = Course(
+            title='Фишинг <и> спам', description='Описание & детали',
+            difficulty='easy', category='phishing', author='Отдел ИБ'
+        )
+        users = [
+            User(first_name=f'Имя{i}', last_name=f'Фамилия{i}')
+            for i in range(max(options['count'], options['reference_count']))
+        ]
+
+        per_email = self.measure(
+            users[:options['count']],
+            lambda user: render_course_subscription_email(user, course)
+        )
+        per_email_full = self.measure(
+            users[:options['reference_count']],
+            lambda user: strip_tags(render_to_string(COURSE_SUBSCRIPTION_TEMPLATE, {'user': user, 'course': course}))
+        )
+
+        self.stdout.write(
+            f"Skeleton render:      {options['count']} emails, {per_email * 1e6:.1f} us/email"
+        )
+        self.stdout.write(
+            f"Full template render: {options['reference_count']} emails, {per_email_full * 1e6:.1f} us/email"
+        )
+        if per_email:
+            self.stdout.write(self.style.SUCCESS(f"Speedup: {per_email_full / per_email:.1f}x"))
+
+    def measure(self, users, render):
+        if not users:
+            return 0
+        started = time.perf_counter()
+        for user in users:
+            render(user)
+        return (time.perf_counter() - started) / len(users)
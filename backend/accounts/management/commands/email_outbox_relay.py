@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from cyber_edu.db import refresh_db_connection
+from django.utils import timezone
+from accounts.outbox import relay_email_outbox, purge_sent_outbox
+
+class Command(BaseCommand):
+    help = 'Relays queued email tasks from the outbox table to RabbitMQ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0, help='Pause between polls when the outbox is empty, seconds')
+        parser.add_argument('--keep-days', type=int, default=7, help='How long to keep sent outbox rows')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        interval = options['interval']
+        keep = timedelta(days=options['keep_days'])
+        last_purge = None
+
+        self.stdout.write(self.style.SUCCESS(' [*] Email outbox relay started. To exit press CTRL+C'))
+        try:
+            while True:
+                # Постоянное соединение с БД проверяется перед каждой пачкой заданий
+                refresh_db_connection()
+                try:
+                    sent = relay_email_outbox(batch_size)
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"Error relaying outbox: {e}"))
+                    if options['once']:
+                        return
+                    time.sleep(interval * 5)
+                    continue
+
+                if sent:
+                    self.stdout.write(self.style.SUCCESS(f" [x] Relayed {sent} email task(s)"))
+                    continue
+
+                if options['once']:
+                    return
+
+                now = timezone.now()
+                if last_purge is None or now - last_purge > timedelta(hours=1):
+                    purged = purge_sent_outbox(now - keep)
+                    if purged:
+                        self.stdout.write(f"Purged {purged} sent outbox row(s)")
+                    last_purge = now
+
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -1,30 +1,28 @@
 import json
+import time
 import pika
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from accounts.tasks.email_tasks import send_email_sync
+from cyber_edu.db import refresh_db_connection
+from accounts.rabbitmq import retry_or_dead_letter
+from accounts.tasks.email_tasks import send_email_batch
 
 class Command(BaseCommand):
     help = 'Starts a RabbitMQ consumer for email tasks'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of parallel SMTP senders')
+        parser.add_argument('--prefetch', type=int, default=100, help='RabbitMQ prefetch count')
+        parser.add_argument('--batch-size', type=int, default=50, help='Max messages processed together')
+        parser.add_argument('--batch-timeout', type=float, default=1.0, help='Max seconds since the first message of a batch before it is sent')
+        parser.add_argument('--max-retries', type=int, default=5, help='Failed sends before a message is dead-lettered')
+
     def handle(self, *args, **options):
-        def callback(ch, method, properties, body):
-            """
-            Функция, которая вызывается при получении сообщения из очереди.
-            """
-            self.stdout.write(self.style.SUCCESS(f" [x] Received {body}"))
-            try:
-                task_data = json.loads(body)
-                send_email_sync(
-                    user_id=task_data.get('user_id'),
-                    course_id=task_data.get('course_id'),
-                    action=task_data.get('action')
-                )
-                self.stdout.write(self.style.SUCCESS(f" [x] Email task for user {task_data.get('user_id')} processed"))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error processing task: {e}"))
-                return
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+        self.concurrency = options['concurrency']
+        batch_size = options['batch_size']
+        batch_timeout = options['batch_timeout']
+        self.max_retries = options['max_retries']
+        self.stats = {'received': 0, 'sent': 0, 'failed': 0, 'started': time.monotonic()}
 
         connection = pika.BlockingConnection(
             pika.ConnectionParameters(
@@ -35,13 +33,81 @@ class Command(BaseCommand):
         )
         channel = connection.channel()
         channel.queue_declare(queue=settings.RABBITMQ_QUEUE, durable=True)
-        
-        channel.basic_qos(prefetch_count=1)
-        channel.basic_consume(queue=settings.RABBITMQ_QUEUE, on_message_callback=callback)
+
+        # prefetch не меньше размера пачки, иначе пачка никогда не заполнится
+        channel.basic_qos(prefetch_count=max(options['prefetch'], batch_size))
 
         self.stdout.write(self.style.SUCCESS(' [*] Email worker waiting for messages. To exit press CTRL+C'))
+        batch = []
+        deadline = None
         try:
-            channel.start_consuming()
+            # Короткий интервал опроса, чтобы пачка отправлялась не позже
+            # batch_timeout после ее первого сообщения, даже если сообщения
+            # продолжают поступать по одному
+            for method, properties, body in channel.consume(
+                settings.RABBITMQ_QUEUE,
+                inactivity_timeout=max(batch_timeout / 10, 0.05)
+            ):
+                if method is not None:
+                    if not batch:
+                        deadline = time.monotonic() + batch_timeout
+                    batch.append((method.delivery_tag, properties, body))
+                if batch and (len(batch) >= batch_size or time.monotonic() >= deadline):
+                    self.process_batch(channel, batch)
+                    batch = []
         except KeyboardInterrupt:
-            channel.stop_consuming()
-        connection.close()
\ No newline at end of file
+            pass
+        finally:
+            if batch and channel.is_open:
+                self.process_batch(channel, batch)
+            if channel.is_open:
+                channel.cancel()
+            if connection.is_open:
+                connection.close()
+
+    def process_batch(self, channel, batch):
+        """
+        Отправляет пачку писем и подтверждает сообщения.
+        Неотправленные письма возвращаются в очередь через очередь задержки
+        со счетчиком попыток в заголовке x-retries, после max_retries неудачных
+        попыток - в очередь <RABBITMQ_QUEUE>.failed. Исходное сообщение
+        подтверждается всегда, поэтому постоянно отклоняемое письмо
+        (например, несуществующий адрес) не доставляется по кругу.
+        """
+        started = time.monotonic()
+        # Постоянное соединение с БД проверяется перед каждой пачкой заданий
+        refresh_db_connection()
+        messages = []
+        tasks = []
+        for delivery_tag, properties, body in batch:
+            try:
+                tasks.append(json.loads(body))
+                messages.append((delivery_tag, properties, body))
+            except ValueError:
+                self.stdout.write(self.style.ERROR(f"Invalid task payload: {body!r}"))
+                channel.basic_reject(delivery_tag=delivery_tag, requeue=False)
+
+        try:
+            failed = send_email_batch(tasks, concurrency=self.concurrency)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error processing batch: {e}"))
+            failed = set(range(len(tasks)))
+
+        for index, (delivery_tag, properties, body) in enumerate(messages):
+            if index in failed and retry_or_dead_letter(
+                channel, settings.RABBITMQ_QUEUE, properties, body, self.max_retries
+            ):
+                self.stdout.write(self.style.ERROR(f"Message dead-lettered after {self.max_retries} attempts: {body!r}"))
+            channel.basic_ack(delivery_tag=delivery_tag)
+
+        elapsed = time.monotonic() - started
+        self.stats['received'] += len(batch)
+        self.stats['sent'] += len(tasks) - len(failed)
+        self.stats['failed'] += len(failed)
+        total_elapsed = time.monotonic() - self.stats['started']
+        self.stdout.write(self.style.SUCCESS(
+            f" [x] Batch of {len(batch)}: {len(tasks) - len(failed)} processed, {len(failed)} failed "
+            f"in {elapsed:.2f}s ({len(batch) / elapsed if elapsed else 0:.1f} msg/s); "
+            f"total {self.stats['sent']} sent, {self.stats['failed']} failed, "
+            f"{self.stats['received'] / total_elapsed if total_elapsed else 0:.1f} msg/s"
+        ))
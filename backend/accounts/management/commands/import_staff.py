@@ -0,0 +1,42 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts.services.staff_import import credentials_csv, import_staff, read_staff_file, validate_staff_rows
+
+
+class Command(BaseCommand):
+    """Команда для массового создания сотрудников из выгрузки отдела кадров"""
+    help = 'Import staff (name, patronymic, email, branch, department, position) from a CSV or XLSX file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('staff_file')
+        parser.add_argument('--credentials-output', help='CSV file for generated logins and passwords')
+        parser.add_argument('--workers', type=int, default=settings.STAFF_IMPORT_WORKERS, help='Password hashing processes, CPU count by default')
+        parser.add_argument('--no-email', action='store_true', help='Do not queue confirmation emails')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the file')
+
+    def handle(self, *args, **options):
+        if not options['dry_run'] and not options['credentials_output']:
+            raise CommandError('--credentials-output is required to hand out initial passwords')
+
+        started = time.monotonic()
+        try:
+            with open(options['staff_file'], 'rb') as staff_file:
+                rows = read_staff_file(staff_file, options['staff_file'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {options['staff_file']}: {e}")
+
+        valid, errors = validate_staff_rows(rows)
+        for line, error in errors:
+            self.stderr.write(f"Line {line}: {error}")
+        if options['dry_run'] or not valid:
+            self.stdout.write(f"{len(valid)} row(s) valid, {len(errors)} rejected")
+            return
+        credentials = import_staff(valid, workers=options['workers'], send_confirmation=not options['no_email'])
+        with open(options['credentials_output'], 'w', encoding='utf-8', newline='') as output:
+            output.write(credentials_csv(credentials))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(credentials)} employee(s), {len(errors)} row(s) rejected "
+            f"in {time.monotonic() - started:.1f}s; credentials saved to {options['credentials_output']}"
+        ))
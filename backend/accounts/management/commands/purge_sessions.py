@@ -0,0 +1,45 @@
+import time
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    """
+    Команда для удаления истекших сессий пачками.
+    В отличие от clearsessions не удаляет все строки одним DELETE,
+    поэтому не держит долгих блокировок на большой таблице django_session.
+    """
+    help = 'Delete expired sessions in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.1, help='Pause between batches, seconds')
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds, run once by default')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                deleted = self.purge(options['batch_size'], options['pause'])
+                if deleted:
+                    self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired session(s)"))
+                if not options['interval']:
+                    return
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def purge(self, batch_size, pause):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .values_list('session_key', flat=True)[:batch_size]
+            )
+            if not keys:
+                return deleted
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if len(keys) < batch_size:
+                return deleted
+            time.sleep(pause)
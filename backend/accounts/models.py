@@ -1,7 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from .backends import schedule_user_invalidation
 
 
 class Profile(models.Model):
@@ -30,9 +31,50 @@ class Profile(models.Model):
     email_confirmed = models.BooleanField(default=False)
     email_confirmation_token = models.CharField(max_length=100, blank=True, null=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+    def has_changes(self):
+        """Отличается ли профиль от последнего загруженного или сохраненного состояния"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(
+            getattr(self, field.attname) != loaded[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in loaded
+        )
+
     def str(self):
         return f"Профиль {self.user.username}"
 
+class EmailOutbox(models.Model):
+    """
+    Исходящие задания на отправку писем.
+    Запись создается в той же транзакции, что и изменения данных,
+    а в RabbitMQ ее переносит отдельный процесс (email_outbox_relay).
+    """
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sent_at', 'id'], name='email_outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Письмо {self.payload.get('action')} → {self.payload.get('user_id')} ({'отправлено' if self.sent_at else 'в очереди'})"
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -40,5 +82,21 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+    # Профиль сохраняется вместе с пользователем, только если его загрузили и изменили
+    if not User.profile.is_cached(instance):
+        return
+    try:
+        profile = instance.profile
+    except Profile.DoesNotExist:
+        return
+    if profile.has_changes():
+        profile.save()
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Сбрасывает закэшированного пользователя с профилем (accounts/backends.py)"""
+    schedule_user_invalidation(instance.pk if sender is User else instance.user_id)
     
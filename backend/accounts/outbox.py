@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from accounts.models import EmailOutbox
+from accounts.rabbitmq import publish_email_tasks
+
+
+def enqueue_email_task(task_data):
+    """
+    Ставит задание на отправку письма в outbox текущей транзакции.
+    task_data: словарь с данными для отправки (user_id, action, course_id и т.д.)
+    """
+    return EmailOutbox.objects.create(payload=task_data)
+
+def enqueue_email_tasks(tasks, batch_size=1000):
+    """
+    Ставит пачку заданий на отправку писем в outbox одним bulk_create.
+    """
+    return EmailOutbox.objects.bulk_create(
+        [EmailOutbox(payload=task_data) for task_data in tasks],
+        batch_size=batch_size
+    )
+
+def relay_email_outbox(batch_size=500):
+    """
+    Переносит пачку неотправленных заданий из outbox в RabbitMQ.
+    Строки блокируются с SKIP LOCKED, поэтому несколько релеев не отправят
+    одно задание дважды. Возвращает количество отправленных заданий.
+    """
+    error = None
+    with transaction.atomic():
+        entries = list(
+            EmailOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not entries:
+            return 0
+
+        ids = [entry.id for entry in entries]
+        try:
+            publish_email_tasks([entry.payload for entry in entries])
+        except Exception as e:
+            error = e
+        else:
+            EmailOutbox.objects.filter(id__in=ids).update(
+                sent_at=timezone.now(),
+                attempts=F('attempts') + 1,
+                last_error=None
+            )
+
+    if error is not None:
+        EmailOutbox.objects.filter(id__in=ids).update(
+            attempts=F('attempts') + 1,
+            last_error=str(error)
+        )
+        raise error
+
+    return len(ids)
+
+def purge_sent_outbox(older_than):
+    """Удаляет отправленные записи outbox старше указанного момента"""
+    deleted, _ = EmailOutbox.objects.filter(sent_at__lt=older_than).delete()
+    return deleted
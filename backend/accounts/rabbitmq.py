@@ -1,3 +1,5 @@
+import os
+import threading
 import pika
 import json
 from django.conf import settings
@@ -9,35 +11,182 @@ def get_rabbitmq_connection():
         host=settings.RABBITMQ_HOST,
         port=settings.RABBITMQ_PORT,
         credentials=credentials,
-        heartbeat=600,
+        heartbeat=settings.RABBITMQ_HEARTBEAT,
         blocked_connection_timeout=300
     )
     return pika.BlockingConnection(parameters)
 
+
+class RabbitMQPublisher:
+    """
+    Долгоживущий издатель на процесс.
+    Соединение и канал открываются лениво и переиспользуются между публикациями,
+    очередь объявляется один раз на канал. После fork (воркеры gunicorn)
+    унаследованное соединение не используется - открывается новое.
+    Пачка сообщений публикуется в AMQP-транзакции и подтверждается
+    брокером одним tx_commit.
+    """
+
+    RECONNECT_ERRORS = (
+        pika.exceptions.AMQPConnectionError,
+        pika.exceptions.AMQPChannelError,
+        pika.exceptions.StreamLostError,
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+        self._channel = None
+        self._declared_queues = set()
+
+    def _reset(self):
+        connection = self._connection
+        self._connection = None
+        self._channel = None
+        self._declared_queues = set()
+        if connection is not None and self._pid == os.getpid():
+            try:
+                if not connection.is_closed:
+                    connection.close()
+            except Exception:
+                pass
+
+    def _get_channel(self):
+        if self._pid != os.getpid():
+            # Сокет унаследован от родительского процесса - не закрываем его,
+            # чтобы не разорвать соединение родителя
+            self._connection = None
+            self._channel = None
+            self._declared_queues = set()
+            self._pid = os.getpid()
+
+        if self._connection is not None and not self._connection.is_closed:
+            # Обрабатываем heartbeat-кадры, накопившиеся за время простоя
+            self._connection.process_data_events(time_limit=0)
+
+        if self._connection is None or self._connection.is_closed:
+            self._reset()
+            self._connection = get_rabbitmq_connection()
+
+        if self._channel is None or self._channel.is_closed:
+            self._declared_queues = set()
+            self._channel = self._connection.channel()
+            self._channel.tx_select()
+
+        return self._channel
+
+    def publish(self, queue, tasks):
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    channel = self._get_channel()
+                    if queue not in self._declared_queues:
+                        channel.queue_declare(queue=queue, durable=True)
+                        self._declared_queues.add(queue)
+
+                    for task_data in tasks:
+                        channel.basic_publish(
+                            exchange='',
+                            routing_key=queue,
+                            body=json.dumps(task_data),
+                            properties=pika.BasicProperties(
+                                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE
+                            )
+                        )
+                    channel.tx_commit()
+                    return
+                except self.RECONNECT_ERRORS:
+                    # Незафиксированная транзакция отбрасывается брокером,
+                    # поэтому пачку можно безопасно отправить повторно
+                    self._reset()
+                    if attempt:
+                        raise
+
+    def close(self):
+        with self._lock:
+            self._reset()
+
+
+publisher = RabbitMQPublisher()
+
 def publish_email_task(task_data):
     """
     Публикует задание на отправку письма в очередь.
     task_data: словарь с данными для отправки (user_id, action, course_id и т.д.)
     """
-    connection = None
+    publish_task(settings.RABBITMQ_QUEUE, task_data)
+
+def publish_email_tasks(tasks):
+    """
+    Публикует пачку заданий на отправку писем одной транзакцией.
+    """
+    publish_tasks(settings.RABBITMQ_QUEUE, tasks)
+
+def publish_task(queue, task_data):
+    """
+    Публикует произвольное задание в указанную очередь.
+    """
+    publish_tasks(queue, [task_data])
+
+def publish_tasks(queue, tasks):
+    """
+    Публикует список заданий в указанную очередь через общее соединение процесса.
+    """
+    if not tasks:
+        return
+
     try:
-        connection = get_rabbitmq_connection()
-        channel = connection.channel()
-
-        channel.queue_declare(queue=settings.RABBITMQ_QUEUE, durable=True)
-
-        channel.basic_publish(
-            exchange='',
-            routing_key=settings.RABBITMQ_QUEUE,
-            body=json.dumps(task_data),
-            properties=pika.BasicProperties(
-                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE
-            )
-        )
-        print(f" [x] Sent task: {task_data}")
+        publisher.publish(queue, tasks)
+        print(f" [x] Sent {len(tasks)} task(s) to {queue}")
     except Exception as e:
         print(f"Error publishing task to RabbitMQ: {e}")
         raise e
-    finally:
-        if connection and not connection.is_closed:
-            connection.close()
\ No newline at end of file
+
+
+def retry_delay(retries):
+    """
+    Задержка в секундах перед попыткой номер retries + 1:
+    RABBITMQ_RETRY_DELAY, удваивается с каждой попыткой до RABBITMQ_RETRY_MAX_DELAY.
+    """
+    return min(settings.RABBITMQ_RETRY_DELAY * 2 ** (retries - 1), settings.RABBITMQ_RETRY_MAX_DELAY)
+
+def retry_or_dead_letter(channel, queue, properties, body, max_retries):
+    """
+    Публикует копию необработанного сообщения со счетчиком попыток
+    в заголовке x-retries. Копия ждет в очереди задержки <queue>.delay.<мс>
+    и по истечении TTL возвращается брокером в queue, поэтому повторы
+    не нагружают сервис, который сейчас недоступен. После max_retries
+    попыток сообщение публикуется в очередь <queue>.failed.
+    Исходное сообщение вызывающий код подтверждает сам.
+    Возвращает True, если сообщение отправлено в <queue>.failed.
+    """
+    headers = dict(getattr(properties, 'headers', None) or {})
+    retries = int(headers.get('x-retries', 0)) + 1
+    headers['x-retries'] = retries
+
+    dead_lettered = retries >= max_retries
+    if dead_lettered:
+        target = f'{queue}.failed'
+        channel.queue_declare(queue=target, durable=True)
+    else:
+        # Очередь на каждую задержку: TTL задается очередью, а не сообщением,
+        # иначе длинная задержка в голове очереди держала бы короткие
+        delay_ms = int(retry_delay(retries) * 1000)
+        target = f'{queue}.delay.{delay_ms}'
+        channel.queue_declare(queue=target, durable=True, arguments={
+            'x-message-ttl': delay_ms,
+            'x-dead-letter-exchange': '',
+            'x-dead-letter-routing-key': queue,
+        })
+
+    channel.basic_publish(
+        exchange='',
+        routing_key=target,
+        body=body,
+        properties=pika.BasicProperties(
+            delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+            headers=headers
+        )
+    )
+    return dead_lettered
@@ -5,7 +5,8 @@ from .models import Profile
 # from .services.email_service import send_email
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
-from accounts.rabbitmq import publish_email_task
+from accounts.outbox import enqueue_email_task
+from django.db import transaction
 from django.core.validators import EmailValidator
 import re
 
@@ -77,31 +78,33 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         branch = validated_data.pop('branch')
         patronymic = validated_data.pop('patronymic', '')
         
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            password=validated_data['password'],
-            email=validated_data.get('email', ''),
-            first_name=validated_data.get('first_name', ''),
-            last_name=validated_data.get('last_name', '')
-        )
-        
-        profile = user.profile
-        profile.department = department
-        profile.position = position
-        profile.branch = branch
-        if patronymic:
-            profile.patronymic = patronymic
-        
-        confirmation_token = generate_confirmation_token()
-        profile.email_confirmation_token = confirmation_token
-        profile.save()
-        
-        task_data = {
-                'user_id': user.id,
-                'action': 'confirmation'
-            }
+        with transaction.atomic():
+            user = User.objects.create_user(
+                username=validated_data['username'],
+                password=validated_data['password'],
+                email=validated_data.get('email', ''),
+                first_name=validated_data.get('first_name', ''),
+                last_name=validated_data.get('last_name', '')
+            )
+            
+            profile = user.profile
+            profile.department = department
+            profile.position = position
+            profile.branch = branch
+            if patronymic:
+                profile.patronymic = patronymic
+            
+            confirmation_token = generate_confirmation_token()
+            profile.email_confirmation_token = confirmation_token
+            profile.save()
+            
+            task_data = {
+                    'user_id': user.id,
+                    'action': 'confirmation'
+                }
 
-        publish_email_task(task_data)
+            # Письмо уйдет только если транзакция регистрации зафиксируется
+            enqueue_email_task(task_data)
 
         # send_email(user, action="confirmation")
         
@@ -0,0 +1,121 @@
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from types import SimpleNamespace
+from django.template.loader import get_template
+from django.utils.html import escape, strip_tags
+
+CONFIRMATION_TEMPLATE = 'email/confirmation_email.html'
+COURSE_SUBSCRIPTION_TEMPLATE = 'email/course_subscription_email.html'
+
+# Уникальные метки, которые подставляются в шаблон вместо персональных данных.
+# Шаблон рендерится один раз с метками, затем метки заменяются значениями.
+MARKERS = {
+    field: f'@@{field}-{uuid.uuid4().hex}@@'
+    for field in ('first_name', 'last_name', 'confirmation_link')
+}
+MARKER_FIELDS = {marker: field for field, marker in MARKERS.items()}
+MARKER_PATTERN = re.compile('(' + '|'.join(re.escape(marker) for marker in MARKERS.values()) + ')')
+
+COURSE_SKELETONS_SIZE = 128
+
+_course_skeletons = OrderedDict()
+_course_skeletons_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_compiled_template(template_name):
+    """Загружает и компилирует шаблон письма один раз на процесс"""
+    return get_template(template_name)
+
+
+class EmailSkeleton:
+    """
+    Отрендеренный шаблон письма с метками вместо персональных данных.
+    HTML и текстовая версия разбиты на неизменяемые части и имена полей,
+    поэтому письмо для конкретного пользователя собирается без рендеринга
+    шаблона и без повторного разбора HTML.
+    """
+
+    def __init__(self, html):
+        self.html_parts = self.split(html)
+        self.plain_parts = self.split(strip_tags(html))
+
+    @staticmethod
+    def split(text):
+        parts = MARKER_PATTERN.split(text)
+        # Нечетные элементы - метки, заменяем их именами полей
+        return [
+            MARKER_FIELDS[part] if index % 2 else part
+            for index, part in enumerate(parts)
+        ]
+
+    @staticmethod
+    def join(parts, values):
+        return ''.join(
+            values[part] if index % 2 else part
+            for index, part in enumerate(parts)
+        )
+
+    def render(self, **values):
+        # Значения экранируются так же, как это сделал бы шаблон
+        escaped = {field: escape(value) for field, value in values.items()}
+        return self.join(self.html_parts, escaped), self.join(self.plain_parts, escaped)
+
+
+def marker_user():
+    return SimpleNamespace(first_name=MARKERS['first_name'], last_name=MARKERS['last_name'])
+
+
+@lru_cache(maxsize=None)
+def get_confirmation_skeleton():
+    html = get_compiled_template(CONFIRMATION_TEMPLATE).render({
+        'user': marker_user(),
+        'confirmation_link': MARKERS['confirmation_link'],
+    })
+    return EmailSkeleton(html)
+
+
+def get_course_subscription_skeleton(course):
+    """
+    Возвращает заготовку письма о подписке для курса.
+    Заготовки кэшируются по (course_id, updated_at), поэтому изменение курса
+    автоматически приводит к новой заготовке.
+    """
+    key = (course.id, course.updated_at)
+    with _course_skeletons_lock:
+        skeleton = _course_skeletons.get(key)
+        if skeleton is not None:
+            _course_skeletons.move_to_end(key)
+            return skeleton
+
+    html = get_compiled_template(COURSE_SUBSCRIPTION_TEMPLATE).render({
+        'user': marker_user(),
+        'course': course,
+    })
+    skeleton = EmailSkeleton(html)
+
+    with _course_skeletons_lock:
+        _course_skeletons[key] = skeleton
+        while len(_course_skeletons) > COURSE_SKELETONS_SIZE:
+            _course_skeletons.popitem(last=False)
+    return skeleton
+
+
+def render_confirmation_email(user, confirmation_link):
+    """Возвращает (html, текст) письма с подтверждением email"""
+    return get_confirmation_skeleton().render(
+        first_name=user.first_name,
+        last_name=user.last_name,
+        confirmation_link=confirmation_link,
+    )
+
+
+def render_course_subscription_email(user, course):
+    """Возвращает (html, текст) письма о подписке на курс"""
+    return get_course_subscription_skeleton(course).render(
+        first_name=user.first_name,
+        last_name=user.last_name,
+    )
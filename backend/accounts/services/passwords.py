@@ -0,0 +1,12 @@
+from django.utils.module_loading import import_string
+
+
+def hash_initial_password(password, hasher_path):
+    """
+    Хэш начального пароля хэшером hasher_path с его обычными параметрами
+    (для PBKDF2 - полное число итераций). Модуль не импортирует модели
+    и настройки, поэтому функцию можно выполнять в дочерних процессах пула
+    без инициализации Django.
+    """
+    hasher = import_string(hasher_path)()
+    return hasher.encode(password, hasher.salt())
@@ -0,0 +1,208 @@
+import csv
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils.crypto import get_random_string
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from rest_framework.exceptions import ValidationError
+from accounts.models import Profile
+from accounts.outbox import enqueue_email_tasks
+from accounts.serializers import generate_confirmation_token, validate_email_domain
+from accounts.services.passwords import hash_initial_password
+
+# Заголовки выгрузок отдела кадров -> поля профиля
+COLUMNS = {
+    'last_name': ('last_name', 'фамилия'),
+    'first_name': ('first_name', 'имя'),
+    'patronymic': ('patronymic', 'отчество'),
+    'full_name': ('name', 'full_name', 'фио'),
+    'email': ('email', 'e-mail', 'почта', 'электронная почта'),
+    'branch': ('branch', 'филиал'),
+    'department': ('department', 'отдел', 'подразделение'),
+    'position': ('position', 'должность'),
+}
+
+BRANCHES = {
+    **{code: code for code, _ in Profile.BRANCH_CHOICES},
+    **{name.lower(): code for code, name in Profile.BRANCH_CHOICES},
+}
+
+PASSWORD_LENGTH = 16
+
+
+def normalize_header(header):
+    header = (header or '').strip().lower()
+    for field, aliases in COLUMNS.items():
+        if header in aliases:
+            return field
+    return None
+
+
+def read_staff_file(file, filename):
+    """
+    Читает список сотрудников из CSV (разделитель ; или ,) или XLSX.
+    Возвращает список словарей с полями из COLUMNS, неизвестные колонки пропускаются.
+    Бросает ValueError, если формат файла не удалось разобрать.
+    """
+    try:
+        if filename.lower().endswith('.xlsx'):
+            sheet = load_workbook(file, read_only=True, data_only=True).active
+            rows = sheet.iter_rows(values_only=True)
+        else:
+            content = file.read()
+            if isinstance(content, bytes):
+                content = content.decode('utf-8-sig')
+            dialect = csv.Sniffer().sniff(content.split('\n', 1)[0], delimiters=';,')
+            rows = csv.reader(io.StringIO(content), dialect)
+    except UnicodeDecodeError:
+        raise ValueError('файл должен быть в кодировке UTF-8')
+    except csv.Error:
+        raise ValueError('не удалось определить разделитель колонок (ожидается ; или ,)')
+    except (zipfile.BadZipFile, InvalidFileException):
+        raise ValueError('файл не является книгой XLSX')
+
+    header = [normalize_header(str(cell) if cell is not None else '') for cell in next(rows, [])]
+    return [
+        {
+            field: str(value).strip()
+            for field, value in zip(header, row)
+            if field and value is not None
+        }
+        for row in rows
+        if any(value not in (None, '') for value in row)
+    ]
+
+
+def validate_staff_rows(rows):
+    """
+    Проверяет строки целиком: домены почты, филиалы, повторы в файле
+    и уже существующих пользователей (по одному запросу на все строки).
+    Возвращает (подготовленные строки, ошибки [(номер строки, текст)]).
+    """
+    valid = []
+    errors = []
+    seen = set()
+
+    emails = {row.get('email', '').lower() for row in rows}
+    existing = set(
+        User.objects.annotate(email_lower=Lower('email'))
+        .filter(email_lower__in=emails).values_list('email_lower', flat=True)
+    ) | set(
+        User.objects.annotate(username_lower=Lower('username'))
+        .filter(username_lower__in=emails).values_list('username_lower', flat=True)
+    )
+
+    for line, row in enumerate(rows, start=2):
+        email = row.get('email', '').lower()
+        if row.get('full_name') and not row.get('last_name'):
+            # ФИО одной колонкой: "Фамилия Имя Отчество"
+            parts = row['full_name'].split()
+            row['last_name'] = parts[0]
+            row['first_name'] = row.get('first_name') or (parts[1] if len(parts) > 1 else '')
+            row['patronymic'] = row.get('patronymic') or ' '.join(parts[2:])
+
+        if not email:
+            errors.append((line, 'Не указан email'))
+            continue
+        try:
+            validate_email_domain(email)
+        except ValidationError as e:
+            errors.append((line, f'{email}: {e.detail[0]}'))
+            continue
+        if email in seen:
+            errors.append((line, f'{email}: повторяется в файле'))
+            continue
+        if email in existing:
+            errors.append((line, f'{email}: пользователь уже существует'))
+            continue
+        branch = row.get('branch', '')
+        if branch and branch.lower() not in BRANCHES:
+            errors.append((line, f'{email}: неизвестный филиал "{branch}"'))
+            continue
+        if not row.get('last_name') or not row.get('first_name'):
+            errors.append((line, f'{email}: не указаны фамилия и имя'))
+            continue
+
+        seen.add(email)
+        valid.append({**row, 'email': email, 'branch': BRANCHES.get(branch.lower()) if branch else None})
+
+    return valid, errors
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    Хэширует пароли основным хэшером из PASSWORD_HASHERS с его обычными
+    параметрами в пуле процессов (workers=1 - в текущем процессе): это самая
+    долгая часть импорта. Процессы запускаются через spawn, а не fork,
+    чтобы не копировать состояние родительского процесса.
+    """
+    hasher = type(get_hasher('default'))
+    hasher_path = f'{hasher.__module__}.{hasher.__qualname__}'
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 100:
+        return [hash_initial_password(password, hasher_path) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(
+            hash_initial_password, passwords, repeat(hasher_path),
+            chunksize=max(1, len(passwords) // (workers * 4))
+        ))
+
+
+def import_staff(rows, workers=None, send_confirmation=True, batch_size=1000):
+    """
+    Создает пользователей с профилями пачками через bulk_create (сигналы
+    post_save не вызываются) и ставит письма с подтверждением в outbox.
+    Логин - email, пароль генерируется.
+    Возвращает [(email, пароль)] созданных пользователей.
+    """
+    passwords = [get_random_string(PASSWORD_LENGTH) for _ in rows]
+    hashes = hash_passwords(passwords, workers)
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(
+                username=row['email'],
+                email=row['email'],
+                first_name=row['first_name'],
+                last_name=row['last_name'],
+                password=password_hash,
+            )
+            for row, password_hash in zip(rows, hashes)
+        ], batch_size=batch_size)
+
+        Profile.objects.bulk_create([
+            Profile(
+                user=user,
+                patronymic=row.get('patronymic') or None,
+                department=row.get('department') or None,
+                position=row.get('position') or None,
+                branch=row['branch'],
+                email_confirmation_token=generate_confirmation_token(),
+            )
+            for user, row in zip(users, rows)
+        ], batch_size=batch_size)
+
+        if send_confirmation:
+            enqueue_email_tasks(
+                [{'user_id': user.id, 'action': 'confirmation'} for user in users],
+                batch_size=batch_size
+            )
+
+    return [(user.email, password) for user, password in zip(users, passwords)]
+
+
+def credentials_csv(credentials):
+    """CSV с логинами и начальными паролями для передачи сотрудникам"""
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    writer.writerow(['Логин', 'Пароль'])
+    writer.writerows(credentials)
+    return '\ufeff' + output.getvalue()
@@ -0,0 +1,77 @@
+import time
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+REFRESHED_KEY = '_session_refreshed_at'
+
+# Кэши, которые не видны другим процессам gunicorn
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+class SessionStore(CachedDBStore):
+    """
+    Сессии в кэше с записью в БД, которые не сохраняются на каждый запрос.
+
+    При SESSION_SAVE_EVERY_REQUEST middleware вызывает save() после каждого
+    запроса, чтобы продлить срок жизни сессии. Здесь сессия записывается
+    (в кэш и в django_session) только если изменились ее данные или с
+    прошлой записи прошло больше SESSION_REFRESH_INTERVAL секунд.
+    Срок жизни по-прежнему скользящий, но отсчитывается от последней записи,
+    то есть сессия без активности живет от SESSION_COOKIE_AGE - интервал
+    до SESSION_COOKIE_AGE. Чтение идет из кэша, БД - только при промахе.
+
+    Если кэш сессий локален для процесса (LocMemCache), сессии читаются
+    и пишутся только в БД, как в движке db: иначе выход из системы удалял бы
+    сессию из кэша одного воркера, а остальные продолжали бы ее принимать.
+    """
+
+    @property
+    def cache_is_shared(self):
+        return not isinstance(self._cache, PROCESS_LOCAL_CACHES)
+
+    def load(self):
+        if not self.cache_is_shared:
+            return DBStore.load(self)
+        return super().load()
+
+    def exists(self, session_key):
+        if not self.cache_is_shared:
+            return DBStore.exists(self, session_key)
+        return super().exists(session_key)
+
+    def delete(self, session_key=None):
+        if not self.cache_is_shared:
+            return DBStore.delete(self, session_key)
+        return super().delete(session_key)
+
+    def needs_refresh(self):
+        refreshed_at = self._get_session().get(REFRESHED_KEY)
+        if refreshed_at is None:
+            return True
+        return time.time() - refreshed_at >= settings.SESSION_REFRESH_INTERVAL
+
+    def save(self, must_create=False):
+        if not must_create and self.session_key and not self.modified and not self.needs_refresh():
+            return
+        self._get_session()[REFRESHED_KEY] = int(time.time())
+        if not self.cache_is_shared:
+            return DBStore.save(self, must_create=must_create)
+        super().save(must_create=must_create)
+
+    def cycle_key(self):
+        """
+        Меняет ключ сессии при входе. Базовая реализация сразу записывает
+        сессию под новым ключом, а middleware в конце запроса перезаписывает ее
+        еще раз с данными пользователя; здесь новый ключ создается одной
+        записью при сохранении в конце запроса.
+        """
+        data = self._session
+        key = self.session_key
+        self._session_key = None
+        self._session_cache = data
+        self.modified = True
+        if key:
+            self.delete(key)
@@ -1,16 +1,46 @@
-from django.core.mail import send_mail
+from concurrent.futures import ThreadPoolExecutor
+from django.core.mail import send_mail, get_connection, EmailMultiAlternatives
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.utils.crypto import get_random_string
 from django.contrib.auth import get_user_model
 from courses.models import Course
+from accounts.services.email_rendering import (
+    render_confirmation_email, render_course_subscription_email
+)
 
 User = get_user_model()
 
 def generate_confirmation_token():
     return get_random_string(length=32)
 
+def render_email(user, course=None, action=None):
+    """
+    Формирует тему, HTML и текстовую версию письма для пользователя.
+    Возвращает None, если письмо отправлять не нужно.
+    """
+    match action:
+        case "confirmation":
+            if not user.email:
+                return None
+            if not user.profile.email_confirmation_token:
+                user.profile.email_confirmation_token = generate_confirmation_token()
+                user.profile.save()
+            confirmation_token = user.profile.email_confirmation_token
+            confirmation_link = f"{settings.FRONTEND_URL}/confirm-email/{confirmation_token}/"
+            subject = 'Подтвердите ваш email'
+            html_message, plain_message = render_confirmation_email(user, confirmation_link)
+
+        case "course_subscription":
+            if course is None:
+                return None
+            subject = f'Вам добавлен новый курс: {course.title}'
+            html_message, plain_message = render_course_subscription_email(user, course)
+
+        case _:
+            return None
+
+    return subject, html_message, plain_message
+
 def send_email_sync(user_id, course_id=None, action=None):
     """
     Синхронная функция отправки письма.
@@ -30,29 +60,11 @@ def send_email_sync(user_id, course_id=None, action=None):
             print(f"Course with id {course_id} not found.")
             return
 
-    match action:
-        case "confirmation":
-            if not user.email:
-                return False
-            if not user.profile.email_confirmation_token:
-                user.profile.email_confirmation_token = generate_confirmation_token()
-                user.profile.save()
-            confirmation_token = user.profile.email_confirmation_token
-            confirmation_link = f"{settings.FRONTEND_URL}/confirm-email/{confirmation_token}/"
-            subject = 'Подтвердите ваш email'
-            html_message = render_to_string('email/confirmation_email.html', {
-                'user': user,
-                'confirmation_link': confirmation_link,
-            })
-
-        case "course_subscription":
-            subject = f'Вам добавлен новый курс: {course.title}'
-            html_message = render_to_string('email/course_subscription_email.html', {
-                'user': user,
-                'course': course,
-            })
+    rendered = render_email(user, course, action)
+    if rendered is None:
+        return False
+    subject, html_message, plain_message = rendered
 
-    plain_message = strip_tags(html_message)
     send_mail(
         subject,
         plain_message,
@@ -61,4 +73,99 @@ def send_email_sync(user_id, course_id=None, action=None):
         html_message=html_message,
         fail_silently=False,
     )
-    return True
\ No newline at end of file
+    return True
+
+def build_email_messages(tasks):
+    """
+    Готовит письма для пачки заданий.
+    Пользователи и курсы загружаются двумя запросами на всю пачку.
+    Возвращает список пар (индекс задания, письмо); задания, для которых
+    письмо не требуется (нет пользователя, курса или email), пропускаются.
+    """
+    user_ids = {task.get('user_id') for task in tasks}
+    course_ids = {task.get('course_id') for task in tasks if task.get('course_id')}
+
+    users = User.objects.select_related('profile').in_bulk(user_ids)
+    courses = Course.objects.in_bulk(course_ids)
+
+    messages = []
+    for index, task in enumerate(tasks):
+        user = users.get(task.get('user_id'))
+        if user is None:
+            print(f"User with id {task.get('user_id')} not found.")
+            continue
+
+        course = courses.get(task.get('course_id'))
+        rendered = render_email(user, course, task.get('action'))
+        if rendered is None:
+            continue
+        subject, html_message, plain_message = rendered
+
+        message = EmailMultiAlternatives(
+            subject,
+            plain_message,
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email],
+        )
+        message.attach_alternative(html_message, 'text/html')
+        messages.append((index, message))
+
+    return messages
+
+def send_messages_chunk(chunk):
+    """
+    Отправляет часть пачки через одно SMTP-соединение, по одному письму
+    за вызов. SMTP-бэкенд отправляет письма последовательно, и при ошибке
+    посреди пачки предыдущие уже доставлены, поэтому ошибка учитывается
+    для каждого письма отдельно и повторно отправляются только неудачные.
+    Возвращает множество индексов неотправленных заданий.
+    """
+    connection = get_connection(fail_silently=False)
+    failed = set()
+    opened = False
+    for index, message in chunk:
+        try:
+            if not opened:
+                # Открытое заранее соединение бэкенд не закрывает
+                # после send_messages и использует для всех писем части
+                connection.open()
+                opened = True
+            connection.send_messages([message])
+        except Exception as e:
+            print(f"Error sending email to {message.to}: {e}")
+            failed.add(index)
+            # После ошибки соединение может быть разорвано -
+            # для следующего письма открывается новое
+            opened = False
+            close_quietly(connection)
+    close_quietly(connection)
+    return failed
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+def send_email_batch(tasks, concurrency=1):
+    """
+    Отправляет пачку заданий: письма готовятся в текущем потоке (ORM),
+    а отправляются параллельно в concurrency потоках, каждый со своим
+    SMTP-соединением на всю свою часть пачки.
+    Возвращает множество индексов заданий, которые не удалось отправить.
+    """
+    messages = build_email_messages(tasks)
+    if not messages:
+        return set()
+
+    concurrency = max(1, min(concurrency, len(messages)))
+    chunks = [messages[i::concurrency] for i in range(concurrency)]
+
+    if concurrency == 1:
+        return send_messages_chunk(chunks[0])
+
+    failed = set()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for chunk_failed in executor.map(send_messages_chunk, chunks):
+            failed |= chunk_failed
+    return failed
@@ -1,3 +1,552 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+from django.db import connections, transaction
+from django.contrib.sessions.models import Session
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
+from rest_framework.test import APIClient
+from .management.commands.email_worker import Command as EmailWorkerCommand
+from .models import EmailOutbox, Profile
+from .outbox import enqueue_email_task, enqueue_email_tasks, relay_email_outbox
+from .rabbitmq import RabbitMQPublisher
+from .tasks.email_tasks import send_email_batch
+from .services.email_rendering import render_confirmation_email, render_course_subscription_email
+from courses.models import Course
 
-# Create your tests here.
+
+class FakeChannel:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_closed = False
+
+    def tx_select(self):
+        pass
+
+    def queue_declare(self, queue, durable):
+        self.broker.declared.append(queue)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.broker.pending.append((routing_key, body))
+
+    def tx_commit(self):
+        self.broker.messages.extend(self.broker.pending)
+        self.broker.pending = []
+
+
+class FakeBroker:
+    """Локальная замена RabbitMQ: считает соединения и имитирует задержку рукопожатия"""
+    HANDSHAKE_SECONDS = 0.02
+
+    def __init__(self):
+        self.connections = 0
+        self.declared = []
+        self.pending = []
+        self.messages = []
+
+    def connect(self, parameters):
+        time.sleep(self.HANDSHAKE_SECONDS)
+        self.connections += 1
+        broker = self
+
+        class Connection:
+            is_closed = False
+
+            def channel(self):
+                return FakeChannel(broker)
+
+            def process_data_events(self, time_limit=0):
+                pass
+
+            def close(self):
+                self.is_closed = True
+
+        return Connection()
+
+
+local_broker = override_settings(
+    RABBITMQ_HOST='localhost', RABBITMQ_PORT=5672,
+    RABBITMQ_USERNAME='guest', RABBITMQ_PASSWORD='guest',
+    RABBITMQ_QUEUE='email_tasks'
+)
+
+
+@local_broker
+class RabbitMQPublisherTests(SimpleTestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        patcher = mock.patch('accounts.rabbitmq.pika.BlockingConnection', side_effect=self.broker.connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.publisher = RabbitMQPublisher()
+
+    def test_connection_is_reused_between_publishes(self):
+        count = 200
+        for i in range(count):
+            self.publisher.publish('email_tasks', [{'user_id': i}])
+
+        self.assertEqual(self.broker.connections, 1)
+        self.assertEqual(self.broker.declared, ['email_tasks'])
+        self.assertEqual(len(self.broker.messages), count)
+
+    @skipUnless(os.getenv('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+    def test_publish_latency_benchmark(self):
+        count = 200
+        started = time.perf_counter()
+        for i in range(count):
+            self.publisher.publish('email_tasks', [{'user_id': i}])
+        per_publish = (time.perf_counter() - started) / count
+
+        # Для сравнения - новое соединение на каждую публикацию, как раньше
+        started = time.perf_counter()
+        for i in range(count):
+            RabbitMQPublisher().publish('email_tasks', [{'user_id': i}])
+        per_publish_reconnect = (time.perf_counter() - started) / count
+
+        print(f"\nPublish latency: {per_publish * 1e3:.2f} ms reused connection, "
+              f"{per_publish_reconnect * 1e3:.2f} ms new connection per publish "
+              f"(stand-in handshake {FakeBroker.HANDSHAKE_SECONDS * 1e3:.0f} ms)")
+
+    def test_reconnects_after_fork(self):
+        self.publisher.publish('email_tasks', [{'user_id': 1}])
+        with mock.patch('accounts.rabbitmq.os.getpid', return_value=-1):
+            self.publisher.publish('email_tasks', [{'user_id': 2}, {'user_id': 3}])
+
+        self.assertEqual(self.broker.connections, 2)
+        self.assertEqual(len(self.broker.messages), 3)
+
+
+class EmailOutboxTests(TestCase):
+    def test_outbox_rows_roll_back_with_transaction(self):
+        try:
+            with transaction.atomic():
+                enqueue_email_task({'user_id': 1, 'action': 'confirmation'})
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    @mock.patch('accounts.outbox.publish_email_tasks')
+    def test_relay_marks_rows_sent(self, publish):
+        enqueue_email_tasks([{'user_id': i, 'action': 'confirmation'} for i in range(3)])
+
+        self.assertEqual(relay_email_outbox(batch_size=2), 2)
+        self.assertEqual(relay_email_outbox(batch_size=2), 1)
+        self.assertEqual(relay_email_outbox(batch_size=2), 0)
+
+        self.assertEqual(publish.call_count, 2)
+        self.assertFalse(EmailOutbox.objects.filter(sent_at__isnull=True).exists())
+
+    @mock.patch('accounts.outbox.publish_email_tasks', side_effect=ConnectionError('broker down'))
+    def test_relay_keeps_rows_when_broker_is_down(self, _publish):
+        enqueue_email_task({'user_id': 1, 'action': 'confirmation'})
+
+        with self.assertRaises(ConnectionError):
+            relay_email_outbox()
+
+        entry = EmailOutbox.objects.get()
+        self.assertIsNone(entry.sent_at)
+        self.assertEqual(entry.attempts, 1)
+        self.assertEqual(entry.last_error, 'broker down')
+
+
+class FakeConsumerChannel:
+    """Локальная замена канала RabbitMQ для воркера писем"""
+    is_open = True
+
+    def __init__(self, bodies, headers=None, clock=None):
+        self.bodies = bodies
+        self.headers = headers
+        self.clock = clock
+        self.acked = []
+        self.nacked = []
+        self.published = []
+
+    def queue_declare(self, queue, durable, arguments=None):
+        pass
+
+    def basic_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    def consume(self, queue, inactivity_timeout=None):
+        for tag, body in enumerate(self.bodies, start=1):
+            if self.clock is not None:
+                # Сообщения поступают по одному раз в 0.4 секунды
+                self.clock.now += 0.4
+            yield mock.Mock(delivery_tag=tag), mock.Mock(headers=self.headers), body
+        yield None, None, None
+        raise KeyboardInterrupt
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue):
+        self.nacked.append(delivery_tag)
+
+    def basic_reject(self, delivery_tag, requeue):
+        self.nacked.append(delivery_tag)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, properties.headers['x-retries'], body))
+
+    def cancel(self):
+        pass
+
+
+@local_broker
+class EmailWorkerTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.users = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@tnimc.ru', first_name=f'Имя{i}')
+            for i in range(20)
+        ]
+
+    def run_worker(self, bodies, headers=None, clock=None, **options):
+        channel = FakeConsumerChannel(bodies, headers, clock)
+        connection = mock.Mock(is_open=True)
+        connection.channel.return_value = channel
+        with mock.patch('accounts.management.commands.email_worker.pika.BlockingConnection', return_value=connection), \
+                mock.patch('accounts.tasks.email_tasks.get_connection', wraps=get_connection) as smtp:
+            call_command('email_worker', stdout=StringIO(), **options)
+        return channel, smtp
+
+    def test_batches_share_smtp_connections(self):
+        bodies = [
+            json.dumps({'user_id': user.id, 'course_id': self.course.id, 'action': 'course_subscription'})
+            for user in self.users
+        ]
+
+        with self.assertNumQueries(4):
+            channel, smtp = self.run_worker(bodies, batch_size=10, concurrency=2)
+
+        self.assertEqual(len(mail.outbox), 20)
+        self.assertEqual(smtp.call_count, 4)
+        self.assertEqual(sorted(channel.acked), list(range(1, 21)))
+        message = next(m for m in mail.outbox if m.to == ['user3@tnimc.ru'])
+        self.assertIn('Имя3', message.alternatives[0][0])
+
+    def test_missing_user_is_acknowledged(self):
+        bodies = [json.dumps({'user_id': 0, 'action': 'confirmation'})]
+        channel, _ = self.run_worker(bodies, batch_size=10)
+
+        self.assertEqual(channel.acked, [1])
+        self.assertEqual(len(mail.outbox), 0)
+
+    @mock.patch('accounts.management.commands.email_worker.send_email_batch', return_value={0})
+    def test_failed_message_is_retried_with_growing_delay_then_dead_lettered(self, send):
+        body = json.dumps({'user_id': self.users[0].id, 'action': 'confirmation'})
+        with self.settings(RABBITMQ_QUEUE='emails', RABBITMQ_RETRY_DELAY=5, RABBITMQ_RETRY_MAX_DELAY=600):
+            channel, _ = self.run_worker([body], max_retries=3)
+            self.assertEqual(channel.published, [('emails.delay.5000', 1, body)])
+
+            channel, _ = self.run_worker([body], headers={'x-retries': 1}, max_retries=3)
+            self.assertEqual(channel.published, [('emails.delay.10000', 2, body)])
+
+            channel, _ = self.run_worker([body], headers={'x-retries': 2}, max_retries=3)
+            self.assertEqual(channel.published, [('emails.failed', 3, body)])
+        self.assertEqual(channel.acked, [1])
+        self.assertEqual(channel.nacked, [])
+
+    def test_partial_smtp_failure_retries_only_failed_messages(self):
+        class FlakyConnection:
+            def __init__(self):
+                self.sent = []
+
+            def open(self):
+                pass
+
+            def close(self):
+                pass
+
+            def send_messages(self, messages):
+                if messages[0].to == ['user1@tnimc.ru']:
+                    raise OSError('connection reset')
+                self.sent.extend(message.to[0] for message in messages)
+
+        connection = FlakyConnection()
+        tasks = [{'user_id': user.id, 'action': 'confirmation'} for user in self.users[:3]]
+        with mock.patch('accounts.tasks.email_tasks.get_connection', return_value=connection):
+            failed = send_email_batch(tasks)
+
+        self.assertEqual(failed, {1})
+        self.assertEqual(connection.sent, ['user0@tnimc.ru', 'user2@tnimc.ru'])
+
+    def test_batch_flushes_after_timeout_from_first_message(self):
+        class Clock:
+            now = 0.0
+
+            def __call__(self):
+                return self.now
+
+        clock = Clock()
+        bodies = [json.dumps({'user_id': user.id, 'action': 'confirmation'}) for user in self.users[:6]]
+        with mock.patch('accounts.management.commands.email_worker.time', mock.Mock(monotonic=clock)), \
+                mock.patch.object(EmailWorkerCommand, 'process_batch') as process_batch:
+            self.run_worker(bodies, clock=clock, batch_size=50, batch_timeout=1.0)
+
+        sizes = [len(call.args[1]) for call in process_batch.call_args_list]
+        self.assertEqual(sizes, [4, 2])
+
+
+class EmailRenderingTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг <и> спам', description='Описание & детали',
+            difficulty='easy', category='phishing', author='Отдел ИБ'
+        )
+        self.user = User(first_name='Иван <b>', last_name='Петров & Ко')
+
+    def reference(self, template_name, context):
+        html = render_to_string(template_name, context)
+        return html, strip_tags(html)
+
+    def test_matches_full_template_render(self):
+        self.assertEqual(
+            render_course_subscription_email(self.user, self.course),
+            self.reference('email/course_subscription_email.html', {'user': self.user, 'course': self.course})
+        )
+
+        link = 'https://cyberedu.tnimc.ru/confirm-email/abc&def/'
+        self.assertEqual(
+            render_confirmation_email(self.user, link),
+            self.reference('email/confirmation_email.html', {'user': self.user, 'confirmation_link': link})
+        )
+
+    def test_skeleton_is_reused_for_course(self):
+        users = [User(first_name=f'Имя{i}', last_name=f'Фамилия{i}') for i in range(3)]
+        render_course_subscription_email(users[0], self.course)
+
+        # Замер скорости - команда benchmark_email_rendering, здесь только корректность
+        with mock.patch('accounts.services.email_rendering.get_compiled_template') as compile_template:
+            for user in users:
+                self.assertEqual(
+                    render_course_subscription_email(user, self.course),
+                    self.reference('email/course_subscription_email.html', {'user': user, 'course': self.course})
+                )
+        self.assertFalse(compile_template.called)
+
+    def test_benchmark_command_reports_per_email_cost(self):
+        out = StringIO()
+        call_command('benchmark_email_rendering', count=10, reference_count=5, stdout=out)
+        self.assertIn('us/email', out.getvalue())
+
+
+class ConnectionReuseTests(TestCase):
+    def test_me_keeps_db_connection(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='employee'))
+
+        # Тестовая sqlite в памяти не закрывается, поэтому проверяем сами вызовы close()
+        with mock.patch.object(type(connections['default']), 'close') as close:
+            for _ in range(5):
+                self.assertEqual(client.get('/api/accounts/users/me/').status_code, 200)
+                self.assertEqual(client.get('/api/accounts/profiles/me/').status_code, 200)
+
+        self.assertFalse(close.called)
+
+
+# Кэш, общий для процессов, как в docker-compose (с LocMemCache сессии идут в БД)
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    }
+}
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class SessionCoalescingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='employee')
+        self.client.force_login(self.user)
+
+    def session_writes(self, requests):
+        with CaptureQueriesContext(connections['default']) as ctx:
+            for _ in range(requests):
+                self.assertEqual(self.client.get('/api/accounts/users/me/').status_code, 200)
+        return [
+            query['sql'] for query in ctx.captured_queries
+            if 'django_session' in query['sql'] and not query['sql'].startswith('SELECT')
+        ]
+
+    def test_session_is_not_written_on_every_request(self):
+        writes = self.session_writes(20)
+        self.assertEqual(writes, [])
+
+        # После интервала обновления сессия продлевается одной записью
+        refreshed_at = time.time() + settings.SESSION_REFRESH_INTERVAL
+        with mock.patch('accounts.sessions.time.time', return_value=refreshed_at):
+            self.assertEqual(len(self.session_writes(5)), 1)
+
+    def test_changed_data_is_saved(self):
+        session = self.client.session
+        session['theme'] = 'dark'
+        session.save()
+        self.assertEqual(Session.objects.get().get_decoded()['theme'], 'dark')
+
+    def test_purge_deletes_expired_sessions_in_batches(self):
+        expired = timezone.now() - timedelta(minutes=1)
+        for i in range(5):
+            Session.objects.create(session_key=f'expired{i}', session_data='', expire_date=expired)
+
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, pause=0, stdout=out)
+        self.assertIn('Purged 5', out.getvalue())
+        self.assertEqual(Session.objects.count(), 1)
+
+
+class LocalCacheSessionTests(TestCase):
+    def test_process_local_cache_falls_back_to_db(self):
+        user = User.objects.create(username='employee')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/api/accounts/users/me/').status_code, 200)
+
+        # Выход в другом воркере удаляет только строку в БД
+        Session.objects.all().delete()
+        self.assertEqual(self.client.get('/api/accounts/users/me/').status_code, 403)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    CACHES=SHARED_CACHES
+)
+class AuthQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='employee', password='secret-pass')
+        self.user.profile.email_confirmed = True
+        self.user.profile.branch = 'cardio'
+        self.user.profile.save()
+
+    def login(self):
+        return self.client.post(
+            '/api/accounts/login/',
+            {'username': 'employee', 'password': 'secret-pass'},
+            content_type='application/json'
+        )
+
+    def test_login_loads_profile_with_user_and_does_not_resave_it(self):
+        # пользователь с профилем, last_login, проверка нового ключа сессии и ее запись
+        # (savepoint + insert + release); профиль не перезаписывается
+        with CaptureQueriesContext(connections['default']) as ctx:
+            self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 6)
+        self.assertFalse(any('accounts_profile' in query['sql'] and 'UPDATE' in query['sql'] for query in ctx.captured_queries))
+
+    def test_me_uses_cached_user_until_it_changes(self):
+        self.login()
+        self.client.get('/api/accounts/users/me/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/accounts/users/me/').json()['username'], 'employee')
+            self.assertEqual(self.client.get('/api/accounts/profiles/me/').json()['branch'], 'cardio')
+
+        profile = Profile.objects.get(user=self.user)
+        profile.branch = 'oncology'
+        profile.save()
+        self.assertEqual(self.client.get('/api/accounts/profiles/me/').json()['branch'], 'oncology')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/accounts/users/me/').status_code, 403)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class StaffImportTests(TestCase):
+    def write_csv(self, lines):
+        path = f'{tempfile.mkdtemp()}/staff.csv'
+        with open(path, 'w', encoding='utf-8-sig') as staff_file:
+            staff_file.write('\n'.join(lines))
+        return path
+
+    def test_import_creates_users_profiles_and_emails_in_bulk(self):
+        User.objects.create(username='taken@tnimc.ru', email='taken@tnimc.ru')
+        rows = ['ФИО;Email;Филиал;Отдел;Должность']
+        rows += [f'Иванов Иван{i} Иванович;worker{i}@tnimc.ru;НИИ Кардиологии;ИТ;Инженер' for i in range(30)]
+        rows += [
+            'Петров Петр;petrov@gmail.com;cardio;ИТ;Инженер',
+            'Сидоров Сидор;taken@tnimc.ru;cardio;ИТ;Инженер',
+            'Смирнов Олег;worker0@tnimc.ru;cardio;ИТ;Инженер',
+        ]
+        credentials_path = f'{tempfile.mkdtemp()}/credentials.csv'
+
+        err = StringIO()
+        with CaptureQueriesContext(connections['default']) as ctx:
+            call_command(
+                'import_staff', self.write_csv(rows), credentials_output=credentials_path,
+                workers=1, stdout=StringIO(), stderr=err
+            )
+        # проверка существующих, вставки users/profiles/outbox - без запросов на каждую строку
+        self.assertLess(len(ctx.captured_queries), 15)
+        self.assertEqual(err.getvalue().count('Line'), 3)
+
+        user = User.objects.select_related('profile').get(username='worker7@tnimc.ru')
+        self.assertEqual((user.last_name, user.first_name), ('Иванов', 'Иван7'))
+        self.assertEqual((user.profile.patronymic, user.profile.branch), ('Иванович', 'cardio'))
+        self.assertTrue(user.profile.email_confirmation_token)
+        self.assertEqual(EmailOutbox.objects.filter(payload__action='confirmation').count(), 30)
+
+        with open(credentials_path, encoding='utf-8-sig') as credentials_file:
+            credentials = dict(line.strip().split(';') for line in credentials_file.readlines()[1:])
+        self.assertEqual(len(credentials), 30)
+        self.assertTrue(user.check_password(credentials['worker7@tnimc.ru']))
+
+    def test_admin_upload_rejects_file_with_errors(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@tnimc.ru', 'secret')
+        self.client.force_login(admin_user)
+        url = '/admin/auth/user/import-staff/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        upload = SimpleUploadedFile('staff.csv', 'Фамилия,Имя,Email\nПетров,Петр,petrov@gmail.com\n'.encode())
+        response = self.client.post(url, {'staff_file': upload})
+        self.assertContains(response, 'petrov@gmail.com')
+        self.assertFalse(User.objects.filter(email='petrov@gmail.com').exists())
+
+        upload = SimpleUploadedFile('staff.csv', 'Фамилия,Имя,Email\nПетров,Петр,petrov@tnimc.ru\n'.encode())
+        response = self.client.post(url, {'staff_file': upload})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('petrov@tnimc.ru', response.content.decode('utf-8-sig'))
+
+    @override_settings(STAFF_IMPORT_ADMIN_MAX_ROWS=1)
+    def test_admin_upload_is_limited_in_size(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@tnimc.ru', 'secret'))
+        upload = SimpleUploadedFile(
+            'staff.csv', 'Фамилия,Имя,Email\nПетров,Петр,petrov@tnimc.ru\nИванов,Иван,ivanov@tnimc.ru\n'.encode()
+        )
+        response = self.client.post('/admin/auth/user/import-staff/', {'staff_file': upload})
+        self.assertContains(response, 'import_staff')
+        self.assertFalse(User.objects.filter(email__endswith='@tnimc.ru').exclude(username='admin').exists())
+
+    def test_command_reports_unreadable_file(self):
+        for content in (b'\xff\xfe\xfa broken', 'Email\nivanov@tnimc.ru\n'.encode()):
+            path = f'{tempfile.mkdtemp()}/staff.csv'
+            with open(path, 'wb') as staff_file:
+                staff_file.write(content)
+            with self.assertRaises(CommandError):
+                call_command('import_staff', path, dry_run=True, stdout=StringIO())
+
+    def test_passwords_are_hashed_in_process_pool(self):
+        from .services.staff_import import hash_passwords
+
+        hashes = hash_passwords([f'password{i}' for i in range(100)], workers=2)
+        self.assertEqual(len(set(hashes)), 100)
+        self.assertTrue(check_password('password42', hashes[42]))
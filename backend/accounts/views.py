@@ -2,7 +2,7 @@ import time
 from rest_framework import viewsets, permissions, generics, status
 from rest_framework.exceptions import PermissionDenied
 from django.contrib.auth import authenticate, login, logout
-from django.db import connection 
+from django.db import transaction
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -17,7 +17,8 @@ from .serializers import (
     generate_confirmation_token
 )
 # from .services.email_service import send_email
-from accounts.rabbitmq import publish_email_task
+from accounts.outbox import enqueue_email_task
+from cyber_edu.pagination import KeysetPagination
 
 
 @api_view(['GET'])
@@ -52,15 +53,16 @@ class ResendConfirmationView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            user.profile.email_confirmation_token = generate_confirmation_token()
-            user.profile.save()
-            
-            task_data = {
-                'user_id': user.id,
-                'action': 'confirmation'
-            }
-
-            publish_email_task(task_data)
+            with transaction.atomic():
+                user.profile.email_confirmation_token = generate_confirmation_token()
+                user.profile.save()
+                
+                task_data = {
+                    'user_id': user.id,
+                    'action': 'confirmation'
+                }
+
+                enqueue_email_task(task_data)
             # send_email(user, action='confirmation')
             
             return Response(
@@ -134,28 +136,14 @@ class LogoutView(APIView):
 class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    filterset_fields = ['is_active', 'profile__branch', 'profile__department']
     
     def get_queryset(self):
-        connection.close()
-
         if self.request.user.is_superuser:
             return User.objects.all().select_related('profile').order_by('id')
         return User.objects.filter(id=self.request.user.id).select_related('profile')
     
-    def list(self, request, *args, **kwargs):
-        connection.close()
-
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'count': queryset.count(),
-            'results': serializer.data
-        })
-    
-    def retrieve(self, request, *args, **kwargs):
-        connection.close()
-        return super().retrieve(request, *args, **kwargs)
-    
     def perform_update(self, serializer):
         if self.request.user.is_superuser or serializer.instance == self.request.user:
             serializer.save()
@@ -164,8 +152,6 @@ class UserViewSet(viewsets.ModelViewSet):
         
     @action(detail=False, methods=['GET'])
     def me(self, request):
-        connection.close()
-
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
@@ -175,8 +161,6 @@ class ProfileViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        connection.close()
-
         if self.request.user.is_superuser:
             return Profile.objects.all().select_related('user')
         return Profile.objects.filter(user=self.request.user).select_related('user')
@@ -189,8 +173,6 @@ class ProfileViewSet(viewsets.ModelViewSet):
         
     @action(detail=False, methods=['GET'])
     def me(self, request):
-        connection.close()
-        
         profile = request.user.profile
         serializer = self.get_serializer(profile)
         return Response(serializer.data)
\ No newline at end of file
@@ -4,9 +4,11 @@ from .models import (
     Course, LearningMaterial, Test, 
     Question, AnswerOption, 
     CourseProgress, UserAnswer,
-    SelectedAnswer, QuestionImage
+    SelectedAnswer, QuestionImage,
+    TestAttemptResult, ComplianceRollup
 )
 from django.utils.safestring import mark_safe
+from .services.images import pick_derivative
 
 
 class LearningMaterialInline(admin.TabularInline):
@@ -66,7 +68,10 @@ class QuestionImageAdmin(admin.ModelAdmin):
 
     def image_preview(self, obj):
         if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" style="max-height: 100px; max-width: 100px;" />')
+            # В списке показывается самая маленькая версия, если она уже создана
+            derivative = pick_derivative(obj, 'jpeg', 100)
+            url = obj.image.storage.url(derivative['name']) if derivative else obj.image.url
+            return mark_safe(f'<img src="{url}" style="max-height: 100px; max-width: 100px;" />')
         return "Нет изображения"
     
     image_preview.short_description = 'Превью'
@@ -111,12 +116,25 @@ class CourseProgressAdmin(admin.ModelAdmin):
     list_filter = ('status', 'course')
     search_fields = ('user__username', 'course__title')
 
+@admin.register(ComplianceRollup)
+class ComplianceRollupAdmin(admin.ModelAdmin):
+    list_display = ('course', 'branch', 'department', 'status', 'count')
+    list_filter = ('status', 'branch', 'course')
+    list_select_related = ('course',)
+
 @admin.register(UserAnswer)
 class UserAnswerAdmin(admin.ModelAdmin):
     list_display = ('user', 'question', 'points_earned', 'answered_at')
-    list_filter = ('question__test',)
+    list_filter = ('course', 'test')
     search_fields = ('user__username', 'question__text')
 
+@admin.register(TestAttemptResult)
+class TestAttemptResultAdmin(admin.ModelAdmin):
+    list_display = ('user', 'test', 'attempt_number', 'score', 'passed', 'is_latest', 'finished_at')
+    list_filter = ('passed', 'is_latest', 'test')
+    search_fields = ('user__username', 'test__title')
+    list_select_related = ('user', 'test')
+
 @admin.register(SelectedAnswer)
 class SelectedAnswerAdmin(admin.ModelAdmin):
     list_display = (
@@ -132,7 +150,7 @@ class SelectedAnswerAdmin(admin.ModelAdmin):
     list_filter = (
         'is_selected',
         'answer_option__is_correct',
-        'user_answer__question__test',
+        'user_answer__test',
     )
     search_fields = (
         'user_answer__user__username',
@@ -144,6 +162,7 @@ class SelectedAnswerAdmin(admin.ModelAdmin):
         'user_answer',
         'user_answer__question',
         'user_answer__user',
+        'user_answer__test__course',
         'answer_option'
     )
 
@@ -168,11 +187,11 @@ class SelectedAnswerAdmin(admin.ModelAdmin):
     is_correct_option.admin_order_field = 'answer_option__is_correct'
 
     def get_test(self, obj):
-        return obj.user_answer.question.test.title
+        return obj.user_answer.test.title if obj.user_answer.test else ''
     get_test.short_description = 'Test'
-    get_test.admin_order_field = 'user_answer__question__test__title'
+    get_test.admin_order_field = 'user_answer__test__title'
 
     def get_course(self, obj):
-        return obj.user_answer.question.test.course.title
+        return obj.user_answer.test.course.title if obj.user_answer.test else ''
     get_course.short_description = 'Course'
-    get_course.admin_order_field = 'user_answer__question__test__course__title'
\ No newline at end of file
+    get_course.admin_order_field = 'user_answer__course__title'
\ No newline at end of file
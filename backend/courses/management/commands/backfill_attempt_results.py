@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef, Sum, Max
+from courses.models import Test, UserAnswer, TestAttemptResult
+
+
+class Command(BaseCommand):
+    """Команда для заполнения TestAttemptResult по существующим ответам"""
+    help = 'Backfill TestAttemptResult rows from existing UserAnswer history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        passing_scores = dict(Test.objects.values_list('id', 'passing_score'))
+
+        # Пары (user, test), у которых уже есть результаты, пропускаются целиком:
+        # иначе рядом с существующей последней попыткой появилась бы вторая
+        # строка с is_latest=True. Поэтому команду можно запускать повторно.
+        # Строки отсортированы так, что последняя попытка пары (user, test)
+        # идет последней - по смене пары определяется is_latest
+        rows = (
+            UserAnswer.objects
+            .filter(~Exists(TestAttemptResult.objects.filter(
+                user_id=OuterRef('user_id'), test_id=OuterRef('question__test_id')
+            )))
+            .values('user_id', 'question__test_id', 'attempt_number')
+            .annotate(total_score=Sum('points_earned'), finished_at=Max('answered_at'))
+            .order_by('user_id', 'question__test_id', 'attempt_number')
+            .iterator(chunk_size=batch_size)
+        )
+
+        batch = []
+        created = 0
+        previous = None
+
+        for row in rows:
+            pair = (row['user_id'], row['question__test_id'])
+            if previous is not None and previous.user_id == pair[0] and previous.test_id == pair[1]:
+                previous.is_latest = False
+
+            previous = TestAttemptResult(
+                user_id=row['user_id'],
+                test_id=row['question__test_id'],
+                attempt_number=row['attempt_number'],
+                score=row['total_score'] or 0,
+                passed=(row['total_score'] or 0) >= passing_scores.get(row['question__test_id'], 0),
+                is_latest=True,
+                finished_at=row['finished_at']
+            )
+            batch.append(previous)
+
+            # Последний элемент пачки оставляем, пока не станет ясно, последняя ли это попытка
+            if len(batch) > batch_size:
+                created += self.flush(batch[:-1])
+                batch = batch[-1:]
+
+        created += self.flush(batch)
+        self.stdout.write(self.style.SUCCESS(f'Processed {created} attempt results'))
+
+    def flush(self, batch):
+        # Защита от гонки с отправкой ответов во время переноса
+        TestAttemptResult.objects.bulk_create(batch, ignore_conflicts=True)
+        self.stdout.write(f'  ... {len(batch)} rows')
+        return len(batch)
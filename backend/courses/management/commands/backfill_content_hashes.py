@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from cyber_edu.protected_media import store_content_hash
+
+# Модели с защищенными файлами: (модель, поле файла, поле хэша)
+HASHED_FILES = [
+    ('courses.learningmaterial', 'content_file', 'content_hash'),
+    ('documents.document', 'file', 'content_hash'),
+]
+
+
+class Command(BaseCommand):
+    """Команда для расчета хэшей (ETag) файлов, загруженных до их появления"""
+    help = 'Compute content hashes for protected files that do not have one yet'
+
+    def handle(self, *args, **options):
+        for model_label, file_field, hash_field in HASHED_FILES:
+            model = apps.get_model(model_label)
+            pks = list(
+                model.objects.filter(**{hash_field: ''})
+                .exclude(**{file_field: ''})
+                .values_list('pk', flat=True)
+            )
+            hashed = sum(
+                1 for pk in pks
+                if store_content_hash(model_label, pk, file_field, hash_field)
+            )
+            self.stdout.write(self.style.SUCCESS(f'{model_label}: {hashed} file(s) hashed'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, OuterRef, Subquery
+from courses.models import Question, UserAnswer
+
+
+class Command(BaseCommand):
+    """Команда для заполнения test и course у ответов, сохраненных до их появления"""
+    help = 'Backfill UserAnswer.test and UserAnswer.course in id-range batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = UserAnswer.objects.aggregate(last=Max('id'))['last'] or 0
+        question = Question.objects.filter(pk=OuterRef('question_id'))
+
+        # Каждая пачка - отдельный короткий UPDATE по диапазону первичного ключа
+        updated = 0
+        for start in range(0, last_id + 1, batch_size):
+            updated += UserAnswer.objects.filter(
+                id__gte=start,
+                id__lt=start + batch_size,
+                test__isnull=True
+            ).update(
+                test_id=Subquery(question.values('test_id')[:1]),
+                course_id=Subquery(question.values('test__course_id')[:1])
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} answer(s)'))
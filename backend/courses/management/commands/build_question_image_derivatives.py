@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from courses.models import QuestionImage
+from courses.tasks.image_tasks import build_question_image_derivatives_sync
+
+
+class Command(BaseCommand):
+    """Команда для создания производных изображений вопросов"""
+    help = 'Build resized WebP/JPEG derivatives for question images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild derivatives that are already up to date')
+
+    def handle(self, *args, **options):
+        built = 0
+        for question_image in QuestionImage.objects.exclude(image='').exclude(image__isnull=True).iterator():
+            if not options['all'] and question_image.derivatives.get('source') == question_image.image.name:
+                continue
+            try:
+                build_question_image_derivatives_sync(question_image.id)
+                built += 1
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Question image {question_image.id}: {e}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Built derivatives for {built} image(s)"))
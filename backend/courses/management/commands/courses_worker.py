@@ -0,0 +1,80 @@
+import json
+import pika
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from cyber_edu.db import refresh_db_connection
+from accounts.rabbitmq import retry_or_dead_letter
+from cyber_edu.protected_media import store_content_hash
+from courses.tasks.progress_tasks import recompute_course_progress_sync
+from courses.tasks.image_tasks import build_question_image_derivatives_sync
+from courses.tasks.delivery_tasks import warm_test_delivery_sync
+from courses.tasks.export_tasks import build_progress_export_sync
+
+TASK_HANDLERS = {
+    'recompute_course_progress': lambda task_data: recompute_course_progress_sync(task_data['course_id']),
+    'build_question_image_derivatives': lambda task_data: build_question_image_derivatives_sync(task_data['image_id']),
+    'warm_test_delivery': lambda task_data: warm_test_delivery_sync(task_data['course_id']),
+    'build_progress_export': lambda task_data: build_progress_export_sync(task_data['export_id']),
+    'compute_content_hash': lambda task_data: store_content_hash(
+        task_data['model'], task_data['pk'], task_data['file_field'], task_data['hash_field']
+    ),
+}
+
+class Command(BaseCommand):
+    help = 'Starts a RabbitMQ consumer for deferred course tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-retries', type=int, default=5, help='Failed attempts before a task is dead-lettered')
+
+    def handle(self, *args, **options):
+        queue = settings.RABBITMQ_COURSES_QUEUE
+        max_retries = options['max_retries']
+
+        def callback(ch, method, properties, body):
+            """
+            Функция, которая вызывается при получении сообщения из очереди.
+            Сообщение подтверждается всегда: при prefetch_count=1 неподтвержденное
+            задание остановило бы воркер. Упавшее задание возвращается в очередь
+            через очередь задержки, после max_retries попыток - в <queue>.failed.
+            """
+            self.stdout.write(self.style.SUCCESS(f" [x] Received {body}"))
+            # Постоянное соединение с БД проверяется перед каждым заданием
+            refresh_db_connection()
+            try:
+                task_data = json.loads(body)
+            except ValueError:
+                self.stdout.write(self.style.ERROR(f"Invalid task payload: {body!r}"))
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
+            try:
+                handler = TASK_HANDLERS.get(task_data.get('action'))
+                if handler is None:
+                    self.stdout.write(self.style.ERROR(f"Unknown action: {task_data.get('action')}"))
+                else:
+                    handler(task_data)
+                    self.stdout.write(self.style.SUCCESS(f" [x] Task {task_data.get('action')} processed"))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Error processing task: {e}"))
+                if retry_or_dead_letter(ch, queue, properties, body, max_retries):
+                    self.stdout.write(self.style.ERROR(f"Task dead-lettered after {max_retries} attempts: {body!r}"))
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
+        connection = pika.BlockingConnection(
+            pika.ConnectionParameters(
+                host=settings.RABBITMQ_HOST,
+                port=settings.RABBITMQ_PORT,
+                credentials=pika.PlainCredentials(settings.RABBITMQ_USERNAME, settings.RABBITMQ_PASSWORD)
+            )
+        )
+        channel = connection.channel()
+        channel.queue_declare(queue=queue, durable=True)
+
+        channel.basic_qos(prefetch_count=1)
+        channel.basic_consume(queue=queue, on_message_callback=callback)
+
+        self.stdout.write(self.style.SUCCESS(' [*] Courses worker waiting for messages. To exit press CTRL+C'))
+        try:
+            channel.start_consuming()
+        except KeyboardInterrupt:
+            channel.stop_consuming()
+        connection.close()
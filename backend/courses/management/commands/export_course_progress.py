@@ -0,0 +1,40 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from courses.services.exports import EXPORT_FORMATS, progress_export_rows, iter_csv, write_xlsx
+
+
+class Command(BaseCommand):
+    """Команда для выгрузки прогресса по курсам с баллами последних попыток"""
+    help = 'Export course progress with latest test scores to CSV or XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, help='Course id, all courses by default')
+        parser.add_argument('--branch')
+        parser.add_argument('--department')
+        parser.add_argument('--status', choices=['not_started', 'in_progress', 'completed'])
+        parser.add_argument('--type', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help='Output file, CSV goes to stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = progress_export_rows(
+            course_id=options['course'],
+            branch=options['branch'],
+            department=options['department'],
+            status=options['status'],
+            chunk_size=options['chunk_size'],
+        )
+
+        if options['type'] == 'xlsx':
+            if not options['output']:
+                raise CommandError('--output is required for XLSX export')
+            with open(options['output'], 'wb') as output:
+                write_xlsx(rows, output)
+        elif options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(iter_csv(rows))
+        else:
+            sys.stdout.writelines(iter_csv(rows))
+
+        if options['output']:
+            self.stderr.write(self.style.SUCCESS(f"Progress exported to {options['output']}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from courses.services.compliance import rebuild_compliance_rollups
+
+
+class Command(BaseCommand):
+    """Команда для полного пересчета сводки прохождения курсов по филиалам и отделам"""
+    help = 'Rebuild compliance rollups from course progress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, help='Course id, all courses by default')
+
+    def handle(self, *args, **options):
+        groups = rebuild_compliance_rollups(course_id=options['course'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {groups} rollup rows'))
@@ -1,10 +1,17 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, post_delete
+from accounts.models import Profile
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.conf import settings
 # from accounts.services.email_service import send_email
-from accounts.rabbitmq import publish_email_task
+from accounts.outbox import enqueue_email_task
+from cyber_edu.protected_media import file_content_hash
+from cyber_edu.response_cache import schedule_content_version_bump
+from .services.answer_key import schedule_answer_key_invalidation, invalidate_question_image_tests
+from .services.images import delete_derivatives
+from .tasks.progress_tasks import mark_course_dirty
+from .tasks.image_tasks import publish_question_image_derivatives
 from django.utils import timezone
 
 class Course(models.Model):
@@ -38,11 +45,28 @@ class LearningMaterial(models.Model):
     material_type = models.CharField(max_length=20, choices=MATERIAL_TYPE_CHOICES)
     content_url = models.URLField(blank=True, null=True)
     content_file = models.FileField(upload_to='media/', blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        # Хэш считается при загрузке нового файла, пока он еще не сохранен
+        if not self.content_file:
+            self.content_hash = ''
+        elif not self.content_file._committed:
+            self.content_hash = file_content_hash(self.content_file)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.get_material_type_display()} для курса '{self.course.title}'"
 
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=LearningMaterial)
+@receiver(post_delete, sender=LearningMaterial)
+def bump_catalog_version(sender, **kwargs):
+    """Сбрасывает закэшированные списки курсов и материалов"""
+    schedule_content_version_bump(sender)
+
 class Test(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='tests')
     title = models.CharField(max_length=200)
@@ -57,24 +81,16 @@ class Test(models.Model):
         Test.objects.filter(pk=self.pk).update(max_score=self.max_score)
 
     def is_passed_by_user(self, user):
-        last_attempt = UserAnswer.objects.filter(
+        last_result = TestAttemptResult.objects.filter(
             user=user,
-            question__test=self
-        ).order_by('-attempt_number').first()
-        
-        if not last_attempt:
+            test=self,
+            is_latest=True
+        ).values_list('score', flat=True).first()
+
+        if last_result is None:
             return False
-            
-        total_score = sum(
-            answer.points_earned 
-            for answer in UserAnswer.objects.filter(
-                user=user,
-                question__test=self,
-                attempt_number=last_attempt.attempt_number
-            )
-        )
-        
-        return total_score >= self.passing_score
+
+        return last_result >= self.passing_score
     
     def __str__(self):
         return f"Тест: {self.title} (Курс: {self.course.title})"
@@ -83,11 +99,32 @@ class Test(models.Model):
 class QuestionImage(models.Model):
     title = models.TextField()
     image = models.ImageField(upload_to='questions/', null=True, blank=True)
+    # Уменьшенные WebP/JPEG версии, создаются воркером курсов
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.title}"
 
 
+@receiver(post_save, sender=QuestionImage)
+def schedule_question_image_derivatives(sender, instance, **kwargs):
+    """Ставит создание производных в очередь, если загружено новое изображение"""
+    invalidate_question_image_tests(instance.pk)
+    if not instance.image:
+        if instance.derivatives:
+            delete_derivatives(instance)
+            QuestionImage.objects.filter(pk=instance.pk).update(derivatives={})
+        return
+    if instance.derivatives.get('source') == instance.image.name:
+        return
+    transaction.on_commit(lambda: publish_question_image_derivatives(instance.pk))
+
+@receiver(post_delete, sender=QuestionImage)
+def delete_question_image_derivatives(sender, instance, **kwargs):
+    if instance.derivatives:
+        delete_derivatives(instance)
+
+
 class Question(models.Model):
     QUESTION_TYPE_CHOICES = [
         ('single', 'Одиночный выбор'),
@@ -108,9 +145,19 @@ class Question(models.Model):
 @receiver(post_save, sender=Question)
 @receiver(post_delete, sender=Question)
 def update_test_max_score(sender, instance, **kwargs):
-    """Обновляет max_score теста при изменении связанных вопросов"""
-    test = instance.test
-    test.save()
+    """
+    Обновляет max_score теста при изменении связанных вопросов
+    и помечает курс для пересчета прогресса.
+    Тест не сохраняется целиком, чтобы не запускать его сигналы повторно.
+    """
+    max_score = Question.objects.filter(test_id=instance.test_id).aggregate(
+        total=models.Sum('points')
+    )['total'] or 0
+    Test.objects.filter(pk=instance.test_id).update(max_score=max_score)
+
+    course_id = Test.objects.filter(pk=instance.test_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        mark_course_dirty(course_id)
 
 
 class AnswerOption(models.Model):
@@ -121,6 +168,23 @@ class AnswerOption(models.Model):
     def __str__(self):
         return f"Вариант: {self.text[:50]}... ({'✓' if self.is_correct else '✗'})"
 
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_test_answer_key(sender, instance, **kwargs):
+    """Сбрасывает кэшированный ключ ответов теста при изменении теста или вопросов"""
+    test_id = instance.pk if sender is Test else instance.test_id
+    schedule_answer_key_invalidation(test_id)
+
+@receiver(post_save, sender=AnswerOption)
+@receiver(post_delete, sender=AnswerOption)
+def invalidate_option_answer_key(sender, instance, **kwargs):
+    """Сбрасывает кэшированный ключ ответов теста при изменении вариантов ответа"""
+    test_id = Question.objects.filter(pk=instance.question_id).values_list('test_id', flat=True).first()
+    if test_id is not None:
+        schedule_answer_key_invalidation(test_id)
+
 class CourseProgress(models.Model):
     STATUS_CHOICES = [
         ('not_started', 'Не начат'),
@@ -138,49 +202,42 @@ class CourseProgress(models.Model):
 
     class Meta:
         unique_together = ('course', 'user')
+        indexes = [
+            # Постраничная выборка прогресса по курсу (keyset по id)
+            models.Index(fields=['course', 'id'], name='progress_course_id_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.score = sum(test.passing_score for test in self.course.tests.all())
         super().save(*args, **kwargs)
 
     def check_tests_completion(self):
-        from .models import Test  # избегаем циклического импорта
-        
-        tests = Test.objects.filter(course=self.course)
-        if not tests.exists():
+        tests_count = Test.objects.filter(course_id=self.course_id).count()
+        if not tests_count:
             return False
-            
-        return all(
-            test.is_passed_by_user(self.user)
-            for test in tests
-        )
+
+        passed_count = TestAttemptResult.objects.filter(
+            user_id=self.user_id,
+            test__course_id=self.course_id,
+            is_latest=True,
+            score__gte=models.F('test__passing_score')
+        ).count()
+
+        return passed_count == tests_count
     
     def check_and_update_status(self):
         """
         Проверяет выполнение тестов и обновляет статус прогресса
         """
-        was_completed = self.status == 'completed'
-        tests_completed = self.check_tests_completion()
-        
-        if tests_completed:
-            self.status = 'completed'
-            self.progress_percent = 100
-            if not self.completed_at:
-                self.completed_at = timezone.now()
-        else:
-            if was_completed:
-                self.status = 'in_progress'
-                self.completed_at = None
-            
-            # Пересчитываем процент выполнения
-            if self.score > 0:
-                # Получаем текущие баллы пользователя
-                user_answers = UserAnswer.objects.filter(
-                    user=self.user,
-                    question__test__course=self.course
-                )
-                total_score_earned = sum(answer.points_earned for answer in user_answers)
-                self.progress_percent = min(100, int((total_score_earned / self.score) * 100))
+        from .services.progress import apply_progress, latest_attempt_scores  # избегаем циклического импорта
+
+        tests = list(
+            Test.objects.filter(course_id=self.course_id)
+            .order_by('id')
+            .values_list('id', 'passing_score')
+        )
+        scores = latest_attempt_scores(self.course_id, user_ids=[self.user_id])
+        apply_progress(self, tests, scores, timezone.now())
         
         self.save()
 
@@ -188,46 +245,20 @@ class CourseProgress(models.Model):
         return f"Прогресс: {self.user.username} → {self.course.title} ({self.get_status_display()}, {self.progress_percent}%)"
 
 @receiver(post_save, sender=Test)
-def update_course_progress_on_test_change(sender, instance, created, **kwargs):
+@receiver(post_delete, sender=Test)
+def update_course_progress_on_test_change(sender, instance, **kwargs):
     """
-    Пересчитывает прогресс курса при изменении теста
+    Помечает курс для пересчета прогресса при изменении или удалении теста
     """
-    if not created:  # Если это обновление существующего теста
-        course = instance.course
-        update_course_progress_for_all_users(course)
-
-@receiver(post_save, sender=Question)
-@receiver(post_delete, sender=Question)
-def update_test_max_score_and_progress(sender, instance, **kwargs):
-    """Обновляет max_score теста и пересчитывает прогресс"""
-    test = instance.test
-    test.save()  # Это вызовет save() теста, который триггерит сигнал выше
-    
-    # Или можно явно вызвать пересчет
-    update_course_progress_for_all_users(test.course)
+    mark_course_dirty(instance.course_id)
 
 def update_course_progress_for_all_users(course):
     """
-    Пересчитывает прогресс курса для всех пользователей
+    Пересчитывает прогресс курса для всех пользователей.
+    Пересчет выполняется воркером курсов после фиксации транзакции,
+    а не внутри запроса администратора.
     """
-    progresses = CourseProgress.objects.filter(course=course)
-    
-    for progress in progresses:
-        progress.save()  # Это вызовет пересчет score
-        progress.check_and_update_status()
-        
-@receiver(post_save, sender=Test)
-@receiver(post_delete, sender=Test)
-def update_course_progress_score(sender, instance, **kwargs):
-    course = instance.course
-    total_passing_score = sum(test.passing_score for test in course.tests.all())
-
-    progresses = CourseProgress.objects.filter(course=course)
-
-    for progress in progresses:
-        progress.score = total_passing_score
-
-    CourseProgress.objects.bulk_update(progresses, ['score'])
+    mark_course_dirty(course.id)
 
 @receiver(post_save, sender=CourseProgress)
 def send_notification_about_subscription(sender, instance, created, **kwargs):
@@ -241,14 +272,81 @@ def send_notification_about_subscription(sender, instance, created, **kwargs):
                 'action': 'course_subscription'
             }
 
-        publish_email_task(task_data)
+        enqueue_email_task(task_data)
         
         # send_email(user, course=course, action='course_subscription')
 
 
+class ComplianceRollup(models.Model):
+    """
+    Сводные счетчики подписок по курсу, филиалу, отделу и статусу.
+    Поддерживаются при изменении прогресса, дашборд читает только их;
+    расхождения исправляет команда rebuild_compliance_rollups.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='compliance_rollups')
+    branch = models.CharField(max_length=50, blank=True, default='')
+    department = models.CharField(max_length=100, blank=True, default='')
+    status = models.CharField(max_length=20, choices=CourseProgress.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('course', 'branch', 'department', 'status')
+
+    def __str__(self):
+        return f"{self.course_id} / {self.branch or '-'} / {self.department or '-'}: {self.status} = {self.count}"
+
+@receiver(post_init, sender=CourseProgress)
+def remember_loaded_status(sender, instance, **kwargs):
+    # Через __dict__, чтобы не подгружать отложенное поле отдельным запросом
+    instance._loaded_status = instance.__dict__.get('status')
+
+@receiver(post_save, sender=CourseProgress)
+def update_compliance_rollup(sender, instance, created, **kwargs):
+    from .services.compliance import record_status_changes  # избегаем циклического импорта
+
+    old_status = None if created else instance._loaded_status
+    if created or old_status is not None:
+        record_status_changes([(instance.course_id, instance.user_id, old_status, instance.status)])
+    instance._loaded_status = instance.status
+
+@receiver(pre_delete, sender=CourseProgress)
+def decrease_compliance_rollup(sender, instance, **kwargs):
+    # pre_delete: при удалении пользователя профиль еще существует и группа известна
+    from .services.compliance import record_status_changes
+
+    record_status_changes([(instance.course_id, instance.user_id, instance.status, None)])
+
+@receiver(post_init, sender=Profile)
+def remember_loaded_group(sender, instance, **kwargs):
+    if 'branch' in instance.__dict__ and 'department' in instance.__dict__:
+        instance._loaded_group = (instance.branch, instance.department)
+    else:
+        instance._loaded_group = None
+
+@receiver(post_save, sender=Profile)
+def move_compliance_rollup(sender, instance, created, **kwargs):
+    """Переносит подписки пользователя в сводке при смене филиала или отдела"""
+    from .services.compliance import move_user_group
+
+    loaded = instance._loaded_group
+    if loaded is None:
+        # Профиль загружен без этих полей - прежняя группа неизвестна
+        return
+    group = (instance.branch, instance.department)
+    instance._loaded_group = group
+    if created or loaded == group:
+        return
+    move_user_group(instance.user_id, (loaded[0] or '', loaded[1] or ''), (group[0] or '', group[1] or ''))
+
+
 class UserAnswer(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='answers')
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='user_answers')
+    # Копии question.test и question.test.course, чтобы выборки по тесту и курсу
+    # шли по индексам без join через Question и Test (заполняются при записи,
+    # старые строки - командой backfill_user_answer_tests)
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='user_answers', null=True, blank=True, editable=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='user_answers', null=True, blank=True, editable=False)
     answer_data = models.TextField(blank=True, null=True)
     answered_at = models.DateTimeField(auto_now_add=True)
     points_earned = models.PositiveIntegerField(default=0)
@@ -256,10 +354,50 @@ class UserAnswer(models.Model):
 
     class Meta:
         unique_together = ('user', 'question', 'attempt_number')
+        indexes = [
+            models.Index(fields=['user', 'test', 'attempt_number'], name='answer_user_test_attempt_idx'),
+            models.Index(fields=['user', 'course'], name='answer_user_course_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.question_id and (self.test_id is None or self.course_id is None):
+            self.test_id, self.course_id = Question.objects.filter(
+                pk=self.question_id
+            ).values_list('test_id', 'test__course_id').get()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Ответ: {self.user.username} → {self.question.text[:30]}... (Попытка {self.attempt_number}, {self.points_earned}/{self.question.points} баллов)"
-    
+
+@receiver(post_init, sender=Question)
+def remember_loaded_test(sender, instance, **kwargs):
+    instance._loaded_test_id = instance.__dict__.get('test_id')
+
+@receiver(post_init, sender=Test)
+def remember_loaded_course(sender, instance, **kwargs):
+    instance._loaded_course_id = instance.__dict__.get('course_id')
+
+@receiver(post_save, sender=Question)
+def move_question_answers(sender, instance, created, **kwargs):
+    """Обновляет копии test и course в ответах при переносе вопроса в другой тест"""
+    loaded = instance._loaded_test_id
+    instance._loaded_test_id = instance.test_id
+    if created or loaded is None or loaded == instance.test_id:
+        return
+    UserAnswer.objects.filter(question=instance).update(
+        test_id=instance.test_id,
+        course_id=Test.objects.filter(pk=instance.test_id).values('course_id')[:1]
+    )
+
+@receiver(post_save, sender=Test)
+def move_test_answers(sender, instance, created, **kwargs):
+    """Обновляет копию course в ответах при переносе теста в другой курс"""
+    loaded = instance._loaded_course_id
+    instance._loaded_course_id = instance.course_id
+    if created or loaded is None or loaded == instance.course_id:
+        return
+    UserAnswer.objects.filter(test=instance).update(course_id=instance.course_id)
+
 class SelectedAnswer(models.Model):
     user_answer = models.ForeignKey(UserAnswer, on_delete=models.CASCADE, related_name='selected_answers')
     answer_option = models.ForeignKey(AnswerOption, on_delete=models.CASCADE)
@@ -269,4 +407,52 @@ class SelectedAnswer(models.Model):
         unique_together = ('user_answer', 'answer_option')
 
     def __str__(self):
-        return f"Выбор: {self.user_answer.user.username} → {self.answer_option.text[:30]}... ({'✓' if self.is_selected else '✗'})"
\ No newline at end of file
+        return f"Выбор: {self.user_answer.user.username} → {self.answer_option.text[:30]}... ({'✓' if self.is_selected else '✗'})"
+
+
+class TestAttemptResult(models.Model):
+    """
+    Итог попытки прохождения теста. Пишется один раз при отправке ответов,
+    чтобы не пересчитывать баллы по истории UserAnswer при каждом запросе.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='test_results')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='results')
+    attempt_number = models.PositiveIntegerField()
+    score = models.PositiveIntegerField(default=0)
+    passed = models.BooleanField(default=False)
+    is_latest = models.BooleanField(default=True)
+    finished_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('user', 'test', 'attempt_number')
+        indexes = [
+            models.Index(fields=['user', 'test', 'is_latest'], name='attempt_result_latest_idx'),
+        ]
+
+    def __str__(self):
+        return f"Результат: {self.user.username} → {self.test.title} (Попытка {self.attempt_number}, {self.score} баллов)"
+
+
+class ProgressExport(models.Model):
+    """
+    Выгрузка прогресса в XLSX, которую собирает воркер курсов.
+    Файл книги строится целиком до отдачи, поэтому в запросе администратора
+    он не собирается: запрос создает запись, а готовый файл отдается
+    через serve_protected_file.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('ready', 'Готова'),
+        ('failed', 'Ошибка'),
+    ]
+
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='progress_exports')
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='exports/', null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Выгрузка прогресса {self.id} ({self.get_status_display()})"
@@ -1,11 +1,13 @@
 from rest_framework import serializers
 from django.conf import settings
+from django.urls import reverse
 from .models import (
     Course, LearningMaterial, Test, 
     Question, AnswerOption, CourseProgress,
-    UserAnswer, SelectedAnswer
+    UserAnswer, SelectedAnswer, ProgressExport
 )
 from accounts.serializers import UserSerializer
+from .services.images import FORMATS as IMAGE_FORMATS
 
 class CourseSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,11 +16,19 @@ class CourseSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 class LearningMaterialSerializer(serializers.ModelSerializer):
+    file_url = serializers.SerializerMethodField()
+
     class Meta:
         model = LearningMaterial
         fields = '__all__'
         read_only_fields = ['created_at']
 
+    def get_file_url(self, obj):
+        # Файлы отдаются только через проверку прав, а не напрямую из /media/
+        if not obj.content_file:
+            return None
+        return reverse('materials-download', args=[obj.pk])
+
 class AnswerOptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = AnswerOption
@@ -26,10 +36,40 @@ class AnswerOptionSerializer(serializers.ModelSerializer):
 
 class QuestionSerializer(serializers.ModelSerializer):
     options = AnswerOptionSerializer(many=True, read_only=True)
+    image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Question
         fields = '__all__'
+
+    def get_image_url(self, obj):
+        if not obj.image_id:
+            return None
+        return reverse('questions-image', args=[obj.pk])
+
+    def get_image_srcset(self, obj):
+        """
+        Уменьшенные версии изображения в формате srcset по форматам,
+        чтобы клиент выбрал наименьшую подходящую. None, пока их нет.
+        """
+        if not obj.image_id or not obj.image.image:
+            return None
+        derivatives = obj.image.derivatives
+        if derivatives.get('source') != obj.image.image.name:
+            return None
+
+        url = reverse('questions-image', args=[obj.pk])
+        srcset = {
+            image_format: ', '.join(
+                f"{url}?type={image_format}&width={item['width']} {item['width']}w"
+                for item in derivatives.get(image_format, [])
+            )
+            for image_format in IMAGE_FORMATS
+        }
+        srcset['width'] = derivatives['width']
+        srcset['height'] = derivatives['height']
+        return srcset
     
 
 class TestSerializer(serializers.ModelSerializer):
@@ -39,6 +79,30 @@ class TestSerializer(serializers.ModelSerializer):
         model = Test
         fields = '__all__'
 
+class AnswerOptionDeliverySerializer(serializers.ModelSerializer):
+    """Вариант ответа для прохождения теста - без признака правильности"""
+    class Meta:
+        model = AnswerOption
+        fields = ['id', 'text']
+
+class QuestionDeliverySerializer(QuestionSerializer):
+    options = AnswerOptionDeliverySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Question
+        fields = ['id', 'test', 'text', 'question_type', 'points', 'image', 'image_url', 'image_srcset', 'options']
+
+class TestDeliverySerializer(serializers.ModelSerializer):
+    """
+    Тест в том виде, в котором он выдается сотруднику для прохождения.
+    Собирается один раз на версию теста (services/delivery.py).
+    """
+    questions = QuestionDeliverySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Test
+        fields = ['id', 'course', 'title', 'max_score', 'passing_score', 'time_limit', 'questions']
+
 class SelectedAnswerSerializer(serializers.ModelSerializer):
     class Meta:
         model = SelectedAnswer
@@ -50,7 +114,7 @@ class UserAnswerSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserAnswer
         fields = '__all__'
-        read_only_fields = ['answered_at', 'points_earned']
+        read_only_fields = ['answered_at', 'points_earned', 'test', 'course']
 
 
 class CourseProgressSerializer(serializers.ModelSerializer):
@@ -68,4 +132,18 @@ class CourseProgressSerializer(serializers.ModelSerializer):
             'firstname': obj.user.first_name,
             'lastname': obj.user.last_name,
             'email': obj.user.email
-        }
\ No newline at end of file
+        }
+
+
+class ProgressExportSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProgressExport
+        fields = ['id', 'status', 'params', 'error', 'created_at', 'finished_at', 'download_url']
+
+    def get_download_url(self, obj):
+        # Готовый файл отдается только через проверку прав администратора
+        if obj.status != 'ready' or not obj.file:
+            return None
+        return reverse('progress-export-download', kwargs={'export_id': obj.pk})
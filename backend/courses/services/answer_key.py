@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from cyber_edu.versioning import new_version
+
+
+VERSION_KEY = 'answer_key_version:{test_id}'
+DATA_KEY = 'answer_key:{test_id}:{version}'
+
+_local_keys = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _local_cache_size():
+    return getattr(settings, 'ANSWER_KEY_LOCAL_CACHE_SIZE', 256)
+
+
+def _cache_timeout():
+    return getattr(settings, 'ANSWER_KEY_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def get_answer_key_version(test_id):
+    """Текущая версия ключа ответов теста (общая для всех процессов)"""
+    version_key = VERSION_KEY.format(test_id=test_id)
+    version = cache.get(version_key)
+    if version is None:
+        # Новая версия уникальна, поэтому устаревшие записи
+        # локального кэша не могут случайно совпасть с ней
+        cache.add(version_key, new_version(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def invalidate_answer_key(test_id):
+    """Помечает ключ ответов теста устаревшим во всех процессах"""
+    cache.set(VERSION_KEY.format(test_id=test_id), new_version(), None)
+
+
+def schedule_answer_key_invalidation(test_id):
+    """
+    Сбрасывает ключ сразу и повторно после фиксации транзакции,
+    чтобы параллельный запрос не закэшировал незафиксированное состояние
+    """
+    invalidate_answer_key(test_id)
+    transaction.on_commit(lambda: invalidate_answer_key(test_id))
+
+
+def invalidate_question_image_tests(image_id):
+    """Сбрасывает версии тестов, в вопросах которых используется изображение"""
+    from courses.models import Question
+
+    test_ids = set(Question.objects.filter(image_id=image_id).values_list('test_id', flat=True))
+    for test_id in test_ids:
+        schedule_answer_key_invalidation(test_id)
+
+
+def compile_answer_key(test_id):
+    """
+    Собирает ключ ответов теста двумя запросами:
+    {
+        'max_score': ...,
+        'questions': {question_id: {'type', 'points', 'correct', 'valid'}}
+    }
+    """
+    from courses.models import Question, AnswerOption
+
+    questions = {
+        question_id: {
+            'type': question_type,
+            'points': points,
+            'correct': frozenset(),
+            'valid': frozenset(),
+        }
+        for question_id, question_type, points in Question.objects.filter(
+            test_id=test_id
+        ).values_list('id', 'question_type', 'points')
+    }
+
+    correct = {}
+    valid = {}
+    options = AnswerOption.objects.filter(
+        question__test_id=test_id
+    ).values_list('id', 'question_id', 'is_correct')
+
+    for option_id, question_id, is_correct in options:
+        valid.setdefault(question_id, set()).add(option_id)
+        if is_correct:
+            correct.setdefault(question_id, set()).add(option_id)
+
+    for question_id, entry in questions.items():
+        entry['valid'] = frozenset(valid.get(question_id, ()))
+        entry['correct'] = frozenset(correct.get(question_id, ()))
+
+    return {
+        'max_score': sum(entry['points'] for entry in questions.values()),
+        'questions': questions,
+    }
+
+
+def get_answer_key(test_id):
+    """
+    Возвращает скомпилированный ключ ответов теста.
+    Сначала ищет в локальном LRU процесса, затем в кэше Django,
+    и только потом собирает ключ из базы данных.
+    Возвращаемый словарь общий для всех вызовов - изменять его нельзя.
+    """
+    version = get_answer_key_version(test_id)
+    local_key = (test_id, version)
+
+    with _local_lock:
+        answer_key = _local_keys.get(local_key)
+        if answer_key is not None:
+            _local_keys.move_to_end(local_key)
+            return answer_key
+
+    data_key = DATA_KEY.format(test_id=test_id, version=version)
+    answer_key = cache.get(data_key)
+    if answer_key is None:
+        answer_key = compile_answer_key(test_id)
+        cache.set(data_key, answer_key, _cache_timeout())
+
+    with _local_lock:
+        _local_keys[local_key] = answer_key
+        _local_keys.move_to_end(local_key)
+        while len(_local_keys) > _local_cache_size():
+            _local_keys.popitem(last=False)
+
+    return answer_key
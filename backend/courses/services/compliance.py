@@ -0,0 +1,160 @@
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Count, F
+from accounts.models import Profile
+from courses.models import ComplianceRollup, CourseProgress
+
+BRANCH_NAMES = dict(Profile.BRANCH_CHOICES)
+STATUSES = [status for status, _ in CourseProgress.STATUS_CHOICES]
+
+
+def user_groups(user_ids, chunk_size=2000):
+    """Возвращает {user_id: (branch, department)} по профилям пользователей"""
+    user_ids = list(user_ids)
+    groups = {user_id: ('', '') for user_id in user_ids}
+    for start in range(0, len(user_ids), chunk_size):
+        for user_id, branch, department in Profile.objects.filter(
+            user_id__in=user_ids[start:start + chunk_size]
+        ).values_list('user_id', 'branch', 'department'):
+            groups[user_id] = (branch or '', department or '')
+    return groups
+
+
+def apply_deltas(deltas):
+    """
+    Применяет изменения счетчиков {(course_id, branch, department, status): delta}.
+    Счетчики меняются через F(), поэтому одновременные изменения не теряются.
+    Недостающие строки создаются одним bulk_create и только при увеличении:
+    уменьшение может прийти при каскадном удалении курса, когда его сводные
+    строки уже удалены.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    ComplianceRollup.objects.bulk_create([
+        ComplianceRollup(course_id=course_id, branch=branch, department=department, status=status)
+        for (course_id, branch, department, status), delta in deltas.items()
+        if delta > 0
+    ], ignore_conflicts=True)
+    for (course_id, branch, department, status), delta in deltas.items():
+        ComplianceRollup.objects.filter(
+            course_id=course_id, branch=branch, department=department, status=status
+        ).update(count=F('count') + delta)
+
+
+def record_status_changes(changes):
+    """
+    Учитывает смену статусов прогресса.
+    changes - список (course_id, user_id, old_status, new_status); None в old_status
+    означает новую подписку, None в new_status - удаление подписки.
+    """
+    changes = [change for change in changes if change[2] != change[3]]
+    if not changes:
+        return
+    groups = user_groups({user_id for _, user_id, _, _ in changes})
+
+    deltas = Counter()
+    for course_id, user_id, old_status, new_status in changes:
+        branch, department = groups[user_id]
+        if old_status is not None:
+            deltas[(course_id, branch, department, old_status)] -= 1
+        if new_status is not None:
+            deltas[(course_id, branch, department, new_status)] += 1
+
+    with transaction.atomic():
+        apply_deltas(deltas)
+
+
+def move_user_group(user_id, old_group, new_group):
+    """Переносит подписки пользователя в другую группу при смене филиала или отдела"""
+    deltas = Counter()
+    for course_id, status in CourseProgress.objects.filter(user_id=user_id).values_list('course_id', 'status'):
+        deltas[(course_id, *old_group, status)] -= 1
+        deltas[(course_id, *new_group, status)] += 1
+
+    with transaction.atomic():
+        apply_deltas(deltas)
+
+
+def rebuild_compliance_rollups(course_id=None):
+    """Пересчитывает сводку по всем подпискам (или по одному курсу) одним агрегирующим запросом"""
+    progress = CourseProgress.objects.all()
+    if course_id:
+        progress = progress.filter(course_id=course_id)
+
+    rows = progress.values(
+        'course_id', 'status',
+        branch=F('user__profile__branch'),
+        department=F('user__profile__department'),
+    ).annotate(total=Count('id')).order_by()
+
+    counts = Counter()
+    for row in rows:
+        counts[(row['course_id'], row['branch'] or '', row['department'] or '', row['status'])] += row['total']
+
+    with transaction.atomic():
+        rollups = ComplianceRollup.objects.all()
+        if course_id:
+            rollups = rollups.filter(course_id=course_id)
+        rollups.delete()
+        ComplianceRollup.objects.bulk_create([
+            ComplianceRollup(course_id=course, branch=branch, department=department, status=status, count=count)
+            for (course, branch, department, status), count in counts.items()
+        ], batch_size=1000)
+    return len(counts)
+
+
+def summarize(counts):
+    total = sum(counts.values())
+    return {
+        **{status: counts.get(status, 0) for status in STATUSES},
+        'total': total,
+        'completion_rate': round(counts.get('completed', 0) * 100 / total, 1) if total else 0,
+    }
+
+
+def compliance_dashboard(course_id=None, branch=None):
+    """
+    Доля прохождения курсов по филиалам и отделам.
+    Читает только сводную таблицу, подписки не сканируются.
+    """
+    rollups = ComplianceRollup.objects.filter(count__gt=0).select_related('course').order_by(
+        'course_id', 'branch', 'department'
+    )
+    if course_id:
+        rollups = rollups.filter(course_id=course_id)
+    if branch:
+        rollups = rollups.filter(branch=branch)
+
+    courses = {}
+    course_counts = defaultdict(Counter)
+    branch_counts = defaultdict(lambda: defaultdict(Counter))
+    group_counts = defaultdict(lambda: defaultdict(Counter))
+    for rollup in rollups:
+        courses[rollup.course_id] = rollup.course.title
+        course_counts[rollup.course_id][rollup.status] += rollup.count
+        branch_counts[rollup.course_id][rollup.branch][rollup.status] += rollup.count
+        group_counts[rollup.course_id][(rollup.branch, rollup.department)][rollup.status] += rollup.count
+
+    return [
+        {
+            'course_id': course,
+            'course_title': title,
+            **summarize(course_counts[course]),
+            'branches': [
+                {
+                    'branch': branch_code,
+                    'branch_name': BRANCH_NAMES.get(branch_code, branch_code),
+                    **summarize(counts),
+                }
+                for branch_code, counts in branch_counts[course].items()
+            ],
+            'departments': [
+                {
+                    'branch': branch_code,
+                    'department': department,
+                    **summarize(counts),
+                }
+                for (branch_code, department), counts in group_counts[course].items()
+            ],
+        }
+        for course, title in courses.items()
+    ]
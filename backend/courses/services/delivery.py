@@ -0,0 +1,71 @@
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+from courses.models import Question, Test
+from courses.serializers import TestDeliverySerializer
+from courses.services.answer_key import get_answer_key_version
+
+DATA_KEY = 'test_delivery:{test_id}:{version}'
+
+# Пока один поток собирает тест, остальные ждут его результат, а не собирают заново
+_build_lock = threading.Lock()
+
+
+def _cache_timeout():
+    return getattr(settings, 'TEST_DELIVERY_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def get_test_version(test_id):
+    """
+    Версия содержимого теста. Совпадает с версией ключа ответов: она меняется
+    при изменении теста, вопросов, вариантов ответа и изображений вопросов.
+    """
+    return get_answer_key_version(test_id)
+
+
+def build_test_delivery(test_id):
+    """
+    Собирает выдачу теста тремя запросами: тест, вопросы с изображениями,
+    варианты ответов. Возвращает (course_id, JSON в байтах) или None.
+    """
+    test = Test.objects.filter(pk=test_id).prefetch_related(
+        Prefetch(
+            'questions',
+            queryset=Question.objects.select_related('image').prefetch_related('options').order_by('id')
+        )
+    ).first()
+    if test is None:
+        return None
+    return test.course_id, JSONRenderer().render(TestDeliverySerializer(test).data)
+
+
+def get_test_delivery(test_id):
+    """
+    Возвращает (course_id, JSON в байтах, версия) из кэша или собирает выдачу.
+    Для несуществующего теста возвращает None.
+    """
+    version = get_test_version(test_id)
+    data_key = DATA_KEY.format(test_id=test_id, version=version)
+
+    delivery = cache.get(data_key)
+    if delivery is None:
+        with _build_lock:
+            delivery = cache.get(data_key)
+            if delivery is None:
+                delivery = build_test_delivery(test_id)
+                if delivery is None:
+                    return None
+                cache.set(data_key, delivery, _cache_timeout())
+
+    course_id, content = delivery
+    return course_id, content, version
+
+
+def warm_course_tests(course_id):
+    """Собирает заранее выдачу всех тестов курса. Возвращает число тестов"""
+    test_ids = list(Test.objects.filter(course_id=course_id).values_list('id', flat=True))
+    for test_id in test_ids:
+        get_test_delivery(test_id)
+    return len(test_ids)
@@ -0,0 +1,95 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from accounts.outbox import enqueue_email_tasks
+from courses.models import Course, CourseProgress
+from courses.services.compliance import record_status_changes
+from courses.tasks.delivery_tasks import publish_test_delivery_warmup
+
+User = get_user_model()
+
+
+def select_users(branch=None, department=None, user_ids=None):
+    """
+    Возвращает идентификаторы активных пользователей по фильтрам профиля.
+    Фильтры объединяются через И, пустые фильтры не применяются.
+    """
+    users = User.objects.filter(is_active=True)
+    if branch:
+        users = users.filter(profile__branch=branch)
+    if department:
+        users = users.filter(profile__department=department)
+    if user_ids:
+        users = users.filter(id__in=user_ids)
+    return list(users.order_by('id').values_list('id', flat=True))
+
+
+def notify_subscribed_users(course_id, user_ids):
+    """Ставит уведомления о подписке в outbox одной пачкой"""
+    enqueue_email_tasks([
+        {
+            'user_id': user_id,
+            'course_id': course_id,
+            'action': 'course_subscription'
+        }
+        for user_id in user_ids
+    ])
+
+
+def lock_course(course_id):
+    """
+    Блокирует строку курса до конца транзакции, чтобы подписки на курс
+    создавались по очереди. Возбуждает Course.DoesNotExist.
+    """
+    return Course.objects.select_for_update().only('id').get(pk=course_id)
+
+
+def bulk_enroll(course, user_ids, batch_size=1000):
+    """
+    Подписывает пользователей на курс пачками через bulk_create.
+    Уже подписанные пользователи пропускаются, уведомления о подписке
+    и счетчики сводки по филиалам записываются в той же транзакции.
+    Подписки курса читаются под блокировкой строки курса (ее же берет
+    одиночная подписка), поэтому параллельные назначения пересекающихся
+    пользователей не отправляют уведомления и не учитывают в сводке
+    одну подписку дважды.
+    """
+    user_ids = list(user_ids)
+    now = timezone.now()
+    total_passing_score = sum(course.tests.values_list('passing_score', flat=True))
+
+    with transaction.atomic():
+        lock_course(course.id)
+        existing = set(
+            CourseProgress.objects.filter(course=course, user_id__in=user_ids)
+            .values_list('user_id', flat=True)
+        )
+        new_user_ids = [user_id for user_id in user_ids if user_id not in existing]
+
+        CourseProgress.objects.bulk_create(
+            [
+                CourseProgress(
+                    course=course,
+                    user_id=user_id,
+                    status='not_started',
+                    started_at=now,
+                    score=total_passing_score
+                )
+                for user_id in new_user_ids
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+        notify_subscribed_users(course.id, new_user_ids)
+        # bulk_create не вызывает post_save, поэтому сводка обновляется здесь
+        record_status_changes([(course.id, user_id, None, 'not_started') for user_id in new_user_ids])
+        if new_user_ids:
+            # Массовое назначение - тесты курса скоро откроют многие сотрудники
+            transaction.on_commit(lambda: publish_test_delivery_warmup(course.id))
+
+    return {
+        'course_id': course.id,
+        'matched': len(user_ids),
+        'subscribed': len(new_user_ids),
+        'already_subscribed': len(existing),
+    }
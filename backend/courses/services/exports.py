@@ -0,0 +1,145 @@
+import csv
+import tempfile
+from django.utils import timezone
+from openpyxl import Workbook
+from accounts.models import Profile
+from courses.models import CourseProgress, Test, TestAttemptResult
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+BASE_HEADER = [
+    'Фамилия', 'Имя', 'Отчество', 'Логин', 'Email',
+    'Филиал', 'Отдел', 'Должность',
+    'Курс', 'Статус', 'Прогресс, %', 'Начат', 'Завершен',
+]
+
+PROGRESS_FIELDS = (
+    'user_id', 'user__last_name', 'user__first_name', 'user__profile__patronymic',
+    'user__username', 'user__email', 'user__profile__branch', 'user__profile__department',
+    'user__profile__position', 'course_id', 'course__title', 'status',
+    'progress_percent', 'started_at', 'completed_at',
+)
+
+BRANCH_NAMES = dict(Profile.BRANCH_CHOICES)
+STATUS_NAMES = dict(CourseProgress.STATUS_CHOICES)
+
+
+def local_time(value):
+    # openpyxl не принимает даты с часовым поясом
+    return timezone.localtime(value).replace(tzinfo=None) if value else None
+
+
+def latest_scores(test_ids, user_ids):
+    """Баллы последних попыток {(user_id, test_id): score} для части выгрузки"""
+    return {
+        (user_id, test_id): score
+        for user_id, test_id, score in TestAttemptResult.objects.filter(
+            is_latest=True,
+            test_id__in=test_ids,
+            user_id__in=user_ids
+        ).values_list('user_id', 'test_id', 'score')
+    }
+
+
+def progress_export_rows(course_id=None, branch=None, department=None, status=None, chunk_size=2000):
+    """
+    Строки выгрузки прогресса: сначала заголовок, затем по строке на подписку.
+    Записи читаются через iterator(chunk_size) одним запросом с нужными join,
+    баллы последних попыток подгружаются одним запросом на каждую часть,
+    поэтому память не растет с размером выгрузки.
+    При выгрузке одного курса у каждого теста своя колонка, иначе баллы
+    собираются в одну колонку.
+    """
+    progress = CourseProgress.objects.all()
+    if course_id:
+        progress = progress.filter(course_id=course_id)
+    if branch:
+        progress = progress.filter(user__profile__branch=branch)
+    if department:
+        progress = progress.filter(user__profile__department=department)
+    if status:
+        progress = progress.filter(status=status)
+
+    tests = {}
+    for test_id, test_course_id, title in Test.objects.filter(
+        **({'course_id': course_id} if course_id else {})
+    ).order_by('id').values_list('id', 'course_id', 'title'):
+        tests.setdefault(test_course_id, []).append((test_id, title))
+
+    if course_id:
+        yield BASE_HEADER + [f'Тест: {title}' for _, title in tests.get(course_id, [])]
+    else:
+        yield BASE_HEADER + ['Тесты']
+
+    rows = progress.order_by('course_id', 'id').values_list(*PROGRESS_FIELDS).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from format_chunk(chunk, tests, single_course=bool(course_id))
+            chunk = []
+    if chunk:
+        yield from format_chunk(chunk, tests, single_course=bool(course_id))
+
+
+def format_chunk(chunk, tests, single_course):
+    scores = latest_scores(
+        {test_id for row in chunk for test_id, _ in tests.get(row[9], [])},
+        {row[0] for row in chunk}
+    )
+    for (
+        user_id, last_name, first_name, patronymic, username, email, branch,
+        department, position, course_id, course_title, status,
+        progress_percent, started_at, completed_at
+    ) in chunk:
+        line = [
+            last_name, first_name, patronymic or '', username, email,
+            BRANCH_NAMES.get(branch, branch or ''), department or '', position or '',
+            course_title, STATUS_NAMES.get(status, status), progress_percent,
+            local_time(started_at), local_time(completed_at),
+        ]
+        course_tests = tests.get(course_id, [])
+        if single_course:
+            line.extend(scores.get((user_id, test_id), '') for test_id, _ in course_tests)
+        else:
+            line.append('; '.join(
+                f'{title}: {scores[(user_id, test_id)]}'
+                for test_id, title in course_tests
+                if (user_id, test_id) in scores
+            ))
+        yield line
+
+
+class Echo:
+    """Объект с методом write, возвращающий записанное - для потокового csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """Отдает CSV построчно; BOM нужен, чтобы Excel распознал UTF-8"""
+    writer = csv.writer(Echo(), delimiter=';')
+    yield '\ufeff'
+    for row in rows:
+        yield writer.writerow([
+            value.strftime('%d.%m.%Y %H:%M') if hasattr(value, 'strftime') else value
+            for value in row
+        ])
+
+
+def write_xlsx(rows, target=None):
+    """
+    Записывает строки в XLSX в режиме write_only: openpyxl сбрасывает строки
+    во временный файл, а не держит лист в памяти.
+    Возвращает файловый объект, установленный на начало.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Прогресс')
+    for row in rows:
+        sheet.append(row)
+
+    target = target or tempfile.TemporaryFile()
+    workbook.save(target)
+    target.seek(0)
+    return target
@@ -0,0 +1,122 @@
+from django.db.models import Max
+from django.utils import timezone
+from courses.models import UserAnswer, SelectedAnswer, TestAttemptResult
+from .answer_key import get_answer_key
+
+
+def score_answer(entry, selected):
+    """
+    Считает баллы за ответ на вопрос по ключу.
+    selected - множество идентификаторов выбранных (валидных) вариантов.
+    """
+    if entry['type'] == 'text':
+        # Текстовые ответы пока не проверяются автоматически
+        return 0
+
+    selected_correct = len(selected & entry['correct'])
+    selected_wrong = len(selected) - selected_correct
+
+    if entry['type'] == 'single':
+        return entry['points'] if selected_correct == 1 and selected_wrong == 0 else 0
+
+    if entry['type'] == 'multiple':
+        total_correct = len(entry['correct'])
+        if selected_wrong > 0 or total_correct == 0:
+            return 0
+        return selected_correct * entry['points'] // total_correct
+
+    return 0
+
+
+def grade_submission(test, user, answers):
+    """
+    Оценивает попытку прохождения теста целиком.
+    Баллы считаются в памяти по скомпилированному ключу ответов,
+    ответы сохраняются через bulk_create, поэтому число запросов
+    не зависит от количества вопросов. Итог попытки записывается
+    в TestAttemptResult.
+    """
+    # Номер попытки по индексам (user, test, attempt_number). Результаты попыток
+    # учитываются обязательно: попытка без валидных ответов не пишет UserAnswer,
+    # а у старых ответов test может быть еще не заполнен
+    last_attempt = UserAnswer.objects.filter(
+        user=user,
+        test=test
+    ).aggregate(last=Max('attempt_number'))['last']
+    last_result = TestAttemptResult.objects.filter(
+        user=user,
+        test=test
+    ).aggregate(last=Max('attempt_number'))['last']
+    attempt_number = max(last_attempt or 0, last_result or 0) + 1
+
+    answer_key = get_answer_key(test.id)['questions']
+
+    user_answers = []
+    selections = []
+    total_score = 0
+    seen_questions = set()
+
+    for answer_data in answers:
+        try:
+            question_id = int(answer_data.get('question'))
+        except (TypeError, ValueError):
+            continue
+
+        entry = answer_key.get(question_id)
+        if entry is None or question_id in seen_questions:
+            continue
+        seen_questions.add(question_id)
+
+        selected = []
+        if entry['type'] != 'text':
+            for option_id in answer_data.get('selected_options', []):
+                try:
+                    option_id = int(option_id)
+                except (TypeError, ValueError):
+                    continue
+                if option_id in entry['valid'] and option_id not in selected:
+                    selected.append(option_id)
+
+        points_earned = score_answer(entry, set(selected))
+        total_score += points_earned
+
+        user_answers.append(UserAnswer(
+            user=user,
+            question_id=question_id,
+            test_id=test.id,
+            course_id=test.course_id,
+            answer_data=answer_data.get('answer_data'),
+            attempt_number=attempt_number,
+            points_earned=points_earned
+        ))
+        selections.append(selected)
+
+    UserAnswer.objects.bulk_create(user_answers)
+
+    SelectedAnswer.objects.bulk_create([
+        SelectedAnswer(
+            user_answer=user_answer,
+            answer_option_id=option_id,
+            is_selected=True
+        )
+        for user_answer, selected in zip(user_answers, selections)
+        for option_id in selected
+    ])
+
+    TestAttemptResult.objects.filter(user=user, test=test, is_latest=True).update(is_latest=False)
+    result = TestAttemptResult.objects.create(
+        user=user,
+        test=test,
+        attempt_number=attempt_number,
+        score=total_score,
+        passed=total_score >= test.passing_score,
+        is_latest=True,
+        finished_at=timezone.now()
+    )
+
+    return {
+        'attempt_number': attempt_number,
+        'total_score': total_score,
+        'answers': user_answers,
+        'result': result,
+    }
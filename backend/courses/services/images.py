@@ -0,0 +1,99 @@
+import hashlib
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+FORMATS = {
+    'webp': {'format': 'WEBP', 'options': {'method': 4}},
+    'jpeg': {'format': 'JPEG', 'options': {'optimize': True, 'progressive': True}},
+}
+
+
+def derivative_name(question_image, width, image_format):
+    return f'questions/derivatives/{question_image.pk}/{width}.{image_format}'
+
+
+def target_widths(source_width):
+    """
+    Ширины производных изображений: фиксированные ширины не больше исходной.
+    Если исходник уже самой узкой ширины, производное делается в его ширину без увеличения.
+    """
+    widths = [width for width in settings.QUESTION_IMAGE_WIDTHS if width <= source_width]
+    return widths or [source_width]
+
+
+def encode(image, image_format):
+    buffer = BytesIO()
+    spec = FORMATS[image_format]
+    # exif и icc_profile не передаются, поэтому метаданные в файл не попадают
+    image.save(buffer, spec['format'], quality=settings.QUESTION_IMAGE_QUALITY, **spec['options'])
+    return buffer.getvalue()
+
+
+def delete_derivatives(question_image):
+    storage = question_image.image.storage
+    for image_format in FORMATS:
+        for derivative in question_image.derivatives.get(image_format, []):
+            storage.delete(derivative['name'])
+
+
+def build_derivatives(question_image):
+    """
+    Создает уменьшенные WebP и JPEG версии изображения вопроса.
+    Ориентация из EXIF применяется к пикселям, сами метаданные отбрасываются.
+    Возвращает описание производных, которое сохраняется в QuestionImage.derivatives.
+    """
+    storage = question_image.image.storage
+    with storage.open(question_image.image.name, 'rb') as source_file:
+        with Image.open(source_file) as source:
+            source = ImageOps.exif_transpose(source)
+            has_alpha = source.mode in ('RGBA', 'LA', 'PA') or 'transparency' in source.info
+            source = source.convert('RGBA' if has_alpha else 'RGB')
+
+    derivatives = {
+        'source': question_image.image.name,
+        'width': source.width,
+        'height': source.height,
+    }
+    for image_format in FORMATS:
+        derivatives[image_format] = []
+
+    for width in target_widths(source.width):
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), Image.Resampling.LANCZOS)
+        for image_format in FORMATS:
+            image = resized
+            if image_format == 'jpeg' and image.mode != 'RGB':
+                # В JPEG нет прозрачности - накладываем на белый фон
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+
+            content = encode(image, image_format)
+            name = derivative_name(question_image, width, image_format)
+            storage.delete(name)
+            storage.save(name, ContentFile(content))
+            derivatives[image_format].append({
+                'width': width,
+                'name': name,
+                'hash': hashlib.sha256(content).hexdigest(),
+            })
+
+    return derivatives
+
+
+def pick_derivative(question_image, image_format, width=None):
+    """
+    Возвращает наименьшее производное не уже запрошенной ширины
+    (или самое широкое, если такого нет). None - производных еще нет.
+    """
+    derivatives = question_image.derivatives.get(image_format) or []
+    if question_image.derivatives.get('source') != question_image.image.name or not derivatives:
+        return None
+    if width is None:
+        return derivatives[-1]
+    for derivative in derivatives:
+        if derivative['width'] >= width:
+            return derivative
+    return derivatives[-1]
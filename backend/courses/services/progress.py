@@ -0,0 +1,107 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Sum
+from django.utils import timezone
+from courses.models import Test, CourseProgress, TestAttemptResult, UserAnswer
+from courses.services.compliance import record_status_changes
+
+
+def latest_attempt_scores(course_id, user_ids=None):
+    """
+    Возвращает баллы последней попытки каждого пользователя по каждому тесту курса:
+    {(user_id, test_id): score}. Баллы берутся из таблицы результатов, а для пар
+    (пользователь, тест), у которых результатов еще нет (история до появления
+    TestAttemptResult, не перенесенная backfill_attempt_results), - из UserAnswer,
+    чтобы пересчет не снимал ранее полученное прохождение курса
+    """
+    results = TestAttemptResult.objects.filter(test__course_id=course_id, is_latest=True)
+    answers = UserAnswer.objects.filter(question__test__course_id=course_id).filter(~Exists(
+        TestAttemptResult.objects.filter(user_id=OuterRef('user_id'), test_id=OuterRef('question__test_id'))
+    ))
+    if user_ids is not None:
+        results = results.filter(user_id__in=user_ids)
+        answers = answers.filter(user_id__in=user_ids)
+
+    scores = {}
+    # Попытки отсортированы по возрастанию, поэтому остается балл последней
+    for row in (
+        answers.values('user_id', 'question__test_id', 'attempt_number')
+        .annotate(total=Sum('points_earned'))
+        .order_by('attempt_number')
+    ):
+        scores[(row['user_id'], row['question__test_id'])] = row['total'] or 0
+
+    scores.update(
+        ((user_id, test_id), score)
+        for user_id, test_id, score in results.values_list('user_id', 'test_id', 'score')
+    )
+    return scores
+
+
+def apply_progress(progress, tests, scores, now):
+    """
+    Пересчитывает статус и процент выполнения одного прогресса в памяти.
+    Возвращает True, если что-то изменилось.
+    """
+    before = (progress.status, progress.progress_percent, progress.completed_at, progress.score)
+
+    total_passing_score = sum(passing_score for _, passing_score in tests)
+    earned = [scores.get((progress.user_id, test_id)) for test_id, _ in tests]
+    tests_completed = bool(tests) and all(
+        score is not None and score >= passing_score
+        for score, (_, passing_score) in zip(earned, tests)
+    )
+
+    progress.score = total_passing_score
+
+    if tests_completed:
+        progress.status = 'completed'
+        progress.progress_percent = 100
+        if not progress.completed_at:
+            progress.completed_at = now
+    else:
+        if progress.status == 'completed':
+            progress.status = 'in_progress'
+            progress.completed_at = None
+
+        if total_passing_score > 0:
+            total_score_earned = sum(score or 0 for score in earned)
+            progress.progress_percent = min(100, int((total_score_earned / total_passing_score) * 100))
+
+    return before != (progress.status, progress.progress_percent, progress.completed_at, progress.score)
+
+
+def recompute_course_progress(course_id):
+    """
+    Пересчитывает прогресс всех подписчиков курса фиксированным числом запросов:
+    тесты курса, баллы последних попыток (результаты и неперенесенная история
+    ответов), прогрессы, один bulk_update
+    и обновление сводки по филиалам для записей со сменившимся статусом.
+    Возвращает количество обновленных записей.
+    """
+    tests = list(
+        Test.objects.filter(course_id=course_id)
+        .order_by('id')
+        .values_list('id', 'passing_score')
+    )
+    scores = latest_attempt_scores(course_id)
+    now = timezone.now()
+
+    progresses = CourseProgress.objects.filter(course_id=course_id).only(
+        'id', 'user_id', 'status', 'progress_percent', 'completed_at', 'score'
+    )
+    changed = [
+        progress for progress in progresses
+        if apply_progress(progress, tests, scores, now)
+    ]
+
+    with transaction.atomic():
+        CourseProgress.objects.bulk_update(
+            changed,
+            ['status', 'progress_percent', 'completed_at', 'score'],
+            batch_size=500
+        )
+        record_status_changes([
+            (course_id, progress.user_id, progress._loaded_status, progress.status)
+            for progress in changed
+        ])
+    return len(changed)
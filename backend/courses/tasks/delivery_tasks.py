@@ -0,0 +1,30 @@
+from django.conf import settings
+from accounts.rabbitmq import publish_task
+
+
+def warm_test_delivery_sync(course_id):
+    """
+    Синхронный прогрев выдачи тестов курса.
+    Вызывается воркером курсов по переданному ID.
+    """
+    from courses.services.delivery import warm_course_tests
+
+    warmed = warm_course_tests(course_id)
+    print(f"Course {course_id}: {warmed} test(s) warmed")
+    return warmed
+
+
+def publish_test_delivery_warmup(course_id):
+    """
+    Отправляет задание на прогрев выдачи тестов в очередь воркера курсов.
+    Прогрев только ускоряет первое открытие теста, поэтому при недоступном
+    брокере задание пропускается - выдача соберется при первом запросе.
+    """
+    task_data = {
+        'course_id': course_id,
+        'action': 'warm_test_delivery'
+    }
+    try:
+        publish_task(settings.RABBITMQ_COURSES_QUEUE, task_data)
+    except Exception as e:
+        print(f"Course {course_id}: test warmup not scheduled: {e}")
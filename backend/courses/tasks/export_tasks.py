@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.utils import timezone
+from accounts.rabbitmq import publish_task
+
+
+def build_progress_export_sync(export_id):
+    """
+    Синхронная сборка выгрузки прогресса в XLSX.
+    Вызывается воркером курсов по переданному ID. Ошибка сборки
+    записывается в выгрузку, чтобы администратор увидел ее в статусе.
+    """
+    from django.core.files import File
+    from courses.models import ProgressExport
+    from courses.services.exports import progress_export_rows, write_xlsx
+
+    try:
+        export = ProgressExport.objects.get(id=export_id)
+    except ProgressExport.DoesNotExist:
+        print(f"Progress export with id {export_id} not found.")
+        return None
+    if export.status != 'pending':
+        # Повторная доставка задания - выгрузка уже собрана
+        return export
+
+    try:
+        with write_xlsx(progress_export_rows(**export.params)) as workbook:
+            export.file.save(
+                f'progress_{export.id}_{timezone.localdate():%Y%m%d}.xlsx',
+                File(workbook),
+                save=False
+            )
+        export.status = 'ready'
+    except Exception as e:
+        export.status = 'failed'
+        export.error = str(e)
+    export.finished_at = timezone.now()
+    export.save()
+    print(f"Progress export {export.id}: {export.status}")
+    return export
+
+
+def publish_progress_export(export_id):
+    """
+    Отправляет задание на сборку выгрузки в очередь воркера курсов.
+    Выгрузка не собирается в запросе, поэтому при недоступном брокере
+    она помечается ошибкой - администратор может запросить ее повторно.
+    """
+    from courses.models import ProgressExport
+
+    task_data = {
+        'export_id': export_id,
+        'action': 'build_progress_export'
+    }
+    try:
+        publish_task(settings.RABBITMQ_COURSES_QUEUE, task_data)
+    except Exception as e:
+        print(f"Progress export {export_id}: not scheduled: {e}")
+        ProgressExport.objects.filter(pk=export_id).update(
+            status='failed',
+            error='Очередь заданий недоступна',
+            finished_at=timezone.now()
+        )
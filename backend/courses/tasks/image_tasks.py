@@ -0,0 +1,46 @@
+from django.conf import settings
+from accounts.rabbitmq import publish_task
+
+
+def build_question_image_derivatives_sync(image_id):
+    """
+    Синхронное создание производных изображения вопроса.
+    Вызывается воркером курсов по переданному ID.
+    """
+    from courses.models import QuestionImage
+    from courses.services.images import build_derivatives, delete_derivatives
+    from courses.services.answer_key import invalidate_question_image_tests
+
+    try:
+        question_image = QuestionImage.objects.get(id=image_id)
+    except QuestionImage.DoesNotExist:
+        print(f"Question image with id {image_id} not found.")
+        return None
+    if not question_image.image:
+        return None
+
+    delete_derivatives(question_image)
+    derivatives = build_derivatives(question_image)
+    # update() не вызывает сигналы, поэтому задание не ставится повторно
+    QuestionImage.objects.filter(pk=image_id, image=question_image.image.name).update(derivatives=derivatives)
+    # srcset в выдаче тестов зависит от производных
+    invalidate_question_image_tests(image_id)
+    print(f"Question image {image_id}: {len(derivatives['webp'])} derivative width(s) built")
+    return derivatives
+
+
+def publish_question_image_derivatives(image_id):
+    """
+    Отправляет задание на создание производных в очередь воркера курсов.
+    Обработка изображений не выполняется в запросе админки: если брокер
+    недоступен, клиенты получают исходное изображение, а производные можно
+    создать командой build_question_image_derivatives.
+    """
+    task_data = {
+        'image_id': image_id,
+        'action': 'build_question_image_derivatives'
+    }
+    try:
+        publish_task(settings.RABBITMQ_COURSES_QUEUE, task_data)
+    except Exception as e:
+        print(f"Question image {image_id}: derivatives not scheduled: {e}")
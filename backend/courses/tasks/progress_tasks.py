@@ -0,0 +1,100 @@
+import threading
+from django.conf import settings
+from django.db import transaction
+from accounts.rabbitmq import publish_task
+
+
+def recompute_course_progress_sync(course_id):
+    """
+    Синхронный пересчет прогресса курса.
+    Вызывается воркером курсов по переданному ID.
+    """
+    from courses.services.progress import recompute_course_progress
+
+    updated = recompute_course_progress(course_id)
+    print(f"Course {course_id}: progress recomputed, {updated} rows updated")
+    return updated
+
+
+def publish_course_progress_recompute(course_id):
+    """
+    Отправляет задание на пересчет в очередь воркера курсов.
+    Если брокер недоступен, пересчет выполняется на месте - он основан
+    на агрегирующих запросах и не блокирует запрос надолго.
+    """
+    task_data = {
+        'course_id': course_id,
+        'action': 'recompute_course_progress'
+    }
+    try:
+        publish_task(settings.RABBITMQ_COURSES_QUEUE, task_data)
+    except Exception:
+        recompute_course_progress_sync(course_id)
+
+
+class DirtyCourses:
+    """
+    Курсы потока, прогресс которых нужно пересчитать после фиксации транзакции.
+    Колбэк on_commit регистрируется на каждую пометку, поэтому откат точки
+    сохранения снимает только ее пометки. При фиксации первый колбэк курса
+    отправляет пересчет, остальные видят курс в published и пропускают его -
+    каскад сигналов от одного изменения дает один пересчет на курс.
+    """
+
+    def __init__(self):
+        self.published = set()
+
+    def add(self, course_id):
+        # Пометка внутри транзакции означает, что колбэки прошлой
+        # фиксации уже выполнены
+        self.published.clear()
+        transaction.on_commit(lambda: self.publish(course_id))
+
+    def publish(self, course_id):
+        if course_id in self.published:
+            return
+        self.published.add(course_id)
+        with _stats_lock:
+            coalescing_stats['scheduled'] += 1
+        publish_course_progress_recompute(course_id)
+
+
+coalescing_stats = {
+    'requested': 0,
+    'scheduled': 0,
+}
+_stats_lock = threading.Lock()
+_pending = threading.local()
+
+
+def get_coalescing_stats():
+    """Счетчики запрошенных, выполненных и сэкономленных пересчетов прогресса"""
+    with _stats_lock:
+        stats = dict(coalescing_stats)
+    stats['avoided'] = stats['requested'] - stats['scheduled']
+    return stats
+
+
+def _current_batch():
+    batch = getattr(_pending, 'batch', None)
+    if batch is None:
+        batch = _pending.batch = DirtyCourses()
+    return batch
+
+
+def mark_course_dirty(course_id):
+    """
+    Помечает курс как требующий пересчета прогресса.
+    Внутри транзакции пересчет откладывается до on_commit и выполняется
+    один раз на курс, вне транзакции задание отправляется сразу.
+    """
+    with _stats_lock:
+        coalescing_stats['requested'] += 1
+
+    if not transaction.get_connection().in_atomic_block:
+        with _stats_lock:
+            coalescing_stats['scheduled'] += 1
+        publish_course_progress_recompute(course_id)
+        return
+
+    _current_batch().add(course_id)
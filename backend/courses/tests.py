@@ -1,3 +1,936 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from PIL import Image
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from accounts.models import EmailOutbox
+from .models import (
+    Course, LearningMaterial, Test, Question, AnswerOption,
+    CourseProgress, UserAnswer, SelectedAnswer,
+    TestAttemptResult, QuestionImage, ComplianceRollup
+)
+from .services.answer_key import get_answer_key, get_answer_key_version, invalidate_answer_key
+from .services.compliance import rebuild_compliance_rollups
+from .services.enrollment import bulk_enroll
+from .services.images import pick_derivative
+from .services.progress import recompute_course_progress
+from .tasks.progress_tasks import get_coalescing_stats
+from .tasks.image_tasks import build_question_image_derivatives_sync
+from .tasks.export_tasks import build_progress_export_sync
 
-# Create your tests here.
+
+def create_test_with_questions(course, count):
+    test = Test.objects.create(course=course, title=f'Тест на {count}', passing_score=1, time_limit=10)
+    for i in range(count):
+        question = Question.objects.create(test=test, text=f'Вопрос {i}', question_type='single', points=1)
+        AnswerOption.objects.create(question=question, text='Верно', is_correct=True)
+        AnswerOption.objects.create(question=question, text='Неверно', is_correct=False)
+    return test
+
+
+def build_answers(test, correct=True):
+    answers = []
+    for question in test.questions.prefetch_related('options'):
+        option = next(o for o in question.options.all() if o.is_correct == correct)
+        answers.append({'question': question.id, 'selected_options': [option.id]})
+    return answers
+
+
+class SubmitGradingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='employee', password='Secret-123')
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        CourseProgress.objects.create(course=self.course, user=self.user, status='in_progress')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, test, answers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                f'/api/courses/tests/{test.id}/submit/',
+                {'answers': answers, 'course_id': test.course_id},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response, len(ctx.captured_queries)
+
+    def test_scores_and_stores_answers(self):
+        test = create_test_with_questions(self.course, 3)
+        answers = build_answers(test)
+        answers[0]['selected_options'].append(answers[1]['selected_options'][0])  # чужой вариант
+
+        response, _ = self.submit(test, answers)
+
+        self.assertEqual(response.data['total_score'], 3)
+        self.assertEqual(response.data['attempt_number'], 1)
+        self.assertEqual(UserAnswer.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(SelectedAnswer.objects.filter(user_answer__user=self.user).count(), 3)
+
+        response, _ = self.submit(test, build_answers(test, correct=False))
+        self.assertEqual(response.data['total_score'], 0)
+        self.assertEqual(response.data['attempt_number'], 2)
+
+    def test_query_count_does_not_grow_with_questions(self):
+        other_course = Course.objects.create(
+            title='Пароли', description='', difficulty='easy', category='password_sec'
+        )
+        CourseProgress.objects.create(course=other_course, user=self.user, status='in_progress')
+        small = create_test_with_questions(self.course, 5)
+        large = create_test_with_questions(other_course, 50)
+
+        _, small_queries = self.submit(small, build_answers(small))
+        _, large_queries = self.submit(large, build_answers(large))
+
+        self.assertEqual(small_queries, large_queries)
+
+
+class AnswerKeyCacheTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.test = create_test_with_questions(self.course, 3)
+
+    def test_key_is_compiled_once(self):
+        key = get_answer_key(self.test.id)
+        self.assertEqual(key['max_score'], 3)
+        self.assertEqual(len(key['questions']), 3)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIs(get_answer_key(self.test.id), key)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_option_change_invalidates_key(self):
+        question = self.test.questions.first()
+        wrong = question.options.get(is_correct=False)
+        self.assertNotIn(wrong.id, get_answer_key(self.test.id)['questions'][question.id]['correct'])
+
+        wrong.is_correct = True
+        wrong.save()
+
+        self.assertIn(wrong.id, get_answer_key(self.test.id)['questions'][question.id]['correct'])
+
+    def test_invalidation_never_reuses_version(self):
+        # Параллельные инвалидации не вычисляют версию из прочитанной
+        versions = {get_answer_key_version(self.test.id)}
+        for _ in range(5):
+            invalidate_answer_key(self.test.id)
+            versions.add(get_answer_key_version(self.test.id))
+        self.assertEqual(len(versions), 6)
+
+
+class CourseProgressRecomputeTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.test = create_test_with_questions(self.course, 2)
+        self.test.passing_score = 2
+        self.test.save()
+
+    def add_user(self, username, passed):
+        user = User.objects.create(username=username)
+        CourseProgress.objects.create(course=self.course, user=user, status='in_progress')
+        # Первая попытка противоположна последней, учитываться должна только последняя
+        for attempt, points in ((1, int(not passed)), (2, int(passed))):
+            TestAttemptResult.objects.create(
+                user=user, test=self.test, attempt_number=attempt,
+                score=2 * points, is_latest=attempt == 2
+            )
+        return user
+
+    def test_recompute_uses_latest_attempt(self):
+        passed = self.add_user('passed', True)
+        failed = self.add_user('failed', False)
+
+        recompute_course_progress(self.course.id)
+
+        progress = CourseProgress.objects.get(user=passed)
+        self.assertEqual(progress.status, 'completed')
+        self.assertEqual(progress.progress_percent, 100)
+        self.assertIsNotNone(progress.completed_at)
+
+        progress = CourseProgress.objects.get(user=failed)
+        self.assertEqual(progress.status, 'in_progress')
+        self.assertEqual(progress.progress_percent, 0)
+
+    def test_recompute_falls_back_to_answers_without_results(self):
+        user = User.objects.create(username='legacy')
+        CourseProgress.objects.create(
+            course=self.course, user=user, status='completed', completed_at=timezone.now()
+        )
+        # История ответов до появления TestAttemptResult: последняя попытка сдана
+        for attempt, points in ((1, 0), (2, 1)):
+            for question in self.test.questions.all():
+                UserAnswer.objects.create(
+                    user=user, question=question, attempt_number=attempt, points_earned=points
+                )
+
+        recompute_course_progress(self.course.id)
+
+        progress = CourseProgress.objects.get(user=user)
+        self.assertEqual(progress.status, 'completed')
+        self.assertIsNotNone(progress.completed_at)
+
+    def test_query_count_does_not_grow_with_subscribers(self):
+        self.add_user('first', True)
+        with CaptureQueriesContext(connection) as ctx:
+            recompute_course_progress(self.course.id)
+        few_queries = len(ctx.captured_queries)
+
+        for i in range(20):
+            self.add_user(f'user{i}', i % 2 == 0)
+        with CaptureQueriesContext(connection) as ctx:
+            recompute_course_progress(self.course.id)
+
+        self.assertEqual(len(ctx.captured_queries), few_queries)
+
+
+class ProgressCoalescingTests(TransactionTestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.test = create_test_with_questions(self.course, 2)
+
+    @mock.patch('courses.tasks.progress_tasks.publish_task')
+    def test_question_edit_recomputes_course_once(self, publish):
+        before = get_coalescing_stats()
+
+        with transaction.atomic():
+            question = self.test.questions.first()
+            question.points = 5
+            question.save()
+            self.test.passing_score = 3
+            self.test.save()
+
+        publish.assert_called_once()
+        self.assertEqual(publish.call_args.args[1]['course_id'], self.course.id)
+        self.test.refresh_from_db()
+        self.assertEqual(self.test.max_score, 6)
+
+        after = get_coalescing_stats()
+        self.assertEqual(after['scheduled'] - before['scheduled'], 1)
+        self.assertGreater(after['avoided'] - before['avoided'], 0)
+
+    @mock.patch('courses.tasks.progress_tasks.publish_task')
+    def test_savepoint_rollback_keeps_outer_recompute(self, publish):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    self.test.passing_score = 2
+                    self.test.save()
+                    raise ValueError
+            except ValueError:
+                pass
+            self.test.passing_score = 3
+            self.test.save()
+
+        publish.assert_called_once()
+        self.assertEqual(publish.call_args.args[1]['course_id'], self.course.id)
+
+
+class TestAttemptResultTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='employee')
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.test = create_test_with_questions(self.course, 2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_submit_writes_latest_result(self):
+        for correct in (True, False):
+            self.client.post(
+                f'/api/courses/tests/{self.test.id}/submit/',
+                {'answers': build_answers(self.test, correct), 'course_id': self.course.id},
+                format='json'
+            )
+
+        results = TestAttemptResult.objects.filter(user=self.user, test=self.test).order_by('attempt_number')
+        self.assertEqual([(r.score, r.is_latest) for r in results], [(2, False), (0, True)])
+
+        response = self.client.get(f'/api/courses/tests/user_results/?course_id={self.course.id}')
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['score'], 0)
+        self.assertEqual(response.data[0]['attempt_number'], 2)
+
+    def test_empty_submissions_get_distinct_attempts(self):
+        url = f'/api/courses/tests/{self.test.id}/submit/'
+        for attempt in (1, 2):
+            response = self.client.post(
+                url, {'answers': [{'question': 'x'}], 'course_id': self.course.id}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['attempt_number'], attempt)
+        self.assertFalse(UserAnswer.objects.filter(user=self.user).exists())
+
+    def test_backfill_from_answers(self):
+        for attempt, points in ((1, 1), (2, 0), (3, 1)):
+            for question in self.test.questions.all():
+                UserAnswer.objects.create(
+                    user=self.user, question=question,
+                    attempt_number=attempt, points_earned=points
+                )
+
+        call_command('backfill_attempt_results', batch_size=1, stdout=StringIO())
+
+        results = TestAttemptResult.objects.filter(user=self.user, test=self.test).order_by('attempt_number')
+        self.assertEqual(
+            [(r.attempt_number, r.score, r.is_latest) for r in results],
+            [(1, 2, False), (2, 0, False), (3, 2, True)]
+        )
+        self.assertTrue(self.test.is_passed_by_user(self.user))
+
+    def test_backfill_skips_pairs_with_results(self):
+        for attempt in (1, 2):
+            for question in self.test.questions.all():
+                UserAnswer.objects.create(
+                    user=self.user, question=question, attempt_number=attempt, points_earned=1
+                )
+        TestAttemptResult.objects.create(
+            user=self.user, test=self.test, attempt_number=3, score=0, is_latest=True
+        )
+
+        call_command('backfill_attempt_results', stdout=StringIO())
+
+        self.assertEqual(
+            list(TestAttemptResult.objects.filter(user=self.user, test=self.test).values_list('attempt_number', 'is_latest')),
+            [(3, True)]
+        )
+
+
+class BulkEnrollmentTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_staff(self, count, branch):
+        users = []
+        for i in range(count):
+            user = User.objects.create(username=f'{branch}{i}')
+            user.profile.branch = branch
+            user.profile.save()
+            users.append(user)
+        return users
+
+    def test_bulk_subscribe_by_branch(self):
+        cardio = self.create_staff(5, 'cardio')
+        self.create_staff(3, 'oncology')
+        CourseProgress.objects.create(course=self.course, user=cardio[0])
+        queued_before = EmailOutbox.objects.count()
+
+        response = self.client.post(
+            '/api/courses/progress/bulk_subscribe/',
+            {'course_id': self.course.id, 'branch': 'cardio'},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['matched'], 5)
+        self.assertEqual(response.data['subscribed'], 4)
+        self.assertEqual(response.data['already_subscribed'], 1)
+        self.assertEqual(CourseProgress.objects.filter(course=self.course).count(), 5)
+
+        self.assertEqual(EmailOutbox.objects.count() - queued_before, 4)
+
+    def test_subscriptions_are_read_under_course_lock(self):
+        cardio = self.create_staff(5, 'cardio')
+        EmailOutbox.objects.all().delete()
+
+        def concurrent_enrollment(course_id):
+            # Параллельное назначение успело подписать пользователя до блокировки
+            CourseProgress.objects.create(course_id=course_id, user=cardio[1])
+            return Course.objects.get(pk=course_id)
+
+        with mock.patch('courses.services.enrollment.lock_course', side_effect=concurrent_enrollment):
+            summary = bulk_enroll(self.course, [user.id for user in cardio])
+
+        self.assertEqual(summary['subscribed'], 4)
+        self.assertEqual(summary['already_subscribed'], 1)
+        # Каждый пользователь получает ровно одно уведомление
+        notified = [entry.payload['user_id'] for entry in EmailOutbox.objects.all()]
+        self.assertEqual(sorted(notified), sorted(user.id for user in cardio))
+        self.assertEqual(
+            ComplianceRollup.objects.get(course=self.course, branch='cardio', status='not_started').count, 5
+        )
+
+    def test_bulk_subscribe_rejects_invalid_user_ids(self):
+        for user_ids in ('1,2', ['a'], [None], {'id': 1}):
+            response = self.client.post(
+                '/api/courses/progress/bulk_subscribe/',
+                {'course_id': self.course.id, 'user_ids': user_ids},
+                format='json'
+            )
+            self.assertEqual(response.status_code, 400, user_ids)
+
+    def test_bulk_subscribe_requires_staff(self):
+        self.client.force_authenticate(User.objects.create(username='employee'))
+        response = self.client.post(
+            '/api/courses/progress/bulk_subscribe/',
+            {'course_id': self.course.id, 'branch': 'cardio'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_ACCEL_PREFIX='')
+class LearningMaterialMediaTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.size = 4 * 1024 * 1024
+        self.material = LearningMaterial.objects.create(
+            course=course,
+            material_type='video',
+            content_file=SimpleUploadedFile('lesson.mp4', b'\0' * self.size)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='employee'))
+        self.url = f'/api/courses/materials/{self.material.id}/download/'
+
+    def served_bytes(self, response):
+        if response.status_code == 304:
+            return 0
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    def test_bytes_served_per_session(self):
+        """
+        Сессия просмотра: открытие видео, три перемотки, повторное открытие
+        страницы и докачка после обрыва. Раньше каждый запрос отдавал файл целиком.
+        """
+        window = 512 * 1024
+        first = self.client.get(self.url, HTTP_RANGE=f'bytes=0-{window - 1}')
+        etag = first['ETag']
+        served = self.served_bytes(first)
+        requests = 1
+
+        for offset in (1, 2, 3):
+            start = offset * 1024 * 1024
+            response = self.client.get(
+                self.url, HTTP_RANGE=f'bytes={start}-{start + window - 1}', HTTP_IF_RANGE=etag
+            )
+            self.assertEqual(response.status_code, 206)
+            served += self.served_bytes(response)
+            requests += 1
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        served += self.served_bytes(response)
+        requests += 1
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={self.size - window}-', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        served += self.served_bytes(response)
+        requests += 1
+
+        before = self.size * requests
+        self.assertEqual(served, 5 * window)
+        self.assertLess(served * 8, before)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_ACCEL_PREFIX='')
+class QuestionImageDerivativeTests(TestCase):
+    def upload(self, width, height):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x010f] = 'Phone'
+        Image.new('RGB', (width, height), 'red').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('screenshot.jpg', buffer.getvalue())
+
+    @mock.patch('courses.tasks.image_tasks.publish_task')
+    def test_upload_schedules_and_builds_derivatives(self, publish):
+        course = Course.objects.create(title='Фишинг', description='', difficulty='easy', category='phishing')
+        test = create_test_with_questions(course, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            question_image = QuestionImage.objects.create(title='Письмо', image=self.upload(800, 400))
+        publish.assert_called_once()
+        self.assertEqual(publish.call_args.args[1]['action'], 'build_question_image_derivatives')
+
+        derivatives = build_question_image_derivatives_sync(question_image.id)
+        self.assertEqual([item['width'] for item in derivatives['webp']], [320, 640])
+        with question_image.image.storage.open(derivatives['jpeg'][0]['name']) as derivative_file:
+            with Image.open(derivative_file) as derivative:
+                self.assertEqual(derivative.size, (320, 160))
+                self.assertEqual(len(derivative.getexif()), 0)
+
+        question = test.questions.first()
+        question.image = question_image
+        question.save()
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='employee'))
+        data = client.get(f'/api/courses/questions/{question.id}/').json()
+        self.assertIn('type=webp&width=320 320w', data['image_srcset']['webp'])
+
+        response = client.get(data['image_url'], {'type': 'webp', 'width': 300})
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['ETag'], f'"{derivatives["webp"][0]["hash"]}"')
+
+        # Новое изображение - старые производные больше не отдаются
+        with self.captureOnCommitCallbacks(execute=True):
+            question_image.image = self.upload(200, 100)
+            question_image.save()
+        question_image.refresh_from_db()
+        self.assertIsNone(pick_derivative(question_image, 'webp'))
+        self.assertEqual(publish.call_count, 2)
+
+
+class ProgressPaginationTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        users = [User.objects.create(username=f'user{i}') for i in range(25)]
+        for user in users[:10]:
+            user.profile.branch = 'cardio'
+            user.profile.save()
+        bulk_enroll(self.course, [user.id for user in users])
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+
+    def test_admin_progress_walks_pages_by_cursor(self):
+        url = '/api/courses/progress/admin_progress/?page_size=10'
+        seen = []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 10)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, sorted(seen))
+        self.assertNotIn('count', response.data)
+
+    def test_list_returns_only_own_progress_for_staff(self):
+        admin = User.objects.get(username='admin')
+        CourseProgress.objects.create(user=admin, course=self.course)
+
+        response = self.client.get('/api/courses/progress/')
+
+        self.assertEqual([row['user']['id'] for row in response.data['results']], [admin.id])
+
+    def test_admin_progress_filters_in_sql(self):
+        response = self.client.get('/api/courses/progress/admin_progress/', {'branch': 'cardio'})
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNone(response.data['next'])
+
+
+class ProgressExportTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.test = create_test_with_questions(self.course, 2)
+        users = [User.objects.create(username=f'user{i}', last_name=f'Сотрудник{i}') for i in range(3)]
+        users[0].profile.branch = 'cardio'
+        users[0].profile.save()
+        bulk_enroll(self.course, [user.id for user in users])
+        TestAttemptResult.objects.create(user=users[0], test=self.test, attempt_number=1, score=1, passed=False, is_latest=False)
+        TestAttemptResult.objects.create(user=users[0], test=self.test, attempt_number=2, score=2, passed=True)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.url = '/api/courses/progress/export/'
+
+    def test_csv_export_streams_latest_scores(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'course_id': self.course.id})
+            content = b''.join(response.streaming_content).decode('utf-8-sig')
+
+        lines = content.strip().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].endswith(f'Тест: {self.test.title}'))
+        first = lines[1].split(';')
+        self.assertEqual(first[0], 'Сотрудник0')
+        self.assertEqual(first[5], 'НИИ Кардиологии')
+        self.assertEqual(first[-1], '2')
+
+        response = self.client.get(self.url, {'course_id': self.course.id, 'branch': 'cardio'})
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8-sig').strip().splitlines()), 2)
+
+    @override_settings(MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_ACCEL_PREFIX='')
+    def test_xlsx_export_is_built_by_worker(self):
+        from openpyxl import load_workbook
+
+        def run_worker(queue, task_data):
+            build_progress_export_sync(task_data['export_id'])
+
+        with mock.patch('courses.tasks.export_tasks.publish_task', side_effect=run_worker), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(self.url, {'course_id': self.course.id, 'type': 'xlsx'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertIsNone(response.data['download_url'])
+
+        status_response = self.client.get(f"/api/courses/progress/exports/{response.data['id']}/")
+        self.assertEqual(status_response.data['status'], 'ready')
+
+        download = self.client.get(status_response.data['download_url'])
+        self.assertEqual(download.status_code, 200)
+        sheet = load_workbook(BytesIO(b''.join(download.streaming_content)), read_only=True).active
+        rows = list(sheet.values)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][-1], 2)
+
+    def test_xlsx_export_fails_when_broker_is_down(self):
+        with mock.patch('courses.tasks.export_tasks.publish_task', side_effect=ConnectionError('broker down')), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(self.url, {'type': 'xlsx'})
+
+        export_id = response.data['id']
+        status_response = self.client.get(f'/api/courses/progress/exports/{export_id}/')
+        self.assertEqual(status_response.data['status'], 'failed')
+        self.assertEqual(self.client.get(f'/api/courses/progress/exports/{export_id}/download/').status_code, 404)
+
+    def test_export_requires_staff(self):
+        self.client.force_authenticate(User.objects.create(username='employee'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get('/api/courses/progress/exports/1/').status_code, 403)
+        self.assertEqual(self.client.get('/api/courses/progress/exports/1/download/').status_code, 403)
+
+    def test_invalid_course_id_is_rejected_before_streaming(self):
+        response = self.client.get(self.url, {'course_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+
+
+class ComplianceRollupTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Пароли', description='', difficulty='easy', category='passwords'
+        )
+        self.test = create_test_with_questions(self.course, 1)
+        self.users = [User.objects.create(username=f'user{i}') for i in range(6)]
+        for i, user in enumerate(self.users):
+            user.profile.branch = 'cardio' if i < 4 else 'oncology'
+            user.profile.department = 'ИТ' if i % 2 else 'Бухгалтерия'
+            user.profile.save()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+
+    def snapshot(self):
+        return sorted(
+            ComplianceRollup.objects.filter(count__gt=0)
+            .values_list('course_id', 'branch', 'department', 'status', 'count')
+        )
+
+    def test_incremental_counts_match_rebuild(self):
+        bulk_enroll(self.course, [user.id for user in self.users[:5]])
+        CourseProgress.objects.create(course=self.course, user=self.users[5])
+
+        TestAttemptResult.objects.create(user=self.users[0], test=self.test, attempt_number=1, score=1, passed=True)
+        TestAttemptResult.objects.create(user=self.users[4], test=self.test, attempt_number=1, score=1, passed=True)
+        recompute_course_progress(self.course.id)
+
+        progress = CourseProgress.objects.get(course=self.course, user=self.users[1])
+        progress.status = 'in_progress'
+        progress.save()
+        CourseProgress.objects.get(course=self.course, user=self.users[2]).delete()
+
+        profile = self.users[3].profile
+        profile.branch = 'head'
+        profile.save()
+
+        incremental = self.snapshot()
+        rebuild_compliance_rollups()
+        self.assertEqual(incremental, self.snapshot())
+        self.assertIn((self.course.id, 'cardio', 'Бухгалтерия', 'completed', 1), incremental)
+        self.assertIn((self.course.id, 'head', 'ИТ', 'not_started', 1), incremental)
+
+    def test_dashboard_reads_only_rollups(self):
+        bulk_enroll(self.course, [user.id for user in self.users])
+        TestAttemptResult.objects.create(user=self.users[0], test=self.test, attempt_number=1, score=1, passed=True)
+        recompute_course_progress(self.course.id)
+
+        url = '/api/courses/progress/compliance/'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        course = response.data[0]
+        self.assertEqual((course['total'], course['completed'], course['completion_rate']), (6, 1, 16.7))
+        cardio = next(row for row in course['branches'] if row['branch'] == 'cardio')
+        self.assertEqual((cardio['branch_name'], cardio['total'], cardio['completion_rate']), ('НИИ Кардиологии', 4, 25.0))
+        self.assertEqual(len(course['departments']), 4)
+
+        response = self.client.get(url, {'branch': 'oncology'})
+        self.assertEqual(response.data[0]['total'], 2)
+
+        user_client = APIClient()
+        user_client.force_authenticate(self.users[0])
+        self.assertEqual(user_client.get(url).status_code, 403)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='employee'))
+        self.url = '/api/courses/courses/'
+
+    def test_list_is_cached_until_course_changes(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        other_client = APIClient()
+        other_client.force_authenticate(User.objects.create(username='other'))
+        with self.assertNumQueries(0):
+            cached = other_client.get(self.url)
+            not_modified = other_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.course.title = 'Фишинг 2.0'
+        self.course.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['title'], 'Фишинг 2.0')
+
+    def test_materials_list_keeps_plain_list(self):
+        LearningMaterial.objects.create(course=self.course, material_type='link', content_url='https://example.com')
+        url = f'/api/courses/materials/?course_id={self.course.id}'
+        self.assertEqual(len(self.client.get(url).json()), 1)
+
+        LearningMaterial.objects.create(course=self.course, material_type='article')
+        self.assertEqual(len(self.client.get(url).json()), 2)
+
+
+class TestDeliveryTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        self.test = create_test_with_questions(self.course, 3)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='employee'))
+        self.url = f'/api/courses/tests/{self.test.id}/'
+
+    def test_delivery_is_cached_without_correct_flags(self):
+        response = self.client.get(self.url, {'course_id': self.course.id})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['questions']), 3)
+        self.assertNotIn(b'is_correct', response.content)
+        self.assertEqual(set(data['questions'][0]['options'][0]), {'id', 'text'})
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.assertEqual(self.client.get(self.url, {'course_id': self.course.id + 1}).status_code, 404)
+        self.assertEqual(self.client.get('/api/courses/tests/999999/').status_code, 404)
+
+        option = AnswerOption.objects.filter(question__test=self.test).first()
+        option.text = 'Новый текст'
+        option.save()
+        self.assertIn('Новый текст'.encode(), self.client.get(self.url).content)
+
+    def test_list_query_count_does_not_grow_with_questions(self):
+        url = '/api/courses/tests/'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'course_id': self.course.id})
+        few_queries = len(ctx.captured_queries)
+        self.assertNotIn(b'is_correct', response.content)
+
+        create_test_with_questions(self.course, 10)
+        with self.assertNumQueries(few_queries):
+            self.client.get(url, {'course_id': self.course.id})
+
+    def test_write_responses_hide_correct_flags(self):
+        response = self.client.patch(self.url, {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'is_correct', response.content)
+
+    def test_question_and_option_endpoints_hide_correct_flags(self):
+        question = self.test.questions.first()
+        for url in (f'/api/courses/questions/?test_id={self.test.id}', f'/api/courses/options/?question_id={question.id}'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(b'is_correct', response.content)
+
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.assertIn(b'is_correct', self.client.get(f'/api/courses/options/?question_id={question.id}').content)
+
+    @mock.patch('courses.services.enrollment.publish_test_delivery_warmup')
+    def test_bulk_enroll_schedules_warmup(self, publish):
+        user = User.objects.create(username='newcomer')
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_enroll(self.course, [user.id])
+        publish.assert_called_once_with(self.course.id)
+
+
+class UserAnswerDenormalizationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='employee', password='Secret-123')
+        self.course = Course.objects.create(
+            title='Фишинг', description='', difficulty='easy', category='phishing'
+        )
+        CourseProgress.objects.create(course=self.course, user=self.user, status='in_progress')
+        self.test = create_test_with_questions(self.course, 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_submit_fills_test_and_course(self):
+        response = self.client.post(
+            f'/api/courses/tests/{self.test.id}/submit/',
+            {'answers': build_answers(self.test), 'course_id': self.course.id},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            set(UserAnswer.objects.filter(user=self.user).values_list('test_id', 'course_id')),
+            {(self.test.id, self.course.id)}
+        )
+
+    def test_backfill_and_attempt_numbering_for_old_answers(self):
+        question = self.test.questions.first()
+        UserAnswer.objects.bulk_create([UserAnswer(user=self.user, question=question, attempt_number=1)])
+        TestAttemptResult.objects.create(
+            user=self.user, test=self.test, attempt_number=1, score=0, passed=False
+        )
+
+        response = self.client.post(
+            f'/api/courses/tests/{self.test.id}/submit/',
+            {'answers': build_answers(self.test), 'course_id': self.course.id},
+            format='json'
+        )
+        self.assertEqual(response.data['attempt_number'], 2)
+
+        call_command('backfill_user_answer_tests', batch_size=2, stdout=StringIO())
+        self.assertFalse(UserAnswer.objects.filter(test__isnull=True).exists())
+        self.assertEqual(UserAnswer.objects.filter(user=self.user, course=self.course).count(), 4)
+
+    def test_moving_question_or_test_updates_answers(self):
+        self.client.post(
+            f'/api/courses/tests/{self.test.id}/submit/',
+            {'answers': build_answers(self.test), 'course_id': self.course.id},
+            format='json'
+        )
+        other_course = Course.objects.create(
+            title='Пароли', description='', difficulty='easy', category='password_sec'
+        )
+        other_test = create_test_with_questions(other_course, 1)
+
+        question = self.test.questions.first()
+        question.test = other_test
+        question.save()
+        self.assertEqual(
+            set(UserAnswer.objects.filter(question=question).values_list('test_id', 'course_id')),
+            {(other_test.id, other_course.id)}
+        )
+
+        self.test.course = other_course
+        self.test.save()
+        self.assertEqual(UserAnswer.objects.filter(user=self.user, course=other_course).count(), 3)
+        self.assertFalse(UserAnswer.objects.filter(course=self.course).exists())
+
+    def test_lookups_use_covering_indexes(self):
+        by_test = UserAnswer.objects.filter(user=self.user, test=self.test).order_by('-attempt_number').explain()
+        by_course = UserAnswer.objects.filter(user=self.user, course=self.course).explain()
+        self.assertIn('answer_user_test_attempt_idx', by_test)
+        self.assertIn('answer_user_course_idx', by_course)
+
+
+class FakeCoursesChannel:
+    """Локальная замена канала RabbitMQ для воркера курсов"""
+
+    def __init__(self, bodies, headers=None):
+        self.bodies = bodies
+        self.headers = headers
+        self.acked = []
+        self.published = []
+
+    def queue_declare(self, queue, durable, arguments=None):
+        pass
+
+    def basic_qos(self, prefetch_count):
+        pass
+
+    def basic_consume(self, queue, on_message_callback):
+        self.callback = on_message_callback
+
+    def start_consuming(self):
+        for tag, body in enumerate(self.bodies, start=1):
+            self.callback(self, mock.Mock(delivery_tag=tag), mock.Mock(headers=self.headers), body)
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, properties.headers['x-retries'], body))
+
+
+@override_settings(
+    RABBITMQ_HOST='localhost', RABBITMQ_PORT=5672,
+    RABBITMQ_USERNAME='guest', RABBITMQ_PASSWORD='guest',
+    RABBITMQ_COURSES_QUEUE='course_tasks', RABBITMQ_RETRY_DELAY=5, RABBITMQ_RETRY_MAX_DELAY=600
+)
+class CoursesWorkerTests(TestCase):
+    def run_worker(self, bodies, headers=None, **options):
+        channel = FakeCoursesChannel(bodies, headers)
+        connection = mock.Mock()
+        connection.channel.return_value = channel
+        with mock.patch('courses.management.commands.courses_worker.pika.BlockingConnection', return_value=connection):
+            call_command('courses_worker', stdout=StringIO(), **options)
+        return channel
+
+    def test_failing_task_is_acked_and_retried_with_delay(self):
+        body = json.dumps({'action': 'recompute_course_progress', 'course_id': 1})
+        second = json.dumps({'action': 'recompute_course_progress', 'course_id': 2})
+        with mock.patch(
+            'courses.management.commands.courses_worker.recompute_course_progress_sync',
+            side_effect=[RuntimeError('db down'), 0]
+        ) as recompute:
+            channel = self.run_worker([body, second], max_retries=3)
+
+        # Упавшее задание не останавливает воркер: следующее тоже обработано
+        self.assertEqual(recompute.call_count, 2)
+        self.assertEqual(channel.acked, [1, 2])
+        self.assertEqual(channel.published, [('course_tasks.delay.5000', 1, body)])
+
+    def test_task_is_dead_lettered_after_max_retries(self):
+        body = json.dumps({'action': 'recompute_course_progress', 'course_id': 1})
+        with mock.patch(
+            'courses.management.commands.courses_worker.recompute_course_progress_sync',
+            side_effect=RuntimeError('course deleted')
+        ):
+            channel = self.run_worker([body], headers={'x-retries': 1}, max_retries=3)
+            self.assertEqual(channel.published, [('course_tasks.delay.10000', 2, body)])
+
+            channel = self.run_worker([body], headers={'x-retries': 2}, max_retries=3)
+            self.assertEqual(channel.published, [('course_tasks.failed', 3, body)])
+        self.assertEqual(channel.acked, [1])
+
+    def test_invalid_payload_is_acked(self):
+        channel = self.run_worker(['not json'])
+        self.assertEqual(channel.acked, [1])
+        self.assertEqual(channel.published, [])
@@ -3,38 +3,55 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, quote_etag
 from django.utils import timezone
-from django.db.models import Max, Sum
 from .models import (
     Course, LearningMaterial, Test, 
     Question, AnswerOption, CourseProgress,
-    UserAnswer, SelectedAnswer
+    UserAnswer, SelectedAnswer, TestAttemptResult,
+    QuestionImage, ProgressExport
 )
 from .serializers import (
     CourseSerializer, LearningMaterialSerializer,
-    TestSerializer, QuestionSerializer,
-    AnswerOptionSerializer, CourseProgressSerializer,
-    UserAnswerSerializer, SelectedAnswerSerializer
+    TestSerializer, TestDeliverySerializer, QuestionSerializer,
+    QuestionDeliverySerializer, AnswerOptionSerializer,
+    AnswerOptionDeliverySerializer, CourseProgressSerializer,
+    UserAnswerSerializer, SelectedAnswerSerializer,
+    ProgressExportSerializer
 )
+from .services.grading import grade_submission
+from .services.enrollment import select_users, bulk_enroll, lock_course
+from .services.compliance import compliance_dashboard
+from .services.delivery import get_test_delivery
+from .services.exports import EXPORT_FORMATS, progress_export_rows, iter_csv
+from .tasks.export_tasks import publish_progress_export
+from .services.images import FORMATS as IMAGE_FORMATS, pick_derivative
+from cyber_edu.pagination import KeysetPagination
+from cyber_edu.protected_media import serve_protected_file, pending_content_hash
+from cyber_edu.response_cache import VersionedListCacheMixin
 
 
 User = get_user_model()
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(VersionedListCacheMixin, viewsets.ModelViewSet):
     queryset = Course.objects.filter(is_active=True)
     serializer_class = CourseSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cache_models = (Course,)
     filterset_fields = ['category', 'difficulty']
-    
-    def list(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+    pagination_class = KeysetPagination
 
-class LearningMaterialViewSet(viewsets.ModelViewSet):
+class LearningMaterialViewSet(VersionedListCacheMixin, viewsets.ModelViewSet):
     serializer_class = LearningMaterialSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Материалы курса отдаются одним списком, без страниц
+    pagination_class = None
+    cache_models = (LearningMaterial,)
     
     def get_queryset(self):
         queryset = LearningMaterial.objects.all()
@@ -42,41 +59,76 @@ class LearningMaterialViewSet(viewsets.ModelViewSet):
         if course_id:
             queryset = queryset.filter(course_id=course_id)
         return queryset
-    
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        material = self.get_object()
+        if not material.content_file:
+            return Response({'error': 'Файл не найден'}, status=404)
+
+        try:
+            return serve_protected_file(
+                request,
+                material.content_file,
+                content_hash=pending_content_hash(material, 'content_file')
+            )
+        except FileNotFoundError:
+            return Response({'error': 'Файл отсутствует на сервере'}, status=404)
 
 class TestViewSet(viewsets.ModelViewSet):
     serializer_class = TestSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
+    def get_serializer_class(self):
+        # Признаки правильных ответов видят только администраторы,
+        # в том числе в ответах на создание и изменение теста
+        if self.request.user.is_staff:
+            return TestSerializer
+        return TestDeliverySerializer
+
     def get_queryset(self):
-        queryset = Test.objects.all().prefetch_related('questions')
+        queryset = Test.objects.all().prefetch_related(
+            Prefetch(
+                'questions',
+                queryset=Question.objects.select_related('image').prefetch_related('options').order_by('id')
+            )
+        )
         course_id = self.request.query_params.get('course_id')
         if course_id:
             queryset = queryset.filter(course_id=course_id)
         return queryset
     
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
+        """
+        Выдача теста для прохождения из кэша готовых JSON-байтов:
+        сборка выполняется один раз на версию теста, ETag - версия теста.
+        """
+        try:
+            test_id = int(kwargs['pk'])
+        except ValueError:
+            return Response({'error': 'Тест не найден'}, status=status.HTTP_404_NOT_FOUND)
+
+        delivery = get_test_delivery(test_id)
+        if delivery is None:
+            return Response({'error': 'Тест не найден'}, status=status.HTTP_404_NOT_FOUND)
+        test_course_id, content, version = delivery
         course_id = request.query_params.get('course_id')
         
         # Проверяем, принадлежит ли тест запрошенному курсу
-        if course_id and instance.course_id != int(course_id):
+        if course_id and test_course_id != int(course_id):
             return Response(
                 {'error': 'Тест не принадлежит указанному курсу'},
                 status=status.HTTP_404_NOT_FOUND
             )
-        
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
-    
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+
+        etag = quote_etag(f'{test_id}-{version}')
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     
     @action(detail=True, methods=['post'])
     def submit(self, request, pk=None):
@@ -93,82 +145,9 @@ class TestViewSet(viewsets.ModelViewSet):
 
         try:
             with transaction.atomic():
-                last_attempt = UserAnswer.objects.filter(
-                user=user,
-                question__test=test
-                ).order_by('-attempt_number').first()
-            
-                attempt_number = last_attempt.attempt_number + 1 if last_attempt else 1
-                
-                total_score_current_test = 0
-                
-                for answer_data in answers:
-                    question_id = answer_data.get('question')
-                    selected_options = answer_data.get('selected_options', [])
-                    answer_text = answer_data.get('answer_data')
-                    
-                    try:
-                        question = Question.objects.get(id=question_id, test=test)
-                    except Question.DoesNotExist:
-                        continue
-                    
-                    # Создаем ответ пользователя с номером попытки
-                    user_answer = UserAnswer.objects.create(
-                        user=user,
-                        question=question,
-                        answer_data=answer_text,
-                        attempt_number=attempt_number
-                    )
-                    
-                    # Обработка выбранных вариантов
-                    points_earned = 0
-                    
-                    if question.question_type == 'text':
-                        # Для текстовых ответов пока просто даем 0 баллов
-                        # Можно добавить логику проверки текстовых ответов
-                        points_earned = 0
-                    else:
-                        # Для выбора вариантов
-                        correct_options = question.options.filter(is_correct=True)
-                        selected_correct = 0
-                        selected_wrong = 0
-                        
-                        for option_id in selected_options:
-                            try:
-                                option = AnswerOption.objects.get(id=option_id, question=question)
-                                SelectedAnswer.objects.create(
-                                    user_answer=user_answer,
-                                    answer_option=option,
-                                    is_selected=True
-                                )
-                                
-                                if option.is_correct:
-                                    selected_correct += 1
-                                else:
-                                    selected_wrong += 1
-                            except AnswerOption.DoesNotExist:
-                                continue
-                        
-                        # Рассчитываем баллы в зависимости от типа вопроса
-                        if question.question_type == 'single':
-                            points_earned = question.points if selected_correct == 1 and selected_wrong == 0 else 0
-                        elif question.question_type == 'multiple':
-                            total_correct = correct_options.count()
-                            if selected_wrong > 0:
-                                points_earned = 0
-                            else:
-                                points_earned = (selected_correct / total_correct) * question.points
-                    
-                    user_answer.points_earned = points_earned
-                    user_answer.save()
-                    total_score_current_test += points_earned
-                
-                user_answers = UserAnswer.objects.filter(
-                    user=user,
-                    question__test__course_id=course_id
-                )
-
-                total_score_for_success_tests = sum(answer.points_earned for answer in user_answers)
+                result = grade_submission(test, user, answers)
+                attempt_number = result['attempt_number']
+                total_score_current_test = result['total_score']
                 
                 # Обновляем прогресс курса
                 progress, _ = CourseProgress.objects.get_or_create(
@@ -177,16 +156,9 @@ class TestViewSet(viewsets.ModelViewSet):
                     defaults={'status': 'in_progress'}
                 )
                 
-                if progress.check_tests_completion() is True:
-                    progress.status = 'completed'
-                    progress.progress_percent = 100
-                    progress.completed_at = timezone.now()
-                else:
-                # Обновляем счет
+                if progress.status == 'not_started':
                     progress.status = 'in_progress'
-                    progress.progress_percent = min(100, int((total_score_for_success_tests / progress.score) * 100))
-            
-                progress.save()
+                progress.check_and_update_status()
                 
                 return Response({
                     'status': 'success',
@@ -212,58 +184,30 @@ class TestViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            # 1. Получаем все тесты курса одним запросом
-            tests = Test.objects.filter(course_id=course_id).in_bulk()
-            
-            # 2. Находим последние попытки для всех тестов (1 запрос)
-            last_attempts = (
-                UserAnswer.objects
+            # Последние попытки по всем тестам курса - выборка по индексу
+            results = (
+                TestAttemptResult.objects
                 .filter(
                     user=request.user,
-                    question__test__course_id=course_id
-                )
-                .values('question__test')  # Группируем по тесту
-                .annotate(
-                    last_attempt=Max('attempt_number'),
-                    last_attempt_date=Max('answered_at')
+                    test__course_id=course_id,
+                    is_latest=True
                 )
+                .select_related('test')
+                .order_by('test_id')
             )
 
-            # 3. Получаем суммарные баллы для последних попыток (1 запрос)
-            test_scores = (
-                UserAnswer.objects
-                .filter(
-                    user=request.user,
-                    question__test__course_id=course_id,
-                    attempt_number__in=[a['last_attempt'] for a in last_attempts]
-                )
-                .values('question__test', 'attempt_number')
-                .annotate(total_score=Sum('points_earned'))
-            )
-
-            # 4. Формируем результаты
-            test_results = []
-            test_attempt_map = {a['question__test']: a for a in last_attempts}
-            score_map = {(s['question__test'], s['attempt_number']): s['total_score'] 
-                        for s in test_scores}
-
-            for test_id, test in tests.items():
-                attempt_data = test_attempt_map.get(test_id)
-                if not attempt_data:
-                    continue
-                    
-                attempt_number = attempt_data['last_attempt']
-                total_score = score_map.get((test_id, attempt_number), 0)
-                
-                test_results.append({
-                    'test': test_id,
-                    'title': test.title,
-                    'score': total_score,
-                    'max_score': test.max_score,
-                    'is_passed': total_score >= test.passing_score,
-                    'passed_at': attempt_data['last_attempt_date'],
-                    'attempt_number': attempt_number
-                })
+            test_results = [
+                {
+                    'test': result.test_id,
+                    'title': result.test.title,
+                    'score': result.score,
+                    'max_score': result.test.max_score,
+                    'is_passed': result.score >= result.test.passing_score,
+                    'passed_at': result.finished_at,
+                    'attempt_number': result.attempt_number
+                }
+                for result in results
+            ]
 
             return Response(test_results)
 
@@ -275,9 +219,15 @@ class TestViewSet(viewsets.ModelViewSet):
     
 
 class QuestionViewSet(viewsets.ModelViewSet):
-    queryset = Question.objects.all()
+    queryset = Question.objects.select_related('image').prefetch_related('options')
     serializer_class = QuestionSerializer
     permission_classes = [permissions.IsAuthenticated]
+
+    def get_serializer_class(self):
+        # Признаки правильных ответов видят только администраторы
+        if self.request.user.is_staff:
+            return QuestionSerializer
+        return QuestionDeliverySerializer
     
     def get_queryset(self):
         test_id = self.request.query_params.get('test_id')
@@ -296,10 +246,43 @@ class QuestionViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True, context={'request': request})
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def image(self, request, pk=None):
+        """
+        Изображение вопроса. С параметрами type (webp/jpeg) и width
+        отдается наименьшая подходящая уменьшенная версия, без них - исходник.
+        Параметр format занят DRF под выбор рендерера.
+        """
+        question = self.get_object()
+        if not question.image or not question.image.image:
+            return Response({'error': 'Изображение не найдено'}, status=404)
+
+        question_image = question.image
+        image_format = request.query_params.get('type')
+        width = request.query_params.get('width')
+        derivative = None
+        if image_format in IMAGE_FORMATS:
+            derivative = pick_derivative(
+                question_image, image_format, int(width) if width and width.isdigit() else None
+            )
+
+        try:
+            if derivative is not None:
+                field_file = FieldFile(question_image, QuestionImage._meta.get_field('image'), derivative['name'])
+                return serve_protected_file(request, field_file, content_hash=derivative['hash'])
+            return serve_protected_file(request, question_image.image)
+        except FileNotFoundError:
+            return Response({'error': 'Изображение отсутствует на сервере'}, status=404)
+
 class AnswerOptionViewSet(viewsets.ModelViewSet):
     queryset = AnswerOption.objects.all()
     serializer_class = AnswerOptionSerializer
     permission_classes = [permissions.IsAuthenticated]
+
+    def get_serializer_class(self):
+        if self.request.user.is_staff:
+            return AnswerOptionSerializer
+        return AnswerOptionDeliverySerializer
     
     def get_queryset(self):
         question_id = self.request.query_params.get('question_id')
@@ -338,17 +321,22 @@ class CourseProgressViewSet(viewsets.ModelViewSet):
     queryset = CourseProgress.objects.all()
     serializer_class = CourseProgressSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
+        queryset = CourseProgress.objects.select_related('course', 'user')
+
         # Для администраторов
         if self.request.user.is_staff:
-            return CourseProgress.objects.all()
+            return queryset
         
         # Для обычных пользователей - строго только их записи
-        return CourseProgress.objects.filter(user=self.request.user)
+        return queryset.filter(user=self.request.user)
     
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
+        # Список - всегда собственный прогресс, в том числе у администратора.
+        # Прогресс всех пользователей отдается постранично через admin_progress
+        queryset = self.filter_queryset(self.get_queryset()).filter(user=request.user)
         course_id = request.query_params.get('course_id')
         
         if course_id:
@@ -359,9 +347,10 @@ class CourseProgressViewSet(viewsets.ModelViewSet):
                 return Response(serializer.data)
             return Response({})  # Или Response(None, status=404)
         
-        # Если course_id не указан, возвращаем все прогрессы пользователя
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        # Если course_id не указан, возвращаем прогрессы пользователя постранично
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def admin_progress(self, request):
@@ -371,10 +360,128 @@ class CourseProgressViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        # Фильтры применяются в SQL до выборки страницы
         progress = self.get_queryset()
-        serializer = self.get_serializer(progress, many=True)
-        return Response(serializer.data)
+        params = request.query_params
+        if params.get('course_id'):
+            progress = progress.filter(course_id=params['course_id'])
+        if params.get('user_id'):
+            progress = progress.filter(user_id=params['user_id'])
+        if params.get('status'):
+            progress = progress.filter(status=params['status'])
+        if params.get('branch'):
+            progress = progress.filter(user__profile__branch=params['branch'])
+        if params.get('department'):
+            progress = progress.filter(user__profile__department=params['department'])
+
+        page = self.paginate_queryset(progress)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Выгрузка прогресса с баллами последних попыток в CSV или XLSX.
+        Фильтры: course_id, branch, department, status; формат - параметр type.
+        CSV отдается потоком по мере чтения строк. XLSX-книгу нельзя отдать,
+        пока она не собрана целиком, поэтому ее собирает воркер курсов:
+        ответ 202 содержит выгрузку, статус которой проверяется через
+        exports/<id>/, а готовый файл скачивается по download_url.
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Only admin can export progress'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        export_type = request.query_params.get('type', 'csv')
+        if export_type not in EXPORT_FORMATS:
+            return Response(
+                {'error': f'type must be one of: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Параметры проверяются до ответа: после начала потоковой выдачи
+        # код 200 уже отправлен, и ошибку вернуть нельзя
+        course_id = request.query_params.get('course_id')
+        if course_id:
+            try:
+                course_id = int(course_id)
+            except ValueError:
+                return Response(
+                    {'error': 'course_id must be an integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        filters = {
+            'course_id': course_id or None,
+            'branch': request.query_params.get('branch'),
+            'department': request.query_params.get('department'),
+            'status': request.query_params.get('status'),
+        }
+
+        if export_type == 'xlsx':
+            export = ProgressExport.objects.create(requested_by=request.user, params=filters)
+            transaction.on_commit(lambda: publish_progress_export(export.id))
+            return Response(ProgressExportSerializer(export).data, status=status.HTTP_202_ACCEPTED)
+
+        filename = f'progress_{timezone.localdate():%Y%m%d}.csv'
+        response = StreamingHttpResponse(iter_csv(progress_export_rows(**filters)), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    @action(detail=False, methods=['get'], url_path=r'exports/(?P<export_id>[0-9]+)', url_name='export-status')
+    def export_status(self, request, export_id=None):
+        """Статус XLSX-выгрузки, собираемой воркером курсов"""
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Only admin can export progress'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            export = ProgressExport.objects.get(pk=export_id)
+        except ProgressExport.DoesNotExist:
+            return Response({'error': 'Выгрузка не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ProgressExportSerializer(export).data)
+
+    @action(detail=False, methods=['get'], url_path=r'exports/(?P<export_id>[0-9]+)/download', url_name='export-download')
+    def export_download(self, request, export_id=None):
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Only admin can export progress'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        export = ProgressExport.objects.filter(pk=export_id, status='ready').first()
+        if export is None or not export.file:
+            return Response({'error': 'Выгрузка не найдена'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            return serve_protected_file(
+                request,
+                export.file,
+                as_attachment=True,
+                filename=f'progress_{timezone.localtime(export.created_at):%Y%m%d}.xlsx'
+            )
+        except FileNotFoundError:
+            return Response({'error': 'Файл отсутствует на сервере'}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['get'])
+    def compliance(self, request):
+        """
+        Доля прохождения курсов по филиалам и отделам из сводной таблицы.
+        Фильтры: course_id, branch.
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Only admin can access this data'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        return Response(compliance_dashboard(
+            course_id=request.query_params.get('course_id'),
+            branch=request.query_params.get('branch'),
+        ))
+
     @action(detail=False, methods=['post'])
     def subscribe(self, request):
         course_id = request.data.get('course_id')
@@ -388,6 +495,8 @@ class CourseProgressViewSet(viewsets.ModelViewSet):
         
         try:
             with transaction.atomic():
+                # Та же блокировка, что и при массовом назначении
+                lock_course(course_id)
                 progress, created = CourseProgress.objects.select_for_update().get_or_create(
                     course_id=course_id,
                     user_id=user_id,
@@ -416,6 +525,53 @@ class CourseProgressViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'])
+    def bulk_subscribe(self, request):
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Only admin can assign courses in bulk'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        course_id = request.data.get('course_id')
+        branch = request.data.get('branch')
+        department = request.data.get('department')
+        user_ids = request.data.get('user_ids') or []
+
+        if not course_id:
+            return Response(
+                {'error': 'course_id is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not isinstance(user_ids, list):
+            return Response(
+                {'error': 'user_ids must be a list of integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            user_ids = [int(user_id) for user_id in user_ids]
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'user_ids must be a list of integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not (branch or department or user_ids):
+            return Response(
+                {'error': 'branch, department or user_ids is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            course = Course.objects.get(pk=course_id)
+        except Course.DoesNotExist:
+            return Response({'error': 'course not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        matched_user_ids = select_users(branch=branch, department=department, user_ids=user_ids)
+        summary = bulk_enroll(course, matched_user_ids)
+        return Response(summary, status=status.HTTP_200_OK)
+    
     @action(detail=True, methods=['post'])
     def unsubscribe(self, request, *args, **kwargs):
         progress = self.get_object()
@@ -443,6 +599,12 @@ class UserAnswerViewSet(viewsets.ModelViewSet):
         queryset = self.queryset.filter(user=user)
         if question_id:
             queryset = queryset.filter(question_id=question_id)
+        test_id = self.request.query_params.get('test_id')
+        if test_id:
+            queryset = queryset.filter(test_id=test_id)
+        course_id = self.request.query_params.get('course_id')
+        if course_id:
+            queryset = queryset.filter(course_id=course_id)
         return queryset
     
     def perform_create(self, serializer):
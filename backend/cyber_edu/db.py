@@ -0,0 +1,12 @@
+from django.db import close_old_connections, connection
+
+
+def refresh_db_connection():
+    """
+    Аналог проверки соединений в начале HTTP-запроса для долгоживущих
+    процессов (воркеры очередей): закрывает устаревшие и оборванные
+    постоянные соединения, чтобы следующий запрос открыл новое.
+    Внутри открытой транзакции (например, в тестах) ничего не делает.
+    """
+    if not connection.in_atomic_block:
+        close_old_connections()
@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация по индексированному столбцу.
+    Страница выбирается условием WHERE по ключу последней записи, без OFFSET
+    и без COUNT(*), поэтому время ответа и память не зависят от размера таблицы.
+    Ключ задается атрибутом cursor_ordering у view, по умолчанию - первичный ключ.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', self.ordering)
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
@@ -0,0 +1,197 @@
+import fcntl
+import os
+import queue
+from contextlib import contextmanager
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+
+class ClickForwarder:
+    """
+    Пересылает rid кликов по фишинговым ссылкам во внешний трекер.
+    Потоки запускаются лениво при первом клике в каждом процессе (в том числе
+    после fork воркера gunicorn), а не при импорте модуля. Каждый поток
+    забирает из очереди пачку rid и отправляет их через keep-alive сессию.
+    Если очередь переполнена, трекер отвечает медленно или с ошибкой, rid
+    дописываются в локальный файл и переотправляются позже. Файл общий для
+    всех процессов gunicorn, поэтому запись и забор его на переотправку
+    идут под блокировкой fcntl.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._threads = []
+        self._stop = threading.Event()
+        self._tracker_down_until = 0
+        self._last_replay = 0
+        self.counters = {
+            'queued': 0,
+            'forwarded': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'dropped': 0,
+        }
+
+    @property
+    def tracker_url(self):
+        return settings.PHISHING_TRACKER_URL
+
+    @property
+    def spill_path(self):
+        return settings.PHISHING_SPILL_PATH
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['queue_size'] = self._queue.qsize() if self._queue is not None else 0
+        stats['tracker_available'] = time.monotonic() >= self._tracker_down_until
+        # Счетчики ведутся в каждом процессе отдельно
+        stats['pid'] = os.getpid()
+        return stats
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Потоки родительского процесса после fork не существуют
+            self._queue = queue.Queue(maxsize=settings.PHISHING_QUEUE_SIZE)
+            self._stop = threading.Event()
+            self._threads = []
+            for _ in range(settings.PHISHING_WORKERS):
+                thread = threading.Thread(target=self._worker, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def submit(self, rid):
+        """Ставит rid в очередь на пересылку, не блокируя запрос"""
+        rid = rid.strip().replace('\n', '').replace('\r', '')
+        if not rid:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(rid)
+            self._count('queued')
+        except queue.Full:
+            self._spill([rid])
+
+    def stop(self):
+        self._stop.set()
+
+    @contextmanager
+    def _locked_spill(self):
+        """Блокировка файла отложенных rid между потоками и процессами"""
+        with self._spill_lock, open(f'{self.spill_path}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _spill(self, rids):
+        try:
+            with self._locked_spill(), open(self.spill_path, 'a', encoding='utf-8') as spill:
+                spill.write(''.join(f'{rid}\n' for rid in rids))
+            self._count('spilled', len(rids))
+        except OSError as e:
+            print(f"Error spilling phishing clicks: {e}")
+            self._count('dropped', len(rids))
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _deliver(self, session, rids):
+        """
+        Отправляет пачку rid через одну keep-alive сессию.
+        Возвращает rid, которые не удалось отправить.
+        """
+        for index, rid in enumerate(rids):
+            if time.monotonic() < self._tracker_down_until:
+                return rids[index:]
+            try:
+                response = session.get(
+                    self.tracker_url,
+                    params={'rid': rid},
+                    timeout=settings.PHISHING_TRACKER_TIMEOUT,
+                    verify=False
+                )
+                delivered = response.ok
+            except requests.RequestException:
+                delivered = False
+            if not delivered:
+                # Трекер медленный, недоступен или отвечает ошибкой - не держим
+                # очередь, откладываем остаток пачки в файл
+                self._tracker_down_until = time.monotonic() + settings.PHISHING_TRACKER_BACKOFF
+                return rids[index:]
+            self._count('forwarded')
+        return []
+
+    def _replay(self, session):
+        """Переотправляет rid, отложенные в файл, пока трекер доступен"""
+        # Файл забирается целиком под блокировкой, поэтому один и тот же rid
+        # не переотправят два процесса
+        replay_path = f'{self.spill_path}.replay.{os.getpid()}'
+        with self._locked_spill():
+            if os.path.exists(replay_path) or not os.path.exists(self.spill_path):
+                return
+            os.replace(self.spill_path, replay_path)
+
+        with open(replay_path, encoding='utf-8') as replay:
+            rids = [line.strip() for line in replay if line.strip()]
+        os.remove(replay_path)
+
+        batch_size = settings.PHISHING_BATCH_SIZE
+        for start in range(0, len(rids), batch_size):
+            batch = rids[start:start + batch_size]
+            failed = self._deliver(session, batch)
+            self._count('replayed', len(batch) - len(failed))
+            if failed:
+                self._spill(failed + rids[start + batch_size:])
+                return
+
+    def _worker(self):
+        session = self._new_session()
+        batch_size = settings.PHISHING_BATCH_SIZE
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=1)]
+            except queue.Empty:
+                now = time.monotonic()
+                if now >= self._tracker_down_until and now - self._last_replay >= settings.PHISHING_REPLAY_INTERVAL:
+                    self._last_replay = now
+                    try:
+                        self._replay(session)
+                    except OSError as e:
+                        print(f"Error replaying phishing clicks: {e}")
+                continue
+
+            while len(batch) < batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            failed = self._deliver(session, batch)
+            if failed:
+                self._spill(failed)
+            for _ in batch:
+                self._queue.task_done()
+
+
+forwarder = ClickForwarder()
@@ -0,0 +1,169 @@
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def file_content_hash(field_file):
+    """SHA-256 содержимого файла, используется как сильный ETag"""
+    digest = hashlib.sha256()
+    for chunk in field_file.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pending_content_hash(instance, file_field, hash_field='content_hash'):
+    """
+    Возвращает хэш файла объекта или None, если его еще нет.
+    Для файлов, загруженных до появления хэшей, расчет ставится в очередь
+    воркера курсов (не чаще раза в CONTENT_HASH_RETRY секунд на файл),
+    а файл до этого отдается без ETag - чтение большого файла целиком
+    не должно занимать воркер gunicorn.
+    """
+    content_hash = getattr(instance, hash_field)
+    if content_hash:
+        return content_hash
+
+    from accounts.rabbitmq import publish_task
+
+    label = instance._meta.label_lower
+    pending_key = f'content_hash_pending:{label}:{instance.pk}'
+    if cache.add(pending_key, 1, settings.CONTENT_HASH_RETRY):
+        try:
+            publish_task(settings.RABBITMQ_COURSES_QUEUE, {
+                'action': 'compute_content_hash',
+                'model': label,
+                'pk': instance.pk,
+                'file_field': file_field,
+                'hash_field': hash_field,
+            })
+        except Exception:
+            # Повторим при следующем скачивании или командой backfill_content_hashes
+            cache.delete(pending_key)
+    return None
+
+
+def store_content_hash(model_label, pk, file_field, hash_field='content_hash'):
+    """
+    Считает и сохраняет хэш файла без вызова save().
+    Выполняется воркером курсов и командой backfill_content_hashes.
+    """
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if instance is None or getattr(instance, hash_field) or not getattr(instance, file_field):
+        return None
+    content_hash = file_content_hash(getattr(instance, file_field))
+    type(instance).objects.filter(pk=pk).update(**{hash_field: content_hash})
+    return content_hash
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном.
+    Возвращает (start, end) включительно, None если заголовок не поддерживается
+    (тогда отдается весь файл) или False если диапазон вне файла.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # bytes=-500 - последние 500 байт
+        length = int(end)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def set_validators(response, etag, last_modified):
+    if etag:
+        response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Файлы закрыты авторизацией: браузер хранит копию, но перепроверяет ее
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def serve_protected_file(request, field_file, as_attachment=False, filename=None, content_hash=None):
+    """
+    Отдает файл из MEDIA_ROOT после проверки прав во view.
+    По content_hash формируется сильный ETag; If-None-Match и If-Modified-Since
+    обрабатываются здесь же, поэтому повторное открытие файла дает 304 без тела.
+    Если задан PROTECTED_MEDIA_ACCEL_PREFIX, файл отдает nginx через
+    X-Accel-Redirect из internal location, а воркер gunicorn сразу освобождается.
+    Иначе файл отдается из Python с поддержкой Range и If-Range.
+    Бросает FileNotFoundError, если файла нет на диске.
+    """
+    filename = filename or os.path.basename(field_file.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(as_attachment, filename)
+    etag = quote_etag(content_hash) if content_hash else None
+    last_modified = int(field_file.storage.get_modified_time(field_file.name).timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return set_validators(response, etag, last_modified)
+
+    if settings.PROTECTED_MEDIA_ACCEL_PREFIX:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.PROTECTED_MEDIA_ACCEL_PREFIX + quote(field_file.name)
+        response['Content-Disposition'] = disposition
+        return set_validators(response, etag, last_modified)
+
+    file = field_file.storage.open(field_file.name, 'rb')
+    size = file.size
+    byte_range = parse_range(request.headers.get('Range', ''), size)
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and if_range and (not etag or if_range != etag):
+        # Файл изменился с момента первой части - отдаем его целиком
+        byte_range = None
+
+    if byte_range is False:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(iter_range(file, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    return set_validators(response, etag, last_modified)
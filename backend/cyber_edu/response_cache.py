@@ -0,0 +1,91 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from cyber_edu.versioning import new_version
+
+VERSION_KEY = 'content_version:{label}'
+RESPONSE_KEY = 'response_cache:{digest}'
+
+
+def _cache_timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def get_content_version(model):
+    """Текущая версия содержимого модели (общая для всех процессов)"""
+    version_key = VERSION_KEY.format(label=model._meta.label_lower)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, new_version(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def bump_content_version(model):
+    """Помечает устаревшими все закэшированные ответы, построенные по модели"""
+    cache.set(VERSION_KEY.format(label=model._meta.label_lower), new_version(), None)
+
+
+def schedule_content_version_bump(model):
+    """
+    Меняет версию сразу и повторно после фиксации транзакции,
+    чтобы параллельный запрос не закэшировал незафиксированное состояние
+    """
+    bump_content_version(model)
+    transaction.on_commit(lambda: bump_content_version(model))
+
+
+class VersionedListCacheMixin:
+    """
+    Кэш ответа list() для справочных списков, одинаковых для всех пользователей.
+
+    Ключ строится из версий моделей cache_models, полного URL запроса
+    (фильтры, курсор, хост для абсолютных ссылок) и формата ответа.
+    Версии меняются сигналами save/delete, поэтому устаревший ответ
+    не отдается, а записи старых версий просто истекают по таймауту.
+    ETag выводится из того же ключа: If-None-Match проверяется до обращения
+    к базе и к закэшированному телу. Кэшируются только JSON-ответы -
+    HTML-версия DRF содержит данные текущего пользователя.
+    """
+    cache_models = ()
+
+    def get_response_cache_digest(self, request):
+        versions = ','.join(str(get_content_version(model)) for model in self.cache_models)
+        source = f'{versions}|{request.accepted_media_type}|{request.build_absolute_uri()}'
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+
+        digest = self.get_response_cache_digest(request)
+        etag = quote_etag(digest)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            cached = cache.get(RESPONSE_KEY.format(digest=digest))
+            if cached is not None:
+                content_type, content = cached
+                response = HttpResponse(content, content_type=content_type)
+        if response is None:
+            self._response_cache_digest = digest
+            response = super().list(request, *args, **kwargs)
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        digest = getattr(self, '_response_cache_digest', None)
+        if digest and response.status_code == 200:
+            response.render()
+            cache.set(
+                RESPONSE_KEY.format(digest=digest),
+                (response['Content-Type'], response.content),
+                _cache_timeout()
+            )
+        return response
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
     'accounts',
     'courses',
     'documents',
+    'phishing',
 ]
 
 REST_FRAMEWORK = {
@@ -69,6 +70,9 @@ REST_FRAMEWORK = {
 SESSION_SAVE_EVERY_REQUEST = True
 SESSION_COOKIE_AGE = 3600
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
+# Сессии читаются из кэша и продлеваются записью не чаще раза в интервал (accounts/sessions.py)
+SESSION_ENGINE = 'accounts.sessions'
+SESSION_REFRESH_INTERVAL = int(os.getenv('SESSION_REFRESH_INTERVAL', 300))
 
 MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -155,18 +159,87 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Соединение переиспользуется между запросами одного потока, перед первым
+        # запросом каждого HTTP-запроса проверяется и при обрыве открывается заново
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# DB_CONN_MODE=pool - пул соединений psycopg 3 в каждом процессе gunicorn
+# (нужен пакет psycopg[pool] вместо psycopg2). Размер пула задается на процесс:
+# для sync-воркеров хватает 1-2, для --threads N нужно не меньше N.
+# Соединение возвращается в пул в конце запроса, перед выдачей проверяется.
+if os.getenv('DB_CONN_MODE') == 'pool':
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 4)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'check': ConnectionPool.check_connection,
+        },
+    }
+
 RABBITMQ_HOST = os.getenv('RABBITMQ_HOST')
 RABBITMQ_PORT = os.getenv('RABBITMQ_PORT')
 RABBITMQ_USERNAME = os.getenv('RABBITMQ_USERNAME')
 RABBITMQ_PASSWORD = os.getenv('RABBITMQ_PASSWORD')
 RABBITMQ_QUEUE = os.getenv('RABBITMQ_QUEUE')
+RABBITMQ_HEARTBEAT = int(os.getenv('RABBITMQ_HEARTBEAT', 600))
+RABBITMQ_COURSES_QUEUE = os.getenv('RABBITMQ_COURSES_QUEUE', 'course_tasks')
+# Задержка перед повторной обработкой сообщения, удваивается с каждой попыткой (секунды)
+RABBITMQ_RETRY_DELAY = float(os.getenv('RABBITMQ_RETRY_DELAY', 5))
+RABBITMQ_RETRY_MAX_DELAY = float(os.getenv('RABBITMQ_RETRY_MAX_DELAY', 600))
+
+# Кэш должен быть общим для всех воркеров gunicorn, иначе версии
+# скомпилированных данных (ключи ответов и т.п.) не будут согласованы
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'cyber_edu'),
+    }
+}
+
+ANSWER_KEY_LOCAL_CACHE_SIZE = int(os.getenv('ANSWER_KEY_LOCAL_CACHE_SIZE', 256))
+ANSWER_KEY_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Закэшированные списки курсов, материалов и документов (сбрасываются по версии)
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Готовая выдача тестов для прохождения (сбрасывается по версии теста)
+TEST_DELIVERY_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Пересылка кликов по фишинговым ссылкам во внешний трекер
+PHISHING_TRACKER_URL = os.getenv('PHISHING_TRACKER_URL', 'http://192.168.1.66:8081/track')
+PHISHING_TRACKER_TIMEOUT = 1
+PHISHING_TRACKER_BACKOFF = 30
+PHISHING_QUEUE_SIZE = 1000
+PHISHING_BATCH_SIZE = 50
+PHISHING_WORKERS = 2
+PHISHING_REPLAY_INTERVAL = 60
+PHISHING_SPILL_PATH = os.getenv('PHISHING_SPILL_PATH', os.path.join(BASE_DIR, 'phishing_spill.log'))
+
+# Буфер событий фишинговых рассылок (открытия и переходы)
+PHISHING_EVENT_BUFFER_SIZE = 500
+PHISHING_EVENT_BUFFER_LIMIT = 50000
+PHISHING_EVENT_FLUSH_INTERVAL = 2
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# Пользователь с профилем загружается одним запросом и кэшируется до изменения
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+AUTH_USER_CACHE_TIMEOUT = 60 * 60
+
+# Процессы для хэширования паролей в import_staff (по умолчанию - число CPU)
+STAFF_IMPORT_WORKERS = int(os.getenv('STAFF_IMPORT_WORKERS', 0)) or None
+# Сколько сотрудников можно загрузить через админку: импорт идет внутри
+# запроса gunicorn, большие файлы загружаются командой import_staff
+STAFF_IMPORT_ADMIN_MAX_ROWS = int(os.getenv('STAFF_IMPORT_ADMIN_MAX_ROWS', 50))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -219,6 +292,18 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Префикс internal location nginx, из которого отдаются защищенные файлы
+# (X-Accel-Redirect). Пустое значение - файлы отдает Django.
+PROTECTED_MEDIA_ACCEL_PREFIX = os.getenv('PROTECTED_MEDIA_ACCEL_PREFIX', '')
+
+# Как часто (в секундах) повторно ставить в очередь расчет хэша старого файла,
+# пока воркер его не посчитал
+CONTENT_HASH_RETRY = int(os.getenv('CONTENT_HASH_RETRY', 600))
+
+# Ширины и качество уменьшенных версий изображений вопросов
+QUESTION_IMAGE_WIDTHS = [320, 640, 1280]
+QUESTION_IMAGE_QUALITY = 80
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
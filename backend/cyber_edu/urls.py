@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from .views import serve_icon, phishing_proxy
+from .views import serve_icon, phishing_proxy, phishing_stats
         
 urlpatterns = [
     path('logo32x32.png', serve_icon, {'icon_name': 'logo32x32.png'}),
@@ -11,6 +11,8 @@ urlpatterns = [
     path('api/courses/', include('courses.urls')),
     path('api/documents/', include('documents.urls')),
     path('api/phishing/', phishing_proxy, name='phishing-proxy'),
+    path('api/phishing/stats/', phishing_stats, name='phishing-stats'),
+    path('api/phishing/', include('phishing.urls')),
 
     # re_path(r'^.*$', TemplateView.as_view(template_name='index.html')),
     # path('api-auth/', include('rest_framework.urls')),
@@ -0,0 +1,12 @@
+import secrets
+import time
+
+
+def new_version():
+    """
+    Новое значение версии для ключей кэша. Не вычисляется из предыдущего
+    (в отличие от cache.incr, который не атомарен в FileBasedCache и LocMem
+    между процессами), поэтому две параллельные инвалидации не могут
+    получить одну и ту же версию, а устаревшие записи - совпасть с новой.
+    """
+    return f'{time.time_ns()}-{secrets.token_hex(4)}'
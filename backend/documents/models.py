@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from cyber_edu.protected_media import file_content_hash
+from cyber_edu.response_cache import schedule_content_version_bump
 
 class Document(models.Model):
     DOCUMENT_TYPE_CHOICES = [
@@ -9,7 +13,22 @@ class Document(models.Model):
     title = models.CharField(max_length=200)
     document_type = models.CharField(max_length=60, choices=DOCUMENT_TYPE_CHOICES)
     file = models.FileField(upload_to='media/', blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        # Хэш считается при загрузке нового файла, пока он еще не сохранен
+        if not self.file:
+            self.content_hash = ''
+        elif not self.file._committed:
+            self.content_hash = file_content_hash(self.file)
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.title})"
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def bump_documents_version(sender, **kwargs):
+    """Сбрасывает закэшированные списки документов"""
+    schedule_content_version_bump(sender)
@@ -1,3 +1,104 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from cyber_edu.protected_media import store_content_hash
+from .models import Document
 
-# Create your tests here.
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DocumentDownloadTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.content = bytes(range(256)) * 40
+        self.document = Document.objects.create(
+            title='Политика ИБ',
+            document_type='ord',
+            file=SimpleUploadedFile('policy.pdf', self.content)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='employee'))
+        self.url = f'/api/documents/documents/{self.document.id}/download/'
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 403)
+
+    @override_settings(PROTECTED_MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_offloads_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.document.file.name}')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(response.content, b'')
+
+    @override_settings(PROTECTED_MEDIA_ACCEL_PREFIX='')
+    def test_python_fallback_supports_ranges(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_conditional_requests(self):
+        self.assertEqual(len(self.document.content_hash), 64)
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{self.document.content_hash}"')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # If-Range со старым ETag - файл отдается целиком
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    @mock.patch('accounts.rabbitmq.publish_task')
+    def test_hash_for_old_files_is_computed_in_background(self, publish):
+        Document.objects.filter(pk=self.document.pk).update(content_hash='')
+        cache.clear()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.client.get(self.url)
+        publish.assert_called_once()
+        task = publish.call_args.args[1]
+        self.assertEqual(task['action'], 'compute_content_hash')
+
+        store_content_hash(task['model'], task['pk'], task['file_field'], task['hash_field'])
+        self.document.refresh_from_db()
+        self.assertEqual(len(self.document.content_hash), 64)
+        self.assertEqual(self.client.get(self.url)['ETag'], f'"{self.document.content_hash}"')
+
+    def test_backfill_command(self):
+        Document.objects.filter(pk=self.document.pk).update(content_hash='')
+        call_command('backfill_content_hashes', stdout=StringIO())
+        self.document.refresh_from_db()
+        self.assertEqual(len(self.document.content_hash), 64)
@@ -1,6 +1,8 @@
 from rest_framework import viewsets, permissions
 from rest_framework.response import Response
-from django.http import FileResponse
+from cyber_edu.pagination import KeysetPagination
+from cyber_edu.protected_media import serve_protected_file, pending_content_hash
+from cyber_edu.response_cache import VersionedListCacheMixin
 from rest_framework.decorators import action
 from .models import (
     Document
@@ -9,20 +11,19 @@ from .serializers import (
     DocumentSerializer
 )
 
-class DocumentViewSet(viewsets.ModelViewSet):
+class DocumentViewSet(VersionedListCacheMixin, viewsets.ModelViewSet):
     serializer_class = DocumentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cache_models = (Document,)
+    
+    pagination_class = KeysetPagination
+    filterset_fields = ['document_type']
     
     def get_queryset(self):
         queryset = Document.objects.all()
         
         return queryset
     
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
-    
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
         document = self.get_object()
@@ -34,10 +35,11 @@ class DocumentViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            return FileResponse(
-                document.file.open('rb'),
-                filename=document.file.name.split('/')[-1],
-                as_attachment=True
+            return serve_protected_file(
+                request,
+                document.file,
+                as_attachment=True,
+                content_hash=pending_content_hash(document, 'file')
             )
         except FileNotFoundError:
             return Response(
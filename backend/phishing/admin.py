@@ -0,0 +1,24 @@
+from django.contrib import admin
+from .models import (
+    PhishingCampaign, PhishingTarget, PhishingEvent
+)
+
+
+@admin.register(PhishingCampaign)
+class PhishingCampaignAdmin(admin.ModelAdmin):
+    list_display = ('name', 'started_at', 'created_at')
+
+
+@admin.register(PhishingTarget)
+class PhishingTargetAdmin(admin.ModelAdmin):
+    list_display = ('user', 'campaign', 'branch', 'department', 'first_opened_at', 'first_clicked_at')
+    list_filter = ('campaign', 'branch')
+    search_fields = ('user__username', 'user__email', 'rid')
+    raw_id_fields = ('user',)
+
+
+@admin.register(PhishingEvent)
+class PhishingEventAdmin(admin.ModelAdmin):
+    list_display = ('rid', 'event_type', 'created_at')
+    list_filter = ('event_type',)
+    search_fields = ('rid',)
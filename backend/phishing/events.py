@@ -0,0 +1,102 @@
+import atexit
+import os
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import PhishingEvent
+from .rollups import apply_events
+
+
+class EventBuffer:
+    """
+    Буфер событий фишинговых рассылок.
+    Запрос только дописывает событие в список в памяти, а фоновый поток
+    раз в PHISHING_EVENT_FLUSH_INTERVAL секунд (или при заполнении буфера)
+    сохраняет накопленные события одним bulk_create и обновляет сводки.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        self._lock = threading.Lock()
+        self._events = []
+        self._pid = None
+        self._wake = threading.Event()
+        self.counters = {'recorded': 0, 'flushed': 0, 'dropped': 0}
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # После fork буфер родительского процесса сохранит сам родитель
+            self._events = []
+            self._wake = threading.Event()
+            threading.Thread(target=self._worker, daemon=True).start()
+            self._pid = os.getpid()
+
+    def record(self, rid, event_type):
+        rid = rid.strip()[:PhishingEvent._meta.get_field('rid').max_length]
+        if not rid:
+            return
+        if self.background:
+            self._ensure_started()
+        with self._lock:
+            if len(self._events) >= settings.PHISHING_EVENT_BUFFER_LIMIT:
+                # БД недоступна слишком долго - не даем буферу расти бесконечно
+                self.counters['dropped'] += 1
+                return
+            self._events.append((rid, event_type, timezone.now()))
+            self.counters['recorded'] += 1
+            full = len(self._events) >= settings.PHISHING_EVENT_BUFFER_SIZE
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Сохраняет накопленные события, возвращает их количество"""
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+
+        try:
+            PhishingEvent.objects.bulk_create(
+                [
+                    PhishingEvent(rid=rid, event_type=event_type, created_at=created_at)
+                    for rid, event_type, created_at in events
+                ],
+                batch_size=settings.PHISHING_EVENT_BUFFER_SIZE
+            )
+        except Exception as e:
+            print(f"Error flushing phishing events: {e}")
+            with self._lock:
+                self._events[:0] = events
+            return 0
+
+        with self._lock:
+            self.counters['flushed'] += len(events)
+
+        try:
+            apply_events(events)
+        except Exception as e:
+            # Сырые события уже сохранены, сводки можно пересчитать командой
+            print(f"Error updating phishing rollups: {e}")
+        return len(events)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['buffered'] = len(self._events)
+        return stats
+
+    def _worker(self):
+        while True:
+            self._wake.wait(settings.PHISHING_EVENT_FLUSH_INTERVAL)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+
+event_buffer = EventBuffer()
+atexit.register(event_buffer.flush)
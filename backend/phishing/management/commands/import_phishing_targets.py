@@ -0,0 +1,62 @@
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db.models.functions import Lower
+from django.utils.dateparse import parse_datetime
+from phishing.models import PhishingCampaign, PhishingTarget
+from phishing.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Imports phishing campaign recipients (rid, email) from a CSV export of the mailing tool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--campaign', required=True, help='Campaign name, created if missing')
+        parser.add_argument('--rid-column', default='id', help='CSV column with the recipient rid')
+        parser.add_argument('--email-column', default='email')
+        parser.add_argument('--sent-column', default='send_date', help='CSV column with the send time, optional')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as csv_file:
+                rows = list(csv.DictReader(csv_file))
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['csv_file']}: {e}")
+
+        rows = [row for row in rows if row.get(options['rid_column']) and row.get(options['email_column'])]
+        if not rows:
+            raise CommandError('No rows with rid and email found')
+
+        campaign, _ = PhishingCampaign.objects.get_or_create(name=options['campaign'])
+
+        users = {}
+        emails = {row[options['email_column']].strip().lower() for row in rows}
+        for user in (
+            User.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=emails).select_related('profile')
+        ):
+            users.setdefault(user.email.lower(), user)
+
+        targets = []
+        missing = 0
+        for row in rows:
+            user = users.get(row[options['email_column']].strip().lower())
+            if user is None:
+                missing += 1
+                continue
+            profile = getattr(user, 'profile', None)
+            targets.append(PhishingTarget(
+                campaign=campaign,
+                user=user,
+                rid=row[options['rid_column']].strip(),
+                branch=(profile.branch if profile else None) or '',
+                department=(profile.department if profile else None) or '',
+                sent_at=parse_datetime(row.get(options['sent_column']) or '')
+            ))
+
+        PhishingTarget.objects.bulk_create(targets, batch_size=1000, ignore_conflicts=True)
+        rebuild_rollups(campaign)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(targets)} recipient(s) into '{campaign.name}', {missing} email(s) not found"
+        ))
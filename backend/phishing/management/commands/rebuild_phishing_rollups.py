@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from phishing.models import PhishingCampaign
+from phishing.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Rebuilds phishing campaign rollups from raw events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_ids', nargs='*', type=int, help='Campaigns to rebuild, all by default')
+
+    def handle(self, *args, **options):
+        campaigns = PhishingCampaign.objects.all()
+        if options['campaign_ids']:
+            campaigns = campaigns.filter(id__in=options['campaign_ids'])
+
+        for campaign in campaigns:
+            rebuild_rollups(campaign)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for '{campaign.name}'"))
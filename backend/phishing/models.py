@@ -0,0 +1,91 @@
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class PhishingCampaign(models.Model):
+    """Учебная фишинговая рассылка"""
+    name = models.CharField(max_length=200)
+    description = models.TextField(blank=True, null=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class PhishingTarget(models.Model):
+    """
+    Получатель рассылки и его rid.
+    Филиал и отдел копируются из профиля при импорте, чтобы отчеты
+    не зависели от последующих переводов сотрудников.
+    """
+    campaign = models.ForeignKey(PhishingCampaign, on_delete=models.CASCADE, related_name='targets')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='phishing_targets')
+    rid = models.CharField(max_length=64, unique=True)
+    branch = models.CharField(max_length=50, blank=True, default='')
+    department = models.CharField(max_length=100, blank=True, default='')
+    sent_at = models.DateTimeField(null=True, blank=True)
+    first_opened_at = models.DateTimeField(null=True, blank=True)
+    first_clicked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('campaign', 'user')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.campaign.name}"
+
+
+class PhishingEvent(models.Model):
+    """
+    Сырое событие открытия письма или перехода по ссылке.
+    Таблица только дописывается пачками, поэтому в ней нет внешних ключей:
+    rid сопоставляется с получателем при обновлении сводных таблиц.
+    """
+    EVENT_OPEN = 1
+    EVENT_CLICK = 2
+    EVENT_CHOICES = [
+        (EVENT_OPEN, 'Открытие письма'),
+        (EVENT_CLICK, 'Переход по ссылке'),
+    ]
+
+    rid = models.CharField(max_length=64, db_index=True)
+    event_type = models.PositiveSmallIntegerField(choices=EVENT_CHOICES)
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.get_event_type_display()} {self.rid}"
+
+
+class PhishingRollup(models.Model):
+    """Сводка рассылки по филиалу и отделу"""
+    campaign = models.ForeignKey(PhishingCampaign, on_delete=models.CASCADE, related_name='rollups')
+    branch = models.CharField(max_length=50, blank=True, default='')
+    department = models.CharField(max_length=100, blank=True, default='')
+    targets = models.PositiveIntegerField(default=0)
+    opened = models.PositiveIntegerField(default=0)
+    clicked = models.PositiveIntegerField(default=0)
+    time_to_click_total = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('campaign', 'branch', 'department')
+
+
+class PhishingClickDelay(models.Model):
+    """Распределение времени от отправки письма до перехода по ссылке"""
+    # Верхние границы интервалов в секундах, 0 - больше суток
+    BUCKETS = [60, 300, 900, 3600, 14400, 86400, 0]
+
+    campaign = models.ForeignKey(PhishingCampaign, on_delete=models.CASCADE, related_name='click_delays')
+    bucket = models.PositiveIntegerField()
+    clicked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('campaign', 'bucket')
+
+    @classmethod
+    def bucket_for(cls, seconds):
+        for bucket in cls.BUCKETS[:-1]:
+            if seconds <= bucket:
+                return bucket
+        return cls.BUCKETS[-1]
@@ -0,0 +1,181 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F, Min
+from accounts.models import Profile
+from .models import (
+    PhishingTarget, PhishingEvent,
+    PhishingRollup, PhishingClickDelay
+)
+
+FIRST_EVENT_FIELDS = {
+    PhishingEvent.EVENT_OPEN: 'first_opened_at',
+    PhishingEvent.EVENT_CLICK: 'first_clicked_at',
+}
+
+
+def time_to_click(target, clicked_at, campaign_started_at):
+    sent_at = target.sent_at or campaign_started_at
+    return max(0, int((clicked_at - sent_at).total_seconds()))
+
+
+def bump(model, lookup, **deltas):
+    """Атомарно увеличивает счетчики сводной строки, создавая ее при необходимости"""
+    model.objects.get_or_create(**lookup)
+    model.objects.filter(**lookup).update(**{
+        field: F(field) + value for field, value in deltas.items()
+    })
+
+
+def apply_events(events):
+    """
+    Переносит пачку сырых событий в сводные таблицы.
+    events - список (rid, event_type, created_at). Учитывается только первое
+    открытие и первый переход каждого получателя; условное обновление
+    гарантирует это и при одновременной обработке в нескольких процессах.
+    Получатели обновляются в порядке pk, как и блокируются в rebuild_rollups,
+    чтобы встречные блокировки не приводили к взаимоблокировке.
+    """
+    first_events = {}
+    for rid, event_type, created_at in events:
+        key = (rid, event_type)
+        if key not in first_events or created_at < first_events[key]:
+            first_events[key] = created_at
+
+    targets = PhishingTarget.objects.filter(
+        rid__in={rid for rid, _ in first_events}
+    ).select_related('campaign').order_by('pk')
+
+    rollups = defaultdict(lambda: defaultdict(int))
+    delays = defaultdict(int)
+    with transaction.atomic():
+        for target in targets:
+            for event_type, field in FIRST_EVENT_FIELDS.items():
+                happened_at = first_events.get((target.rid, event_type))
+                if happened_at is None or getattr(target, field) is not None:
+                    continue
+                updated = PhishingTarget.objects.filter(
+                    pk=target.pk, **{f'{field}__isnull': True}
+                ).update(**{field: happened_at})
+                if not updated:
+                    continue
+
+                key = (target.campaign_id, target.branch, target.department)
+                if event_type == PhishingEvent.EVENT_OPEN:
+                    rollups[key]['opened'] += 1
+                else:
+                    seconds = time_to_click(target, happened_at, target.campaign.started_at)
+                    rollups[key]['clicked'] += 1
+                    rollups[key]['time_to_click_total'] += seconds
+                    delays[(target.campaign_id, PhishingClickDelay.bucket_for(seconds))] += 1
+
+        for (campaign_id, branch, department), deltas in rollups.items():
+            bump(PhishingRollup, {'campaign_id': campaign_id, 'branch': branch, 'department': department}, **deltas)
+        for (campaign_id, bucket), clicked in delays.items():
+            bump(PhishingClickDelay, {'campaign_id': campaign_id, 'bucket': bucket}, clicked=clicked)
+
+
+def rebuild_rollups(campaign):
+    """
+    Пересчитывает первые события получателей и сводные таблицы рассылки
+    по сырым событиям. Нужен после импорта получателей, когда события
+    по их rid могли прийти раньше.
+
+    Получатели рассылки блокируются до конца пересчета, а события читаются
+    уже под блокировкой. Сырые события сохраняются до apply_events, поэтому
+    событие либо видно пересчету, либо apply_events учтет его после снятия
+    блокировки - параллельная обработка событий не теряет переходы.
+    """
+    with transaction.atomic():
+        targets = list(campaign.targets.select_for_update().order_by('pk'))
+        first_events = {
+            (row['rid'], row['event_type']): row['first']
+            for row in PhishingEvent.objects.filter(rid__in=[target.rid for target in targets])
+            .values('rid', 'event_type').annotate(first=Min('created_at'))
+        }
+
+        rollups = {}
+        delays = defaultdict(int)
+        for target in targets:
+            for event_type, field in FIRST_EVENT_FIELDS.items():
+                setattr(target, field, first_events.get((target.rid, event_type)))
+
+            key = (target.branch, target.department)
+            rollup = rollups.setdefault(key, PhishingRollup(
+                campaign=campaign, branch=target.branch, department=target.department
+            ))
+            rollup.targets += 1
+            if target.first_opened_at:
+                rollup.opened += 1
+            if target.first_clicked_at:
+                seconds = time_to_click(target, target.first_clicked_at, campaign.started_at)
+                rollup.clicked += 1
+                rollup.time_to_click_total += seconds
+                delays[PhishingClickDelay.bucket_for(seconds)] += 1
+
+        PhishingTarget.objects.bulk_update(targets, list(FIRST_EVENT_FIELDS.values()), batch_size=500)
+        campaign.rollups.all().delete()
+        campaign.click_delays.all().delete()
+        PhishingRollup.objects.bulk_create(rollups.values())
+        PhishingClickDelay.objects.bulk_create([
+            PhishingClickDelay(campaign=campaign, bucket=bucket, clicked=clicked)
+            for bucket, clicked in delays.items()
+        ])
+
+
+def rate(part, total):
+    return round(part * 100 / total, 1) if total else 0
+
+
+def summarize(rows):
+    targets = sum(row.targets for row in rows)
+    opened = sum(row.opened for row in rows)
+    clicked = sum(row.clicked for row in rows)
+    time_to_click_total = sum(row.time_to_click_total for row in rows)
+    return {
+        'targets': targets,
+        'opened': opened,
+        'clicked': clicked,
+        'open_rate': rate(opened, targets),
+        'click_rate': rate(clicked, targets),
+        'avg_time_to_click': round(time_to_click_total / clicked) if clicked else None,
+    }
+
+
+def campaign_report(campaign):
+    """
+    Отчет по рассылке: доля переходов по филиалам и отделам и время до перехода.
+    Читает только сводные таблицы, сырые события не сканируются.
+    """
+    rows = list(campaign.rollups.all())
+    branch_names = dict(Profile.BRANCH_CHOICES)
+
+    def group(attribute):
+        groups = defaultdict(list)
+        for row in rows:
+            groups[getattr(row, attribute)].append(row)
+        return groups
+
+    by_branch = [
+        {'branch': branch, 'branch_name': branch_names.get(branch, branch), **summarize(group_rows)}
+        for branch, group_rows in sorted(group('branch').items())
+    ]
+    by_department = [
+        {'department': department, **summarize(group_rows)}
+        for department, group_rows in sorted(group('department').items())
+    ]
+
+    delays = {delay.bucket: delay.clicked for delay in campaign.click_delays.all()}
+    return {
+        'campaign': {
+            'id': campaign.id,
+            'name': campaign.name,
+            'started_at': campaign.started_at,
+        },
+        'totals': summarize(rows),
+        'by_branch': by_branch,
+        'by_department': by_department,
+        'time_to_click': [
+            {'up_to_seconds': bucket or None, 'clicked': delays.get(bucket, 0)}
+            for bucket in PhishingClickDelay.BUCKETS
+        ],
+    }
@@ -0,0 +1,8 @@
+from rest_framework import serializers
+from .models import PhishingCampaign
+
+
+class PhishingCampaignSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PhishingCampaign
+        fields = ['id', 'name', 'description', 'started_at', 'created_at']
@@ -0,0 +1,179 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.test import APIClient
+from cyber_edu.phishing import ClickForwarder
+from .events import EventBuffer, event_buffer
+from .models import (
+    PhishingCampaign, PhishingTarget, PhishingEvent,
+    PhishingRollup, PhishingClickDelay
+)
+from .rollups import rebuild_rollups
+
+
+class PhishingEventsTests(TestCase):
+    def setUp(self):
+        self.started_at = timezone.now() - timedelta(minutes=10)
+        self.campaign = PhishingCampaign.objects.create(name='Премия', started_at=self.started_at)
+        self.targets = []
+        for i, (branch, department) in enumerate([
+            ('cardio', 'Бухгалтерия'), ('cardio', 'Бухгалтерия'), ('oncology', 'Лаборатория'),
+        ]):
+            user = User.objects.create(username=f'user{i}', email=f'user{i}@example.com')
+            self.targets.append(PhishingTarget.objects.create(
+                campaign=self.campaign, user=user, rid=f'rid{i}',
+                branch=branch, department=department
+            ))
+        rebuild_rollups(self.campaign)
+        self.buffer = EventBuffer(background=False)
+
+    def test_flush_writes_events_in_bulk_and_updates_rollups(self):
+        for rid in ['rid0', 'rid0', 'rid2', 'unknown']:
+            self.buffer.record(rid, PhishingEvent.EVENT_CLICK)
+        self.buffer.record('rid1', PhishingEvent.EVENT_OPEN)
+
+        self.assertEqual(self.buffer.flush(), 5)
+        self.assertEqual(PhishingEvent.objects.count(), 5)
+        self.assertEqual(self.buffer.flush(), 0)
+
+        cardio = PhishingRollup.objects.get(campaign=self.campaign, branch='cardio')
+        self.assertEqual((cardio.targets, cardio.opened, cardio.clicked), (2, 1, 1))
+        oncology = PhishingRollup.objects.get(campaign=self.campaign, branch='oncology')
+        self.assertEqual(oncology.clicked, 1)
+        self.assertEqual(
+            PhishingClickDelay.objects.get(campaign=self.campaign, bucket=900).clicked, 2
+        )
+
+        # Повторный переход того же сотрудника не учитывается
+        self.buffer.record('rid0', PhishingEvent.EVENT_CLICK)
+        self.buffer.flush()
+        cardio.refresh_from_db()
+        self.assertEqual(cardio.clicked, 1)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for rid in ['rid0', 'rid2']:
+            self.buffer.record(rid, PhishingEvent.EVENT_CLICK)
+        self.buffer.record('rid2', PhishingEvent.EVENT_OPEN)
+        self.buffer.flush()
+
+        def snapshot():
+            return sorted(PhishingRollup.objects.filter(campaign=self.campaign).values_list(
+                'branch', 'department', 'targets', 'opened', 'clicked', 'time_to_click_total'
+            ))
+
+        incremental = snapshot()
+        rebuild_rollups(self.campaign)
+        self.assertEqual(snapshot(), incremental)
+
+    def test_proxy_records_click_and_report_reads_rollups(self):
+        client = APIClient()
+        with mock.patch.object(event_buffer, 'background', False), \
+             mock.patch('cyber_edu.views.forwarder.submit') as submit:
+            response = client.get('/api/phishing/', {'rid': 'rid2'})
+            self.assertEqual(response.status_code, 200)
+            response = client.get('/api/phishing/open/', {'rid': 'rid2'})
+            self.assertEqual(response['Content-Type'], 'image/gif')
+            event_buffer.flush()
+        submit.assert_called_once_with('rid2')
+
+        response = client.get(f'/api/phishing/campaigns/{self.campaign.id}/report/')
+        self.assertEqual(response.status_code, 403)
+
+        admin = User.objects.create(username='admin', is_staff=True)
+        client.force_authenticate(admin)
+        with self.assertNumQueries(3):
+            response = client.get(f'/api/phishing/campaigns/{self.campaign.id}/report/')
+        self.assertEqual(response.status_code, 200)
+
+        report = response.json()
+        self.assertEqual(report['totals']['targets'], 3)
+        self.assertEqual(report['totals']['clicked'], 1)
+        by_branch = {row['branch']: row for row in report['by_branch']}
+        self.assertEqual(by_branch['oncology']['click_rate'], 100.0)
+        self.assertEqual(by_branch['cardio']['click_rate'], 0)
+        self.assertEqual(sum(bucket['clicked'] for bucket in report['time_to_click']), 1)
+
+
+class FakeTrackerSession:
+    """Сессия requests, отвечающая заданными кодами по очереди"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.rids = []
+
+    def get(self, url, params, timeout, verify):
+        self.rids.append(params['rid'])
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status is None:
+            raise requests.Timeout()
+        return mock.Mock(ok=status < 400, status_code=status)
+
+
+class ClickForwarderTests(SimpleTestCase):
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spill_dir, ignore_errors=True)
+        settings_override = override_settings(
+            PHISHING_SPILL_PATH=os.path.join(self.spill_dir, 'spill.log'),
+            PHISHING_WORKERS=0,
+            PHISHING_QUEUE_SIZE=2,
+            PHISHING_BATCH_SIZE=2,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.forwarder = ClickForwarder()
+
+    def spilled(self):
+        with open(self.forwarder.spill_path, encoding='utf-8') as spill:
+            return spill.read().split()
+
+    def test_starts_lazily_per_process_and_spills_when_full(self):
+        self.assertIsNone(self.forwarder._queue)
+        for rid in ('a', 'b', 'c\n'):
+            self.forwarder.submit(rid)
+
+        self.assertEqual(self.forwarder._pid, os.getpid())
+        self.assertEqual(self.spilled(), ['c'])
+        stats = self.forwarder.stats()
+        self.assertEqual((stats['queued'], stats['spilled'], stats['queue_size']), (2, 1, 2))
+
+        # После fork очередь и потоки создаются заново
+        self.forwarder._pid = -1
+        self.forwarder.submit('d')
+        self.assertEqual(self.forwarder.stats()['queue_size'], 1)
+
+    def test_error_response_backs_off_and_returns_rest(self):
+        session = FakeTrackerSession(200, 503)
+        failed = self.forwarder._deliver(session, ['a', 'b', 'c'])
+
+        self.assertEqual(failed, ['b', 'c'])
+        self.assertEqual(self.forwarder.counters['forwarded'], 1)
+        self.assertFalse(self.forwarder.stats()['tracker_available'])
+
+        # Пока действует пауза, трекер не вызывается
+        self.assertEqual(self.forwarder._deliver(session, ['d']), ['d'])
+        self.assertEqual(session.rids, ['a', 'b'])
+
+    def test_timeout_backs_off(self):
+        self.assertEqual(self.forwarder._deliver(FakeTrackerSession(None), ['a']), ['a'])
+        self.assertFalse(self.forwarder.stats()['tracker_available'])
+
+    def test_replay_resends_spilled_rids(self):
+        self.forwarder._spill(['a', 'b', 'c'])
+        session = FakeTrackerSession(200, 200, 500)
+        self.forwarder._replay(session)
+
+        self.assertEqual(self.forwarder.counters['replayed'], 2)
+        self.assertEqual(self.spilled(), ['c'])
+        self.assertFalse([name for name in os.listdir(self.spill_dir) if '.replay' in name])
+
+        self.forwarder._tracker_down_until = 0
+        self.forwarder._replay(FakeTrackerSession())
+        self.assertEqual(self.forwarder.counters['replayed'], 3)
+        self.assertFalse(os.path.exists(self.forwarder.spill_path))
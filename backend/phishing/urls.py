@@ -0,0 +1,10 @@
+from django.urls import path
+from rest_framework.routers import DefaultRouter
+from . import views
+
+router = DefaultRouter()
+router.register(r'campaigns', views.PhishingCampaignViewSet, basename='phishing-campaigns')
+
+urlpatterns = [
+    path('open/', views.track_open, name='phishing-open'),
+] + router.urls
@@ -0,0 +1,35 @@
+import base64
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from .events import event_buffer
+from .models import PhishingCampaign, PhishingEvent
+from .rollups import campaign_report
+from .serializers import PhishingCampaignSerializer
+
+# Прозрачный GIF 1x1, подготовленный один раз на процесс
+TRACKING_PIXEL = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+
+
+@csrf_exempt
+def track_open(request):
+    """Пиксель в письме рассылки: записывает открытие и сразу отвечает"""
+    rid = request.GET.get('rid', '')
+    if rid:
+        event_buffer.record(rid, PhishingEvent.EVENT_OPEN)
+
+    response = HttpResponse(TRACKING_PIXEL, content_type='image/gif')
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+class PhishingCampaignViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = PhishingCampaign.objects.all().order_by('-started_at')
+    serializer_class = PhishingCampaignSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    @action(detail=True, methods=['get'])
+    def report(self, request, pk=None):
+        return Response(campaign_report(self.get_object()))
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { fetchPage, fetchCursor } from './pagination';
 
 const api = axios.create({
   baseURL: '/api/accounts/',
@@ -97,10 +98,13 @@ export const getCurrentUser = async () => {
   };
 };
 
-export const getUsers = async () => {
+// Страница списка пользователей; следующая загружается по ссылке next
+export const getUsersPage = async (params = {}, cursor = null) => {
     try {
-        const response = await api.get('users/');
-        return response.data.results || response.data;
+        if (cursor) {
+            return await fetchCursor(api, cursor);
+        }
+        return await fetchPage(api, 'users/', params);
     } catch (error) {
         console.error('Error fetching users:', error);
         throw error;
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { fetchPage, fetchCursor, MAX_PAGE_SIZE } from './pagination';
 
 const api = axios.create({
   baseURL: '/api/courses/',
@@ -73,10 +74,12 @@ export const getUserProgressCourses = async (course_id=false) => {
         };
       };
 
-      const response = await api.get('progress/');
+      // Список содержит только курсы текущего пользователя,
+      // поэтому одной страницы максимального размера достаточно
+      const { results } = await fetchPage(api, 'progress/', { page_size: MAX_PAGE_SIZE });
       return {
-        data: response.data.results || response.data,
-        status: response.status
+        data: results,
+        status: 200
       };
     } catch (error) {
       console.error('Error fetching user courses:', error);
@@ -91,18 +94,24 @@ export const getUserTestResults = async (courseId) => {
 
 export const getAllCourses = async () => {
     try {
-        const response = await api.get('courses/');
-        return response.data;
+        // Каталог курсов для выбора при назначении - одна ограниченная страница
+        const { results } = await fetchPage(api, 'courses/', { page_size: MAX_PAGE_SIZE });
+        return results;
     } catch (error) {
         console.error('Error fetching courses:', error);
         throw error;
     }
 };
 
-export const getAllProgress = async () => {
+// Страница прогресса всех пользователей. Фильтры (course_id, status, branch,
+// department) и page_size применяются на сервере; для перехода на соседнюю
+// страницу передается ссылка next/previous из предыдущего ответа
+export const getProgressPage = async (params = {}, cursor = null) => {
     try {
-        const response = await api.get('progress/admin_progress/');
-        return response.data;
+        if (cursor) {
+            return await fetchCursor(api, cursor);
+        }
+        return await fetchPage(api, 'progress/admin_progress/', params);
     } catch (error) {
         console.error('Error fetching progress:', error);
         throw error;
@@ -118,4 +127,13 @@ export const assignCourseToUser = async (data) => {
   }
 };
 
+export const assignCourseInBulk = async (data) => {
+  try {
+    const response = await api.post('progress/bulk_subscribe/', data);
+    return response.data;
+  } catch (error) {
+    throw error.response.data;
+  }
+};
+
 export default api;
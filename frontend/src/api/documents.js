@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { fetchPage, fetchCursor } from './pagination';
 
 const api = axios.create({
   baseURL: '/api/documents/',
@@ -37,10 +38,11 @@ api.interceptors.response.use(
   }
 );
 
-export const getDocuments = async () => {
+// Страница документов: { results, next, previous }.
+// Следующая страница загружается по ссылке next
+export const getDocuments = async (cursor = null) => {
   try {
-    const response = await api.get('documents/');
-    return response;
+    return cursor ? await fetchCursor(api, cursor) : await fetchPage(api, 'documents/');
   } catch (error) {
     throw error.response.data;
   }
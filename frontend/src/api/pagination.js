@@ -0,0 +1,31 @@
+// Курсорная пагинация: сервер отдает страницу ограниченного размера
+// и ссылки next/previous на соседние страницы без подсчета общего числа строк.
+
+// Наибольший размер страницы, который принимает бэкенд (KeysetPagination.max_page_size)
+export const MAX_PAGE_SIZE = 1000;
+
+const toPage = (data) => {
+  if (Array.isArray(data)) {
+    return { results: data, next: null, previous: null };
+  }
+  return {
+    results: data?.results || [],
+    next: data?.next || null,
+    previous: data?.previous || null,
+  };
+};
+
+// Загружает первую страницу списка; фильтры и page_size передаются серверу
+export const fetchPage = async (client, url, params = {}) => {
+  const response = await client.get(url, { params });
+  return toPage(response.data);
+};
+
+// Загружает страницу по ссылке next/previous из предыдущего ответа.
+// Ссылка абсолютная; берем только путь, чтобы не зависеть от схемы
+// и хоста, которые видит Django за nginx
+export const fetchCursor = async (client, link) => {
+  const url = new URL(link, window.location.origin);
+  const response = await client.get(url.pathname + url.search, { baseURL: '' });
+  return toPage(response.data);
+};
@@ -1,64 +1,91 @@
-// ProgressTab.js - исправленная версия
-import { useState, useEffect } from 'react';
+// ProgressTab.js - постраничный просмотр прогресса с фильтрами на сервере
+import { useState, useEffect, useCallback } from 'react';
 import { 
   Box, 
   CircularProgress,
   Typography,
-  Alert
+  Alert,
+  FormControl,
+  InputLabel,
+  Select,
+  MenuItem
 } from '@mui/material';
 import ProgressTable from './ProgressTable';
-import PaginationControls from '../shared/PaginationControls';
-import { getAllProgress } from '../../../api/courses';
+import CursorPaginationControls from '../shared/CursorPaginationControls';
+import { getProgressPage, getAllCourses } from '../../../api/courses';
+import { getBranchChoices } from '../../../api/auth';
+
+const STATUS_OPTIONS = [
+  { value: 'not_started', label: 'Не начат' },
+  { value: 'in_progress', label: 'В процессе' },
+  { value: 'completed', label: 'Завершен' },
+];
 
 const ProgressTab = () => {
-  const [page, setPage] = useState(1);
   const [rowsPerPage, setRowsPerPage] = useState(10);
-  const [progressData, setProgressData] = useState([]);
+  const [filters, setFilters] = useState({ course_id: '', status: '', branch: '' });
+  const [courses, setCourses] = useState([]);
+  const [branchChoices, setBranchChoices] = useState([]);
+  const [page, setPage] = useState({ results: [], next: null, previous: null });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
+  // Справочники для фильтров загружаются один раз
   useEffect(() => {
-    const fetchProgressData = async () => {
+    const fetchChoices = async () => {
       try {
-        setLoading(true);
-        setError(null);
-        const data = await getAllProgress();
-        setProgressData(data);
+        const [coursesData, branchesData] = await Promise.all([
+          getAllCourses(),
+          getBranchChoices()
+        ]);
+        setCourses(coursesData);
+        setBranchChoices(branchesData);
       } catch (err) {
-        console.error('Ошибка загрузки данных прогресса:', err);
-        setError('Не удалось загрузить данные о прогрессе пользователей');
-      } finally {
-        setLoading(false);
+        console.error('Ошибка загрузки фильтров:', err);
       }
     };
 
-    fetchProgressData();
-  }, []); // Пустой массив зависимостей - загружаем один раз при монтировании
+    fetchChoices();
+  }, []);
+
+  // Загружает одну страницу: первую по фильтрам или соседнюю по курсору
+  const loadPage = useCallback(async (cursor = null) => {
+    try {
+      setLoading(true);
+      setError(null);
+      const params = { page_size: rowsPerPage };
+      Object.entries(filters).forEach(([key, value]) => {
+        if (value) params[key] = value;
+      });
+      setPage(await getProgressPage(params, cursor));
+    } catch (err) {
+      console.error('Ошибка загрузки данных прогресса:', err);
+      setError('Не удалось загрузить данные о прогрессе пользователей');
+    } finally {
+      setLoading(false);
+    }
+  }, [filters, rowsPerPage]);
 
-  const handlePageChange = (newPage) => setPage(newPage);
-  const handleRowsPerPageChange = (value) => {
-    setRowsPerPage(value);
-    setPage(1); // Сбрасываем на первую страницу при изменении количества строк
+  // При смене фильтров или размера страницы начинаем с первой страницы
+  useEffect(() => {
+    loadPage();
+  }, [loadPage]);
+
+  const handleFilterChange = (name) => (e) => {
+    setFilters(prev => ({ ...prev, [name]: e.target.value }));
   };
 
-  // Отображаем состояние загрузки
-  if (loading) {
-    return (
-      <Box sx={{ 
-        display: 'flex', 
-        justifyContent: 'center', 
-        alignItems: 'center', 
-        height: '400px',
-        flexDirection: 'column',
-        gap: 2
-      }}>
-        <CircularProgress size={60} />
-        <Typography variant="h6" color="text.secondary">
-          Загрузка данных о прогрессе...
-        </Typography>
-      </Box>
-    );
-  }
+  const filterSelect = (name, label, options) => (
+    <FormControl size="small" sx={{ minWidth: 200 }}>
+      <InputLabel>{label}</InputLabel>
+      <Select value={filters[name]} label={label} onChange={handleFilterChange(name)}>
+        <MenuItem value="">Все</MenuItem>
+        {options.map(({ value, label }) => (
+          <MenuItem key={value} value={value}>{label}</MenuItem>
+        ))}
+      </Select>
+    </FormControl>
+  );
 
   // Отображаем ошибку, если есть
   if (error) {
@@ -74,41 +101,47 @@ const ProgressTab = () => {
     );
   }
 
-  // Если данные пустые
-  if (progressData.length === 0) {
-    return (
-      <Box sx={{ p: 3, textAlign: 'center' }}>
-        <Typography variant="h6" color="text.secondary">
-          Нет данных о прогрессе пользователей
-        </Typography>
-        <Typography variant="body2" color="text.secondary" sx={{ mt: 1 }}>
-          Пользователи еще не начали проходить курсы или данные не загружены
-        </Typography>
-      </Box>
-    );
-  }
-
   return (
     <Box sx={{ p: 2 }}>
-      <PaginationControls 
-        count={progressData.length}
-        page={page}
+      <Box display="flex" gap={2} flexWrap="wrap" mb={2}>
+        {filterSelect('course_id', 'Курс', courses.map(course => ({ value: course.id, label: course.title })))}
+        {filterSelect('status', 'Статус', STATUS_OPTIONS)}
+        {filterSelect('branch', 'Филиал', branchChoices.map(([value, label]) => ({ value, label })))}
+      </Box>
+
+      <CursorPaginationControls 
+        hasPrevious={Boolean(page.previous)}
+        hasNext={Boolean(page.next)}
         rowsPerPage={rowsPerPage}
         rowsPerPageLabel={"Строк на странице"}
         rowsPerPageOptions={[5, 10, 25, 50]}
-        onPageChange={handlePageChange}
-        onRowsPerPageChange={handleRowsPerPageChange}
+        onPrevious={() => loadPage(page.previous)}
+        onNext={() => loadPage(page.next)}
+        onRowsPerPageChange={setRowsPerPage}
+        disabled={loading}
       />
       
       <Box mt={2}>
-        <ProgressTable 
-          progressData={progressData} 
-          page={page}
-          rowsPerPage={rowsPerPage}
-        />
+        {loading ? (
+          <Box sx={{ 
+            display: 'flex', 
+            justifyContent: 'center', 
+            alignItems: 'center', 
+            height: '400px',
+            flexDirection: 'column',
+            gap: 2
+          }}>
+            <CircularProgress size={60} />
+            <Typography variant="h6" color="text.secondary">
+              Загрузка данных о прогрессе...
+            </Typography>
+          </Box>
+        ) : (
+          <ProgressTable progressData={page.results} />
+        )}
       </Box>
     </Box>
   );
 };
 
-export default ProgressTab;
\ No newline at end of file
+export default ProgressTab;
@@ -11,7 +11,7 @@ import {
 } from '@mui/material';
 import { adminPanelStyles } from '../adminPanelStyles';
 
-const ProgressTable = ({ progressData, page, rowsPerPage }) => {
+const ProgressTable = ({ progressData }) => {
   if (!progressData || !Array.isArray(progressData) || progressData.length === 0) {
     return (
       <Paper sx={{ p: 3, textAlign: 'center' }}>
@@ -22,10 +22,6 @@ const ProgressTable = ({ progressData, page, rowsPerPage }) => {
     );
   }
 
-  const startIndex = (page - 1) * rowsPerPage;
-  const endIndex = Math.min(startIndex + rowsPerPage, progressData.length);
-  const paginatedProgress = progressData.slice(startIndex, endIndex);
-
   const getStatusText = (status) => {
     if (!status) return 'Не определен';
     
@@ -100,7 +96,7 @@ const ProgressTable = ({ progressData, page, rowsPerPage }) => {
           </TableRow>
         </TableHead>
         <TableBody>
-          {paginatedProgress.map((progress, index) => {
+          {progressData.map((progress, index) => {
             const user = progress.user || {};
             const course = progress.course || {};
             const key = `${user.id || 'unknown'}-${course.id || 'unknown'}-${index}`;
@@ -163,11 +159,11 @@ const ProgressTable = ({ progressData, page, rowsPerPage }) => {
         </TableBody>
       </Table>
       
-      {/* Информация о количестве отображаемых записей */}
+      {/* Информация о количестве записей на текущей странице */}
       {progressData.length > 0 && (
         <Box sx={{ p: 2, borderTop: '1px solid', borderColor: 'divider' }}>
           <Typography variant="body2" color="text.secondary" align="right">
-            Показано {paginatedProgress.length} из {progressData.length} записей
+            Записей на странице: {progressData.length}
           </Typography>
         </Box>
       )}
@@ -0,0 +1,44 @@
+import { Box, Button, FormControl, InputLabel, Select, MenuItem } from '@mui/material';
+
+// Навигация по курсорной пагинации: общее число строк сервер не считает,
+// поэтому доступны только переходы на предыдущую и следующую страницы
+const CursorPaginationControls = ({
+  hasPrevious,
+  hasNext,
+  rowsPerPage,
+  rowsPerPageLabel,
+  rowsPerPageOptions,
+  onPrevious,
+  onNext,
+  onRowsPerPageChange,
+  disabled = false,
+}) => {
+  return (
+    <Box display="flex" justifyContent="space-between" alignItems="center" mb={2}>
+      <Box display="flex" gap={1}>
+        <Button variant="outlined" onClick={onPrevious} disabled={disabled || !hasPrevious}>
+          Назад
+        </Button>
+        <Button variant="outlined" onClick={onNext} disabled={disabled || !hasNext}>
+          Вперед
+        </Button>
+      </Box>
+
+      <FormControl size="small" sx={{ width: '150px', ml: 2 }}>
+        <InputLabel>{rowsPerPageLabel}</InputLabel>
+        <Select
+          value={rowsPerPage}
+          onChange={(e) => onRowsPerPageChange(e.target.value)}
+          label={rowsPerPageLabel}
+          disabled={disabled}
+        >
+          {rowsPerPageOptions.map((num) => (
+            <MenuItem key={num} value={num}>{num}</MenuItem>
+          ))}
+        </Select>
+      </FormControl>
+    </Box>
+  );
+};
+
+export default CursorPaginationControls;
@@ -5,7 +5,7 @@ import { Container, Typography,
         } 
 from '@mui/material';
 import CheckCircle from '@mui/icons-material/CheckCircle';
-import { getAllCourses, getUserProgressCourses } from '../../api/courses';
+import { getUserProgressCourses } from '../../api/courses';
 import { AuthContext } from '../../context/AuthContext';
 import {
   StyledContainer,
@@ -26,51 +26,19 @@ const CourseList = () => {
   const [searchTerm, setSearchTerm] = useState('');
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
-  const [subscribedCourseIds, setSubscribedCourseIds] = useState([]);
-  const { isAuthenticated, user } = useContext(AuthContext);
-
-  const extractCourseIds = (data) => {
-    if (!data) return [];
-
-    const coursesData = data.results || data;
-
-    if (Array.isArray(coursesData)) {
-      return coursesData.map(item => item.course?.id || item.id);
-    }
-
-    return [];
-  };
+  const { isAuthenticated } = useContext(AuthContext);
 
   useEffect(() => {
     const fetchCourses = async () => {
       try {
-        const [subscribedResponse, allCoursesResponse] = await Promise.all([
-          getUserProgressCourses(),
-          getAllCourses()
-        ]);
-
-        let subscribedIds;
-
-        if (user?.is_staff) {
-          const data = subscribedResponse.data || [];
-
-          const filteredData = data.filter(unit => {
-              return unit?.user?.id === user?.id;
-          });
-
-          subscribedIds = extractCourseIds(filteredData);
-          setSubscribedCourseIds(subscribedIds);
-        } else {
-          subscribedIds = extractCourseIds(subscribedResponse.data);
-          setSubscribedCourseIds(subscribedIds);
-        };
-
-        if (Array.isArray(allCoursesResponse)) {
-          setAllCourses(allCoursesResponse);
-          
-          const userCourses = allCoursesResponse.filter(course => 
-            subscribedIds.includes(course.id)
-          );
+        // Сервер возвращает только прогресс текущего пользователя, и каждая
+        // запись уже содержит курс - весь каталог загружать не нужно
+        const subscribedResponse = await getUserProgressCourses();
+        const data = subscribedResponse.data || [];
+
+        if (Array.isArray(data)) {
+          const userCourses = data.map(unit => unit.course).filter(Boolean);
+          setAllCourses(userCourses);
           setFilteredCourses(userCourses);
         } else {
           setError('Неправильный формат данных');
@@ -91,22 +59,18 @@ const CourseList = () => {
       setLoading(false);
     }
 
-  }, [isAuthenticated, user?.is_staff, user?.id]);
+  }, [isAuthenticated]);
 
   useEffect(() => {
     if (searchTerm) {
       const results = allCourses.filter(course =>
-        subscribedCourseIds.includes(course.id) &&
         course.title.toLowerCase().includes(searchTerm.toLowerCase())
       );
       setFilteredCourses(results);
     } else {
-      const userCourses = allCourses.filter(course => 
-        subscribedCourseIds.includes(course.id)
-      );
-      setFilteredCourses(userCourses);
+      setFilteredCourses(allCourses);
     }
-  }, [searchTerm, allCourses, subscribedCourseIds]);
+  }, [searchTerm, allCourses]);
 
   if (!isAuthenticated) {
     return (
@@ -32,8 +32,9 @@ const TestDetail = () => {
         
         setTest(testResponse.data);
 
-        const questionsResponse = await api.get(`questions/?test_id=${testId}`);
-        const questions = questionsResponse.data.results || questionsResponse.data;
+        // Вопросы и варианты приходят одним закэшированным ответом теста
+        // (без признаков правильных ответов)
+        const questions = testResponse.data.questions;
         
         if (!Array.isArray(questions)) {
           throw new Error('Questions data is not an array');
@@ -43,8 +44,7 @@ const TestDetail = () => {
 
         const optionsData = {};
         for (const question of questions) {
-          const optionsResponse = await api.get(`options/?question_id=${question.id}`);
-          optionsData[question.id] = optionsResponse.data.options || optionsResponse.data;
+          optionsData[question.id] = question.options;
         }
         setOptions(optionsData);
       } catch (err) {
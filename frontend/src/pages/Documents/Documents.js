@@ -10,7 +10,8 @@ import {
   TableRow,
   Paper,
   CircularProgress,
-  IconButton
+  IconButton,
+  Button
 } from '@mui/material';
 import DownloadIcon from '@mui/icons-material/Download'
 import { AuthContext } from '../../context/AuthContext';
@@ -19,14 +20,17 @@ import { getDocuments, downloadDocument } from '../../api/documents';
 const Documents = () => {
     const { isAuthenticated } = useContext(AuthContext);
     const [documents, setDocuments] = useState([]);
+    const [nextPage, setNextPage] = useState(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [error, setError] = useState(null);
 
     useEffect(() => {
         const fetchDocuments = async () => {
             try {
-                const response = await getDocuments();
-                setDocuments(response.data);
+                const page = await getDocuments();
+                setDocuments(page.results);
+                setNextPage(page.next);
                 setLoading(false);
             } catch (error) {
                 if (error.isAuthError){ return; }
@@ -45,6 +49,21 @@ const Documents = () => {
         
     }, [isAuthenticated]);
 
+    // Следующая страница подгружается по курсору только по запросу пользователя
+    const handleLoadMore = async () => {
+        try {
+            setLoadingMore(true);
+            const page = await getDocuments(nextPage);
+            setDocuments(prev => [...prev, ...page.results]);
+            setNextPage(page.next);
+        } catch (error) {
+            if (error.isAuthError){ return; }
+            setError('Ошибка при загрузке документов');
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleDownload = async (documentId, fileName) => {
         try {
           setError(null);
@@ -132,6 +151,14 @@ const Documents = () => {
               </TableBody>
             </Table>
           </TableContainer>
+
+          {nextPage && (
+            <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+              <Button variant="outlined" onClick={handleLoadMore} disabled={loadingMore}>
+                {loadingMore ? <CircularProgress size={24} /> : 'Показать ещё'}
+              </Button>
+            </Box>
+          )}
         </Box>
       );
     };
@@ -46,19 +46,8 @@ const Profile = () => {
       setLoadingCourses(true)
       const response = await getUserProgressCourses();
 
-      const data = response.data || [];
-      
-      if (user?.is_staff) {
-        const filteredData = data.filter(unit => {
-          return unit?.user?.id === user?.id;
-        });
-
-        setCourses(filteredData);
-
-      } else {
-        setCourses(data);
-
-      };
+      // Сервер возвращает только прогресс текущего пользователя
+      setCourses(response.data || []);
     } catch (error) {
       if (error.isAuthError){ return; }
       setError('Ошибка при загрузке курсов');